@@ -0,0 +1,211 @@
+import os
+import gc
+import json
+import time
+import random
+import argparse
+import platform
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import src.utils.config_parser as config_parser
+import src.utils.instrumentation as instrumentation
+from src.models.callLLM import GPT
+from src.models.stub_llm import StubLLM, serve_stub
+from src.models.language_registry import LanguageRegistry, discover_languages, language_args
+from src.utils.dataset_utils import DatasetUtils
+
+MODES = ("RPC", "COT", "LFM")
+
+
+class PeakRSS:
+    """Sample the resident set size in the background; peak_mb is the maximum seen inside the block."""
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while True:
+            self.peak_mb = max(self.peak_mb, instrumentation.current_rss_mb())
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self):
+        self.peak_mb = instrumentation.current_rss_mb()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, instrumentation.current_rss_mb())
+        return False
+
+
+def scale_corpus(base_path, language, scale, out_dir):
+    """
+    Write a synthetic corpus with scale copies of every sentence pair and lexicon entry.
+
+    Copy i > 0 of an entry gets a numbered suffix on both sides, so keys stay unique
+    and the datastore, lexicon trie and FAISS indexes grow by the same factor.
+
+    Returns:
+        tuple: (base path, language name) of the corpus to load.
+    """
+    if scale <= 1:
+        return base_path, language
+    name = f"{language}_x{scale}"
+    sentences_path = os.path.join(out_dir, f"{name}_sentences.json")
+    lexicon_path = os.path.join(out_dir, f"{name}_lexicon.json")
+    if os.path.exists(sentences_path) and os.path.exists(lexicon_path):
+        return out_dir, name
+
+    sentences = DatasetUtils._load_json(os.path.join(base_path, f"{language}_sentences.json"))
+    lexicon = DatasetUtils._load_json(os.path.join(base_path, f"{language}_lexicon.json"))
+    scaled_sentences, scaled_lexicon = dict(sentences), dict(lexicon)
+    for i in range(1, scale):
+        scaled_sentences.update({f"{amis} ({i})": f"{chinese}（{i}）" for amis, chinese in sentences.items()})
+        scaled_lexicon.update({f"{amis}-{i}": [f"{gloss}{i}" for gloss in glosses] for amis, glosses in lexicon.items()})
+
+    os.makedirs(out_dir, exist_ok=True)
+    with open(sentences_path, "w", encoding="utf-8") as f:
+        json.dump(scaled_sentences, f, ensure_ascii=False, indent=4)
+    with open(lexicon_path, "w", encoding="utf-8") as f:
+        json.dump(scaled_lexicon, f, ensure_ascii=False, indent=4)
+    return out_dir, name
+
+
+def run_mode(translator, sentences, mode, workers=1):
+    """
+    Translate sentences in one mode (or ALL) and measure throughput, latency and LLM usage.
+
+    Each sentence goes through the per-request path (retrieval included). One warm-up
+    sentence runs first so lazy loads and LFM's in-context examples are not timed.
+    """
+    modes = list(MODES) if mode == "ALL" else [mode]
+    translator.translate_modes(sentences[0], modes)
+    instrumentation.reset()
+
+    def translate_one(sentence):
+        start = time.perf_counter()
+        translator.translate_modes(sentence, modes)
+        return time.perf_counter() - start
+
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            latencies = list(executor.map(translate_one, sentences))
+        wall = time.perf_counter() - start
+
+    snapshot = instrumentation.snapshot()["modes"]
+    stage_seconds, counters = {}, {}
+    for entry in snapshot.values():
+        for stage, stats in entry["stages"].items():
+            stage_seconds[stage] = stage_seconds.get(stage, 0.0) + stats["total_s"]
+        for name, value in entry["counters"].items():
+            if not name.endswith("_rate"):
+                counters[name] = counters.get(name, 0) + value
+
+    latencies_ms = np.array(latencies) * 1000
+    count = len(sentences)
+    return {
+        "mode": mode,
+        "sentences": count,
+        "sentences_per_s": round(count / wall, 3),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 2),
+        "mean_ms": round(float(latencies_ms.mean()), 2),
+        "peak_rss_mb": round(rss.peak_mb, 1),
+        "llm_calls_per_sentence": round(counters.get("llm_calls", 0) / count, 3),
+        "prompt_tokens_per_sentence": round(counters.get("prompt_tokens", 0) / count, 1),
+        "stage_ms_per_sentence": {stage: round(seconds / count * 1000, 3) for stage, seconds in sorted(stage_seconds.items())},
+    }
+
+
+def compare(runs, baseline_path):
+    """Print throughput and retrieval/prompt stage changes against a stored benchmark file."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {(row["language"], row["scale"], row["mode"]): row for row in json.load(f)["runs"]}
+    print(f"Compared with {baseline_path}:")
+    for row in runs:
+        old = baseline.get((row["language"], row["scale"], row["mode"]))
+        if old is None:
+            continue
+        changes = [f"sentences/s {old['sentences_per_s']} -> {row['sentences_per_s']}"]
+        for stage in ("retrieval", "prompt"):
+            before, after = old["stage_ms_per_sentence"].get(stage), row["stage_ms_per_sentence"].get(stage)
+            if before and after:
+                changes.append(f"{stage} {before}ms -> {after}ms ({(after / before - 1) * 100:+.1f}%)")
+        print(f"  {row['language']} x{row['scale']} {row['mode']}: " + ", ".join(changes))
+
+
+# Benchmark: python -m src.benchmark [--languages ...] [--modes RPC COT LFM] [--scales 1 4] [--stub echo|server]
+if __name__ == "__main__":
+    config_defaults = config_parser.get_combined_config()
+    parser = config_parser.build_parser(config_defaults, "Throughput and latency of each translation mode with a stub LLM.")
+    parser.add_argument("--languages", type=str, nargs="+", default=None, help="Languages to run (default: every corpus under --base_path).")
+    parser.add_argument("--modes", type=str, nargs="+", default=list(MODES), choices=[*MODES, "ALL"], help="Translation modes to run.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1], help="Synthetic scale-up factors of each corpus.")
+    parser.add_argument("--bench_sentences", type=int, default=50, help="Sentences translated per run.")
+    parser.add_argument("--stub", type=str, default="echo", choices=["echo", "server"], help="In-process echo LLM, or GPT against a local OpenAI-compatible stub server.")
+    parser.add_argument("--bench_output", type=str, default=None, help="Result file (default: <batch_result_path>/benchmark/bench_<time>.json).")
+    parser.add_argument("--baseline", type=str, default=None, help="Earlier result file to compare against.")
+    args = parser.parse_args()
+
+    # 只量測管線本身：關閉快取與 mistake bank
+    args.emb_cache_size = 0
+    args.retrieval_cache_size = 0
+    args.llm_cache_path = ""
+    args.use_mistake_bank = False
+    instrumentation.enable()
+
+    latency = args.stub_latency_ms / 1000
+    if args.stub == "server":
+        stub_server, base_url = serve_stub(latency=latency)
+        llm = GPT("stub", args.gpt_model, None, base_url=base_url, max_concurrency=args.gpt_max_concurrency, max_retries=0)
+    else:
+        llm = StubLLM(args.gpt_model, latency, args.gpt_max_concurrency)
+
+    bench_dir = os.path.join(args.batch_result_path, "benchmark")
+    languages = args.languages or discover_languages(args.base_path)
+    rng = random.Random(args.seed if args.seed is not None else 0)
+
+    runs = []
+    for language in languages:
+        corpus = list(DatasetUtils._load_json(os.path.join(args.base_path, f"{language}_sentences.json"), invert=True))
+        sentences = rng.sample(corpus, min(args.bench_sentences, len(corpus)))
+        for scale in args.scales:
+            base_path, name = scale_corpus(args.base_path, language, scale, os.path.join(bench_dir, "data"))
+            corpus_args = language_args(argparse.Namespace(**{**vars(args), "base_path": base_path}), name)
+            translator = LanguageRegistry._build_translator(corpus_args, llm)
+            for mode in args.modes:
+                row = {"language": language, "scale": scale,
+                       "datastore_sentences": len(translator.all_ch2amis), "lexicon_entries": len(translator.knn.lexicon),
+                       **run_mode(translator, sentences, mode, args.batch_workers)}
+                runs.append(row)
+                print(f"{language} x{scale} {mode}: {row['sentences_per_s']} sentences/s, p50 {row['p50_ms']}ms, p95 {row['p95_ms']}ms, "
+                      f"peak RSS {row['peak_rss_mb']}MB, {row['llm_calls_per_sentence']} LLM calls/sentence")
+            del translator
+            gc.collect()
+
+    output = args.bench_output or os.path.join(bench_dir, f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    result = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count()},
+        "settings": {"stub": args.stub, "stub_latency_ms": args.stub_latency_ms, "emb_model": args.emb_model, "Knn_k": args.Knn_k,
+                     "findlexicon": str(args.findlexicon), "workers": args.batch_workers, "sentence_index": args.sentence_index,
+                     "lexicon_index": args.lexicon_index, "bench_sentences": args.bench_sentences, "seed": args.seed},
+        "runs": runs,
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=4)
+    print("Benchmark saved to", output)
+
+    if args.baseline:
+        compare(runs, args.baseline)
+    if args.stub == "server":
+        stub_server.shutdown()
@@ -2,12 +2,15 @@ import os
 import re
 import json
 import random
+import argparse
 import warnings
-from nltk.translate.bleu_score import sentence_bleu
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import src.utils.config_parser as config_parser
 from src.models.translation import Ch2AmisTranslator
 from src.utils.dataset_utils import DatasetUtils
-from src.models.embedding import EmbeddingModel
+from src.models.embedding import get_embedding_model
+from src.utils.metrics import sentence_bleu_scores, corpus_scores
+import src.utils.instrumentation as instrumentation
 from tqdm import tqdm
 
 # 忽略所有 FutureWarning
@@ -19,12 +22,20 @@ class BatchEvaluator:
         self.language = args.language
         print("Translating to:", self.language)
         
-        self.all_ch2amis = DatasetUtils(args.emb_model)._load_json(args.sentences_path, invert=True)
+        self.all_ch2amis = DatasetUtils._load_json(args.sentences_path, invert=True)
         self.test_num = args.batch_test_num 
+        self.rng = random.Random(args.seed)
         self.mode = args.translation_mode
         self.batch_result_path = args.batch_result_path
-        self.version = self.create_result_foder(self.batch_result_path)
+        self.workers = max(1, args.batch_workers)
+        if args.resume:
+            self.version = self.find_result_folder(self.batch_result_path, args.resume)
+        else:
+            self.version = self.create_result_foder(self.batch_result_path)
         self.args = args
+        self.data_utils = DatasetUtils(args.emb_model, args.compact_storage, **config_parser.embedding_options(args))
+        self._translator = None
+        self._translator_embeddings = None
         
         
     def create_result_foder(self, result_path):
@@ -38,6 +49,19 @@ class BatchEvaluator:
         os.makedirs(next_folder)
         return next_folder
 
+    def find_result_folder(self, result_path, resume):
+        # resume 為 "latest" 時取編號最大的資料夾，否則視為資料夾路徑
+        if resume != "latest":
+            if not os.path.isdir(resume):
+                raise FileNotFoundError(f"Result folder {resume} not found.")
+            return resume
+        folder_index = 1
+        while os.path.exists(os.path.join(result_path, f"{self.language}_v{folder_index}")):
+            folder_index += 1
+        if folder_index == 1:
+            raise FileNotFoundError(f"No {self.language}_v* result folder to resume in {result_path}.")
+        return os.path.join(result_path, f"{self.language}_v{folder_index - 1}")
+
     def save_file(self, file_path, data):
         with open(file_path, 'w', encoding='utf-8') as file:
             file.write(data)
@@ -47,70 +71,279 @@ class BatchEvaluator:
         if test_num is None:
             test_num = self.test_num
         
-        test_datastore = dict(self.all_ch2amis)
+        candidates = self.test_candidates()
+        if test_num > len(candidates):
+            raise ValueError(f"Cannot draw {test_num} test sentences: only {len(candidates)} have at least 4 words.")
         
-        test_data = {}
-        with tqdm(range(test_num), desc="Creating test data") as pbar:
-            for _ in pbar:
-                while True:
-                    temp = random.choice(list(test_datastore.keys()))
-                    
-                    # 如果去標點後的amis句子不足4個單詞，BLEU-4會是0，所以要避免這種情況
-                    if len(re.findall(r"[\w]+", test_datastore[temp])) >= 4:
-                        test_data[temp] = test_datastore[temp]
-                        del test_datastore[temp]
-                        break
+        # 以 seed 固定的亂數抽樣，不放回
+        test_keys = self.rng.sample(candidates, test_num)
+        test_data = {key: self.all_ch2amis[key] for key in test_keys}
+        test_datastore = {key: value for key, value in self.all_ch2amis.items() if key not in test_data}
         
+        self.save_split(test_data, test_datastore)
+        return test_data, test_datastore
+
+    def test_candidates(self):
+        # 如果去標點後的amis句子不足4個單詞，BLEU-4會是0，所以要避免這種情況
+        return [key for key, value in self.all_ch2amis.items() if len(re.findall(r"[\w]+", value)) >= 4]
+
+    def save_split(self, test_data, test_datastore):
         # Save the test data
         self.save_file(os.path.join(self.version, "test_data.json"), json.dumps(test_data, ensure_ascii=False, indent=4))
         self.save_file(os.path.join(self.version, "test_datastore.json"), json.dumps(test_datastore, ensure_ascii=False, indent=4))
-        
+
+    def load_test_data(self):
+        # Reuse the split saved in the result folder when resuming
+        test_data = DatasetUtils._load_json(os.path.join(self.version, "test_data.json"))
+        test_datastore = DatasetUtils._load_json(os.path.join(self.version, "test_datastore.json"))
+        print(f"Resuming {self.version}: {len(test_data)} test sentences, {len(test_datastore)} datastore sentences.")
         return test_data, test_datastore
 
+    @staticmethod
+    def load_checkpoint(checkpoint_path):
+        """
+        Load finished evaluations from a JSONL checkpoint.
+
+        A line cut off by a crash is dropped and the file is rewritten without it,
+        so new results can be appended safely.
+
+        Returns:
+            dict: input_sentence -> evaluation.
+        """
+        finished = {}
+        if not os.path.exists(checkpoint_path):
+            return finished
+        damaged = False
+        with open(checkpoint_path, 'r', encoding='utf-8') as file:
+            content = file.read()
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            try:
+                evaluation = json.loads(line)
+            except json.JSONDecodeError:
+                damaged = True
+                continue
+            finished[evaluation["input_sentence"]] = evaluation
+        if damaged or (content and not content.endswith("\n")):
+            with open(checkpoint_path, 'w', encoding='utf-8') as file:
+                file.writelines(json.dumps(evaluation, ensure_ascii=False) + "\n" for evaluation in finished.values())
+        return finished
+
+    @staticmethod
+    def score(input_sentence, ground_truth, translation):
+        evaluation = {}
+        evaluation["input_sentence"] = input_sentence
+        evaluation["ground_truth"] = ground_truth
+        evaluation["translation"] = translation
+        # BLEU1-4 in one pass (same values as nltk sentence_bleu)
+        evaluation.update(sentence_bleu_scores(ground_truth, translation))
+        return evaluation
+
+    def evaluate_sentence(self, translator, input_sentence, ground_truth, modes, examples=None):
+        # 多個模式共用 KNN 檢索與 COT 結果
+        translations = translator.translate_modes(input_sentence, modes, examples)
+        return {mode: self.score(input_sentence, ground_truth, translations[mode]) for mode in modes}
+
+    def get_translator(self, test_datastore_embeddings):
+        # Reuse one translator (and its KNN indexes) across modes for the same datastore
+        if self._translator is None or self._translator_embeddings is not test_datastore_embeddings:
+            # 批次評估的 mistake bank 只涵蓋這次切出的 datastore，存在結果資料夾中
+            args = argparse.Namespace(**vars(self.args))
+            args.mistake_bank_path = os.path.join(self.version, "mistake_bank.json")
+            self._translator = Ch2AmisTranslator(args, test_datastore_embeddings)
+            self._translator_embeddings = test_datastore_embeddings
+        return self._translator
+
     def evaluate(self, test_data, test_datastore_embeddings, mode = None):
-        
-        print("Evaluating test data version:", self.version)
-        
         if mode is None:
             mode = self.mode
-        
-        print("Translation mode:", mode)
+        return self.evaluate_modes(test_data, test_datastore_embeddings, [mode])[mode]
+
+    def evaluate_modes(self, test_data, test_datastore_embeddings, modes):
+        """
+        Evaluate the test data in one or more modes with a single pass over the sentences.
+
+        Each sentence is translated in all of its unfinished modes at once, so retrieval
+        runs once per sentence and LFM reuses the COT answer. Every mode keeps its own
+        JSONL checkpoint and final <mode>_evaluation_result.json.
+
+        Returns:
+            dict: mode -> result list (evaluations followed by the BLEU averages).
+        """
+        print("Evaluating test data version:", self.version)
+        print("Translation mode:", ", ".join(modes))
         
         # Initialize the translator
-        translator = Ch2AmisTranslator(self.args, test_datastore_embeddings)
+        translator = self.get_translator(test_datastore_embeddings)
+        instrumentation.reset()
+        
+        # Evaluations already in the checkpoints are skipped; new ones are appended as they finish
+        checkpoint_paths = {mode: os.path.join(self.version, f"{mode}_evaluation_result.jsonl") for mode in modes}
+        finished = {mode: self.load_checkpoint(checkpoint_paths[mode]) for mode in modes}
+        pending = {key: [mode for mode in modes if key not in finished[mode]] for key in test_data}
+        pending = {key: key_modes for key, key_modes in pending.items() if key_modes}
+        done = len(test_data) - len(pending)
+        if done:
+            print(f"Resuming from checkpoint: {done} done, {len(pending)} remaining.")
+        
+        # Retrieve the examples of every pending sentence in one batch
+        prefetched = translator.prefetch_examples(pending.keys()) if pending else {}
         
         # Evaluate the test data
-        result = []
-        avg_bleu = [0, 0, 0, 0]
-        for key in tqdm(test_data, desc="Evaluating test data"):
-            evaluation = {}
-            evaluation["input_sentence"] = key
-            evaluation["ground_truth"] = test_data[key]
-            evaluation["translation"] = translator.translate(key, mode)
-            evaluation["BLEU1"] = sentence_bleu([evaluation["ground_truth"].split()], evaluation["translation"].split(), weights=(1, 0, 0, 0))
-            evaluation["BLEU2"] = sentence_bleu([evaluation["ground_truth"].split()], evaluation["translation"].split(), weights=(0.5, 0.5, 0, 0))
-            evaluation["BLEU3"] = sentence_bleu([evaluation["ground_truth"].split()], evaluation["translation"].split(), weights=(0.33, 0.33, 0.33, 0))
-            evaluation["BLEU4"] = sentence_bleu([evaluation["ground_truth"].split()], evaluation["translation"].split(), weights=(0.25, 0.25, 0.25, 0.25))
-            result.append(evaluation)
-            avg_bleu[0] += evaluation["BLEU1"]
-            avg_bleu[1] += evaluation["BLEU2"]
-            avg_bleu[2] += evaluation["BLEU3"]
-            avg_bleu[3] += evaluation["BLEU4"]
-        
-        avg_bleu = [round(i / len(result), 4) for i in avg_bleu]
-        
-        result.append({"avg_BLEU1": avg_bleu[0], "avg_BLEU2": avg_bleu[1], "avg_BLEU3": avg_bleu[2], "avg_BLEU4": avg_bleu[3]})
-        
-        # Save the evaluation result
-        self.save_file(os.path.join(self.version, f"{mode}_evaluation_result.json"), json.dumps(result, ensure_ascii=False, indent=4))
-        
-        return result
+        failed = []
+        checkpoints = {mode: open(checkpoint_paths[mode], 'a', encoding='utf-8') for mode in modes}
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = {executor.submit(self.evaluate_sentence, translator, key, test_data[key], key_modes, prefetched[key]): key
+                           for key, key_modes in pending.items()}
+                for future in tqdm(as_completed(futures), total=len(futures), desc="Evaluating test data"):
+                    try:
+                        evaluations = future.result()
+                    except Exception as error:
+                        print(f"[ERROR] Failed to evaluate {futures[future]}: {error}")
+                        failed.append(futures[future])
+                        continue
+                    for mode, evaluation in evaluations.items():
+                        checkpoints[mode].write(json.dumps(evaluation, ensure_ascii=False) + "\n")
+                        checkpoints[mode].flush()
+                        finished[mode][evaluation["input_sentence"]] = evaluation
+        finally:
+            for checkpoint in checkpoints.values():
+                checkpoint.close()
+        
+        if translator.mistake_bank is not None:
+            translator.mistake_bank.save()
+        
+        if instrumentation.enabled():
+            self.save_instrumentation(translator, len(pending))
+        
+        if failed:
+            raise RuntimeError(f"{len(failed)} sentences failed; rerun with --resume {self.version} to retry them.")
+        
+        results = {}
+        for mode in modes:
+            result = []
+            avg_bleu = [0, 0, 0, 0]
+            for key in test_data:
+                evaluation = finished[mode][key]
+                result.append(evaluation)
+                avg_bleu[0] += evaluation["BLEU1"]
+                avg_bleu[1] += evaluation["BLEU2"]
+                avg_bleu[2] += evaluation["BLEU3"]
+                avg_bleu[3] += evaluation["BLEU4"]
+            
+            avg_bleu = [round(i / len(result), 4) for i in avg_bleu]
+            
+            summary = {"avg_BLEU1": avg_bleu[0], "avg_BLEU2": avg_bleu[1], "avg_BLEU3": avg_bleu[2], "avg_BLEU4": avg_bleu[3]}
+            summary.update(corpus_scores([row["ground_truth"] for row in result], [row["translation"] for row in result]))
+            result.append(summary)
+            
+            # Save the evaluation result
+            self.save_file(os.path.join(self.version, f"{mode}_evaluation_result.json"), json.dumps(result, ensure_ascii=False, indent=4))
+            results[mode] = result
+        
+        return results
+
+    def save_instrumentation(self, translator, sentences):
+        embedding_cache = translator.knn.embedding_model.cache
+        retrieval_cache = translator.knn.retrieval_cache
+        llm_cache = getattr(translator.llm, "cache", None)
+        path = instrumentation.save(
+            os.path.join(self.version, "instrumentation.json"),
+            sentences=sentences,
+            caches={
+                "embedding": embedding_cache.stats() if embedding_cache is not None else None,
+                "retrieval": retrieval_cache.stats() if retrieval_cache is not None else None,
+                "llm": llm_cache.stats() if llm_cache is not None else None,
+            },
+        )
+        print("Instrumentation saved to", path)
+
+    def kfold_splits(self, folds, root):
+        """
+        Test keys of every fold, written to kfold_splits.json in the run folder before
+        the first fold runs and reloaded from there on resume.
+
+        Without a seed every run shuffles differently, so a resumed run must never
+        re-derive splits. Folds saved by a run without kfold_splits.json keep their
+        test data; the remaining candidates are divided among the missing folds.
+
+        Returns:
+            list: One list of test keys per fold; the lists are disjoint.
+        """
+        splits_path = os.path.join(root, "kfold_splits.json")
+        if os.path.exists(splits_path):
+            with open(splits_path, 'r', encoding='utf-8') as file:
+                splits = json.load(file)
+            if len(splits) != folds:
+                raise ValueError(f"{splits_path} holds {len(splits)} folds, but --kfold is {folds}.")
+            return splits
+        
+        splits = [None] * folds
+        for fold in range(folds):
+            saved = os.path.join(root, f"fold_{fold + 1}", "test_data.json")
+            if os.path.exists(saved):
+                splits[fold] = list(DatasetUtils._load_json(saved))
+        taken = {key for split in splits if split for key in split}
+        candidates = [key for key in self.test_candidates() if key not in taken]
+        self.rng.shuffle(candidates)
+        missing = [fold for fold in range(folds) if splits[fold] is None]
+        for i, fold in enumerate(missing):
+            splits[fold] = candidates[i::len(missing)]
+        self.save_file(splits_path, json.dumps(splits, ensure_ascii=False, indent=4))
+        return splits
+
+    def run_kfold(self, folds, sentence_embeddings, modes):
+        """
+        K-fold cross-validation over the sentences eligible as test data.
+
+        Every fold is saved to fold_<i> inside the run folder and evaluated against a
+        slice of the one loaded sentence embedding matrix. Sentences with fewer than
+        4 words always stay in the datastore. All splits are fixed up front (see
+        kfold_splits), so a resumed run evaluates the same disjoint folds.
+
+        Returns:
+            dict: mode -> {"folds": [avg row per fold], "mean": {...}, "std": {...}}.
+        """
+        root = self.version
+        splits = self.kfold_splits(folds, root)
+        fold_results = {mode: [] for mode in modes}
+        for fold in range(folds):
+            self.version = os.path.join(root, f"fold_{fold + 1}")
+            print("-" * 100)
+            print(f"Fold {fold + 1}/{folds}")
+            if os.path.exists(os.path.join(self.version, "test_data.json")):
+                test_data, test_datastore = self.load_test_data()
+            else:
+                os.makedirs(self.version, exist_ok=True)
+                test_keys = splits[fold]
+                test_data = {key: self.all_ch2amis[key] for key in test_keys}
+                test_datastore = {key: value for key, value in self.all_ch2amis.items() if key not in test_data}
+                self.save_split(test_data, test_datastore)
+            
+            results = self.evaluate_modes(test_data, self.data_utils._subset_embeddings(sentence_embeddings, test_datastore), modes)
+            for mode in modes:
+                fold_results[mode].append(results[mode][-1])
+        self.version = root
+        
+        summary = {}
+        for mode, rows in fold_results.items():
+            summary[mode] = {"folds": rows, "mean": {}, "std": {}}
+            for metric in rows[0]:
+                values = [row[metric] for row in rows]
+                mean = sum(values) / len(values)
+                summary[mode]["mean"][metric] = round(mean, 4)
+                summary[mode]["std"][metric] = round((sum((v - mean) ** 2 for v in values) / len(values)) ** 0.5, 4)
+        self.save_file(os.path.join(root, "kfold_summary.json"), json.dumps(summary, ensure_ascii=False, indent=4))
+        return summary
 
 # Test
 if __name__ == "__main__":
     
     config_defaults = config_parser.get_combined_config()
     args = config_parser.parse_arguments(config_defaults)
+    instrumentation.enable(args.instrument)
     
     # 如果沒有 --batch 並且 input_sentence 沒有提供，則報錯
     if not args.batch and args.input_sentence is None:
@@ -119,8 +352,8 @@ if __name__ == "__main__":
     if not args.batch:
         
         # Initialize the translator
-        data_utils = DatasetUtils(args.emb_model)
-        all_ch2amis = data_utils._load_json(args.sentences_path, invert=True)
+        data_utils = DatasetUtils(args.emb_model, args.compact_storage, **config_parser.embedding_options(args))
+        all_ch2amis = DatasetUtils._load_json(args.sentences_path, invert=True)
         sentence_embeddings = data_utils._load_embeddings(args.sentence_embedding_path, all_ch2amis)
         
         translator = Ch2AmisTranslator(args, sentence_embeddings)
@@ -133,30 +366,51 @@ if __name__ == "__main__":
         print("GPT model:", args.gpt_model)
         result  = translator.translate(args.input_sentence, args.translation_mode)
         print("Translate:", result)
+        if translator.mistake_bank is not None:
+            translator.mistake_bank.save()
+        if translator.knn.embedding_model.cache is not None:
+            print("Embedding cache:", translator.knn.embedding_model.cache.stats())
+        if translator.knn.retrieval_cache is not None:
+            print("Retrieval cache:", translator.knn.retrieval_cache.stats())
+        if instrumentation.enabled():
+            print("Instrumentation:", json.dumps(instrumentation.snapshot(), ensure_ascii=False, indent=4))
         
     else:
         evaluator = BatchEvaluator(args)
+        modes = ["RPC", "COT", "LFM"] if args.translation_mode == "ALL" else [args.translation_mode]
         
-        # Create test data
-        test_data, test_datastore = evaluator.create_test_data(args.batch_test_num)
-        test_datastore_embeddings = EmbeddingModel(args.emb_model).get_multiple_embeddings(list(test_datastore.keys()))
-        print(f"Embeddings generated successfully. Number of entries: {len(test_datastore_embeddings)}.")
+        # All splits are sliced from the precomputed sentence embeddings
+        sentence_embeddings = evaluator.data_utils._load_embeddings(args.sentence_embedding_path, evaluator.all_ch2amis)
         
-        if args.translation_mode == "ALL":
-            for mode in ["RPC", "COT", "LFM"]:
+        if args.kfold > 1:
+            summary = evaluator.run_kfold(args.kfold, sentence_embeddings, modes)
+            for mode in modes:
+                print("-" * 100)
+                print(f"{args.kfold}-fold result for mode {mode}:")
+                for metric, mean in summary[mode]["mean"].items():
+                    print(f"{metric}: {mean} ± {summary[mode]['std'][metric]}")
+        else:
+            # Create test data (or reload the split of the run being resumed)
+            if args.resume:
+                test_data, test_datastore = evaluator.load_test_data()
+            else:
+                test_data, test_datastore = evaluator.create_test_data(args.batch_test_num)
+            test_datastore_embeddings = evaluator.data_utils._subset_embeddings(sentence_embeddings, test_datastore)
+            print(f"Datastore embeddings ready. Number of entries: {len(test_datastore_embeddings)}.")
+            
+            print("-" * 100)
+            results = evaluator.evaluate_modes(test_data, test_datastore_embeddings, modes)
+            for mode, result in results.items():
                 print("-" * 100)
-                result = evaluator.evaluate(test_data, test_datastore_embeddings, mode)
                 print(f"Evaluation result for mode {mode}:")
                 print("avg_BLEU1:", result[-1]["avg_BLEU1"])
                 print("avg_BLEU2:", result[-1]["avg_BLEU2"])
                 print("avg_BLEU3:", result[-1]["avg_BLEU3"])
                 print("avg_BLEU4:", result[-1]["avg_BLEU4"])
-        else:
-            print("-" * 100)
-            result = evaluator.evaluate(test_data, test_datastore_embeddings, args.translation_mode)
-            print("Evaluation result:")
-            print("avg_BLEU1:", result[-1]["avg_BLEU1"])
-            print("avg_BLEU2:", result[-1]["avg_BLEU2"])
-            print("avg_BLEU3:", result[-1]["avg_BLEU3"])
-            print("avg_BLEU4:", result[-1]["avg_BLEU4"])
-            print("Batch evaluation completed")
+                print("corpus_BLEU4:", result[-1]["corpus_BLEU4"])
+                print("corpus_chrF++:", result[-1]["corpus_chrF++"])
+        print("Batch evaluation completed")
+        
+        embedding_cache = get_embedding_model(args.emb_model).cache
+        if embedding_cache is not None:
+            print("Embedding cache:", embedding_cache.stats())
@@ -1,19 +1,104 @@
-import openai
+import time
+import random
+import threading
 from typing import Union
+from concurrent.futures import ThreadPoolExecutor
 import src.utils.config_parser as config_parser
+from src.models.llm_cache import ResponseCache, build_response_cache
+from src.models.rate_limit import TokenBucket
+from src.models.stub_llm import StubLLM
+import src.utils.instrumentation as instrumentation
+
+
+def retryable_errors():
+    # 可重試的錯誤：429、5xx、連線/逾時（openai 在第一次實際呼叫 API 時才 import）
+    import openai
+    return (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError, openai.APITimeoutError)
 
 class GPT():
-    def __init__(self, api_key: str, model):
+    def __init__(self, api_key: str, model, cache: ResponseCache = None, base_url: str = None,
+                 max_concurrency: int = 1, requests_per_minute: int = 0, tokens_per_minute: int = 0,
+                 max_retries: int = 5, backoff_base: float = 1.0, backoff_max: float = 60.0):
         
-        # Check if API key is loaded
-        if not api_key:
+        # Check if API key is loaded (replay mode never contacts the API)
+        if not api_key and not (cache is not None and cache.mode == "replay"):
             raise ValueError("OPENAI_API_KEY not found in the environment variables.")
 
-        # Initialize the OpenAI API client
-        openai.api_key = api_key
+        # Per-instance OpenAI API client (base_url allows OpenAI-compatible local servers),
+        # created on the first request so fully cached runs never import openai
+        self.api_key = api_key
+        self.base_url = base_url
+        self._client = None
+        self._client_lock = threading.Lock()
         self.model = model
+        self.cache = cache
+        
+        # Concurrency, rate limits and retries
+        self.max_concurrency = max(1, max_concurrency)
+        self._in_flight = threading.BoundedSemaphore(self.max_concurrency)
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
         print(f"Initalized default OpenAI GPT model: {model}")
 
+    @property
+    def client(self):
+        with self._client_lock:
+            if self._client is None:
+                import openai
+                self._client = openai.OpenAI(api_key=self.api_key or "replay-only", base_url=self.base_url or None, max_retries=0)
+        return self._client
+
+    @staticmethod
+    def _estimate_tokens(messages, max_output_tokens):
+        # 粗估：中文約一字一 token，另加輸出上限
+        return sum(len(message["content"]) for message in messages) + max_output_tokens
+
+    def _retry_delay(self, attempt, error):
+        retry_after = None
+        response = getattr(error, "response", None)
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        delay = min(self.backoff_base * (2 ** attempt), self.backoff_max)
+        return delay + random.uniform(0, delay * 0.1)
+
+    def _create(self, model, messages, max_output_tokens, temperature):
+        tokens = self._estimate_tokens(messages, max_output_tokens)
+        retryable = retryable_errors()
+        attempt = 0
+        while True:
+            # 每次嘗試（含重試）都要從兩個 bucket 取用，服務限流時重試也受限速
+            self.request_bucket.acquire(1)
+            self.token_bucket.acquire(tokens)
+            try:
+                with self._in_flight, instrumentation.timed("llm"):
+                    response = self.client.chat.completions.create(
+                        model = model,
+                        messages = messages,
+                        max_completion_tokens=max_output_tokens,
+                        temperature = temperature
+                    )
+                instrumentation.count("llm_calls")
+                if response.usage is not None:
+                    instrumentation.count("prompt_tokens", response.usage.prompt_tokens or 0)
+                    instrumentation.count("completion_tokens", response.usage.completion_tokens or 0)
+                return response
+            except retryable as error:
+                instrumentation.count("llm_errors")
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._retry_delay(attempt, error)
+                print(f"[WARN] OpenAI request failed ({type(error).__name__}), retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+                time.sleep(delay)
+                attempt += 1
+
     # Define the GPT function
     def get_response(self, prompt: Union[str, list[dict[str, str]]], model: str = None, max_output_tokens: int = 512, temperature: float = 0):
         if not model or model == self.model:
@@ -21,15 +106,38 @@ class GPT():
         else:
             print(f"Requesting response from OpenAI GPT model: {model}")
         
-        response = openai.chat.completions.create(
-            model = model,
-            messages = prompt if type(prompt) == list else [{"role": "user", "content": prompt}],
-            max_completion_tokens=max_output_tokens,
-            temperature = temperature
-        ).choices[0].message.content.replace("Assistant:", "").strip()
+        messages = prompt if type(prompt) == list else [{"role": "user", "content": prompt}]
         
-        return response
+        if self.cache is not None:
+            cache_key = self.cache.make_key(model, messages, temperature, max_output_tokens)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                instrumentation.count("llm_cache_hits")
+                return cached
+            instrumentation.count("llm_cache_misses")
+            if self.cache.mode == "replay":
+                raise LookupError(f"LLM cache replay mode: no cached response for request {cache_key}.")
+        
+        response = self._create(model, messages, max_output_tokens, temperature).choices[0].message.content.replace("Assistant:", "").strip()
         
+        if self.cache is not None:
+            self.cache.put(cache_key, response)
+        
+        return response
+
+    # Concurrent version: responses are returned in prompt order
+    def get_responses(self, prompts: list, model: str = None, max_output_tokens: int = 512, temperature: float = 0):
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            return list(executor.map(lambda prompt: self.get_response(prompt, model, max_output_tokens, temperature), prompts))
+
+
+def build_llm(args):
+    """Build the LLM client from parsed arguments: GPT, or the offline stub with --stub_llm."""
+    if args.stub_llm:
+        return StubLLM(args.gpt_model, args.stub_latency_ms / 1000, args.gpt_max_concurrency)
+    return GPT(args.openai_api_key, args.gpt_model,
+               build_response_cache(args.llm_cache_path, args.llm_cache_mode, args.llm_cache_max_entries),
+               **config_parser.llm_options(args))
 
 
 # Test
@@ -39,7 +147,8 @@ if __name__ == "__main__":
     
     args = config_parser.get_combined_config()
     api_key = args["env"]["openai_api_key"]
-    gpt_model = GPT(api_key, args["gpt_model"])
+    cache = build_response_cache(args["llm_cache_path"], args["llm_cache_mode"], args["llm_cache_max_entries"])
+    gpt_model = GPT(api_key, args["gpt_model"], cache, **config_parser.llm_options(args))
     
     response = gpt_model.get_response(message, args["gpt_model"], args["gpt_max_output_tokens"], args["gpt_temperature"])
         
@@ -1,39 +1,384 @@
-import faiss
+import time
+import argparse
+import threading
+import warnings
 import numpy
-import torch
 from tqdm import tqdm
-from transformers import AutoTokenizer, AutoModel
+from src.models.embedding_cache import EmbeddingCache
+from src.models.index_factory import build_index
+import src.utils.instrumentation as instrumentation
+
+# Process-wide registry: one EmbeddingModel per model name, shared by every module.
+# torch / transformers are imported on the first forward pass, so runs served from
+# the embedding cache and stores never load them.
+_MODEL_REGISTRY = {}
+_REGISTRY_LOCK = threading.Lock()
+
+# torch: eager float32；int8: Linear 層動態量化；torchscript: 依序列長度 bucket 各 trace 一個圖
+BACKENDS = ("torch", "int8", "torchscript")
+DEFAULT_SEQ_BUCKETS = (16, 32, 64, 128, 256, 512)
+
+
+def get_embedding_model(model_name, **options):
+    """
+    Return the shared EmbeddingModel for model_name.
+
+    The model object is created once per process; the tokenizer and BERT weights
+    are only loaded on the first embedding call. Keyword options (see
+    EmbeddingModel.configure), when given, update the shared model's settings.
+    """
+    with _REGISTRY_LOCK:
+        if model_name not in _MODEL_REGISTRY:
+            _MODEL_REGISTRY[model_name] = EmbeddingModel(model_name)
+        embedding_model = _MODEL_REGISTRY[model_name]
+    embedding_model.configure(**options)
+    return embedding_model
+
 
 class EmbeddingModel:
-    def __init__(self, model_name):
-        # Setup the BERT model
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.model = AutoModel.from_pretrained(model_name)
+    def __init__(self, model_name, batch_size=32, num_threads=0, backend="torch", seq_buckets=DEFAULT_SEQ_BUCKETS):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.backend = "torch"
+        self.seq_buckets = tuple(DEFAULT_SEQ_BUCKETS)
+        self._tokenizer = None
+        self._model = None
+        self._traced = {}               # padded sequence length -> traced graph
+        self._load_lock = threading.Lock()
+        self._store_model = None
+        self.num_threads = 0
+        self.cache = None
+        self.configure(num_threads=num_threads, backend=backend, seq_buckets=seq_buckets)
+
+    @property
+    def cache_key(self):
+        # int8 的向量與 float 模型不同，快取分開存；torchscript 與 eager 數值相同
+        return f"{self.model_name}@int8" if self.backend == "int8" else self.model_name
+
+    @property
+    def store_model(self):
+        """
+        The model that embeds rows written to embedding stores: this one, or with the
+        int8 backend a float model of the same name (created on first use). Quantized
+        vectors only ever serve queries, so stores keep float vectors across backends.
+        """
+        if self.backend != "int8":
+            return self
+        with self._load_lock:
+            if self._store_model is None:
+                self._store_model = EmbeddingModel(self.model_name, self.batch_size, seq_buckets=self.seq_buckets)
+                self._store_model.cache = self.cache
+            return self._store_model
+
+    def configure(self, batch_size=None, num_threads=None, cache_size=None, cache_path=None, backend=None, seq_buckets=None):
+        """
+        Update inference settings.
+
+        Args:
+            batch_size (int): Sentences per forward pass.
+            num_threads (int): Torch CPU thread count (0 keeps torch's default).
+            cache_size (int): In-memory embedding cache entries; enables the cache when > 0.
+            cache_path (str): Optional SQLite file backing the cache across runs.
+            backend (str): torch, int8 or torchscript (see BACKENDS); a change reloads the model.
+            seq_buckets (list): Token lengths batches are grouped by; torchscript pads to them.
+        """
+        if batch_size:
+            self.batch_size = int(batch_size)
+        if backend and backend != self.backend:
+            if backend not in BACKENDS:
+                raise ValueError(f"Embedding backend {backend} not supported. Choose from {', '.join(BACKENDS)}.")
+            with self._load_lock:
+                self.backend = backend
+                self._model = None
+                self._traced = {}
+        if seq_buckets:
+            self.seq_buckets = tuple(sorted(int(length) for length in seq_buckets))
+        if num_threads:
+            self.num_threads = int(num_threads)
+            # torch 在 _load 才 import；模型已載入時才立即套用
+            if self._model is not None:
+                import torch
+                torch.set_num_threads(self.num_threads)
+        if cache_size:
+            if self.cache is None or self.cache.path != (cache_path or None):
+                self.cache = EmbeddingCache(int(cache_size), cache_path)
+            else:
+                self.cache.max_entries = int(cache_size)
+            if self._store_model is not None:
+                self._store_model.cache = self.cache
+
+    # Setup the BERT model (lazy, first use only)
+    def _load(self):
+        with self._load_lock:
+            if self._model is None:
+                from transformers import AutoTokenizer, AutoModel
+                if self.num_threads:
+                    import torch
+                    torch.set_num_threads(self.num_threads)
+                self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+                model = AutoModel.from_pretrained(self.model_name)
+                model.eval()
+                if self.backend == "int8":
+                    import torch
+                    with warnings.catch_warnings():
+                        warnings.simplefilter("ignore")
+                        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+                self._model = model
 
+    @property
+    def tokenizer(self):
+        if self._model is None:
+            self._load()
+        return self._tokenizer
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._load()
+        return self._model
 
     # 將句子轉換為嵌入向量
     def get_single_embedding(self, sentence):  # input type: str
-        with torch.no_grad(): # Disable gradient calculation
-            inputs = self.tokenizer(sentence, return_tensors='pt', truncation=True, padding=True)
-            output = self.model(**inputs)
-            embedding = output.last_hidden_state.mean(dim=1).cpu().numpy()[0]
-        return embedding  # return type: dict
+        if self.cache is not None:
+            embedding = self.cache.get(self.cache_key, sentence)
+            if embedding is not None:
+                instrumentation.count("embedding_cache_hits")
+                return embedding
+            instrumentation.count("embedding_cache_misses")
 
-    # 批量轉換
-    def get_multiple_embeddings(self, sentences):
-        embeddings = {}
-        for sentence in tqdm(sentences, desc="Loading datastore embeddings"):
-            embeddings[sentence] = self.get_single_embedding(sentence)
+        if self.backend != "torch":
+            embedding = self._encode([sentence])[0]
+        else:
+            instrumentation.count("embedded_sentences")
+            import torch
+            with instrumentation.timed("embedding"), torch.no_grad(): # Disable gradient calculation
+                inputs = self.tokenizer(sentence, return_tensors='pt', truncation=True, padding=True)
+                output = self.model(**inputs)
+                embedding = output.last_hidden_state.mean(dim=1).cpu().numpy()[0]
+
+        if self.cache is not None:
+            self.cache.put(self.cache_key, sentence, embedding)
+        return embedding  # return type: numpy.ndarray
+
+    # attention mask 加權平均，padding 位置不計入，與單句路徑結果一致
+    @staticmethod
+    def _mean_pooling(last_hidden_state, attention_mask):
+        mask = attention_mask.unsqueeze(-1).to(last_hidden_state.dtype)
+        summed = (last_hidden_state * mask).sum(dim=1)
+        counts = mask.sum(dim=1).clamp(min=1e-9)
+        return summed / counts
+
+    def encode(self, sentences, batch_size=None, desc=None):
+        """
+        Embed a list of sentences with batched forward passes.
+
+        Sentences are tokenized once, sorted by token length and padded per batch
+        so that each batch holds similarly sized inputs. Cached sentences skip the
+        model entirely.
+
+        Args:
+            sentences (list): The sentences to embed.
+            batch_size (int): Sentences per forward pass (defaults to self.batch_size).
+            desc (str): tqdm description; no progress bar when None.
+
+        Returns:
+            numpy.ndarray: A float32 matrix with one row per input sentence, in input order.
+        """
+        sentences = list(sentences)
+        if self.cache is None:
+            return self._encode(sentences, batch_size, desc)
+
+        cached = self.cache.get_many(self.cache_key, sentences)
+        missing = list(dict.fromkeys(s for s, vector in zip(sentences, cached) if vector is None))
+        instrumentation.count("embedding_cache_hits", sum(vector is not None for vector in cached))
+        instrumentation.count("embedding_cache_misses", len(missing))
+        if missing:
+            computed = self._encode(missing, batch_size, desc)
+            self.cache.put_many(self.cache_key, missing, computed)
+            computed = dict(zip(missing, computed))
+            cached = [computed[s] if vector is None else vector for s, vector in zip(sentences, cached)]
+        if not cached:
+            return self._encode(sentences, batch_size, desc)
+        return numpy.vstack(cached).astype(numpy.float32, copy=False)
+
+    def _bucket(self, length):
+        for bucket in self.seq_buckets:
+            if length <= bucket:
+                return bucket
+        return length
+
+    def _batches(self, lengths, batch_size):
+        # 依長度排序後分批，同一批不跨 bucket
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+        batches, batch, batch_bucket = [], [], None
+        for i in order:
+            bucket = self._bucket(lengths[i])
+            if batch and (len(batch) >= batch_size or bucket != batch_bucket):
+                batches.append((batch_bucket, batch))
+                batch = []
+            batch.append(i)
+            batch_bucket = bucket
+        if batch:
+            batches.append((batch_bucket, batch))
+        return batches
+
+    def _traced_graph(self, inputs):
+        import torch
+        length = inputs["input_ids"].shape[1]
+        graph = self._traced.get(length)
+        if graph is None:
+            model = self.model
+            with self._load_lock, warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                graph = self._traced.get(length)
+                if graph is None:
+                    graph = torch.jit.trace(model, (inputs["input_ids"], inputs["attention_mask"]), strict=False)
+                    self._traced[length] = graph
+        return graph
+
+    def _forward(self, inputs):
+        if self.backend == "torchscript":
+            output = self._traced_graph(inputs)(inputs["input_ids"], inputs["attention_mask"])
+            return output["last_hidden_state"] if isinstance(output, dict) else output[0]
+        return self.model(**inputs).last_hidden_state
+
+    def _encode(self, sentences, batch_size=None, desc=None):
+        batch_size = batch_size or self.batch_size
+        if not sentences:
+            return numpy.zeros((0, self.model.config.hidden_size), dtype=numpy.float32)
+
+        encoded = self.tokenizer(sentences, truncation=True)["input_ids"]
+        embeddings = numpy.empty((len(sentences), self.model.config.hidden_size), dtype=numpy.float32)
+
+        batches = self._batches([len(ids) for ids in encoded], batch_size)
+        if desc is not None:
+            batches = tqdm(batches, desc=desc)
+        instrumentation.count("embedded_sentences", len(sentences))
+        import torch
+        with instrumentation.timed("embedding"), torch.no_grad(): # Disable gradient calculation
+            for bucket, batch_idx in batches:
+                # torchscript 的圖依長度固定，補齊到 bucket；其他後端補到批內最長
+                padding = {"padding": "max_length", "max_length": bucket} if self.backend == "torchscript" else {}
+                inputs = self.tokenizer.pad({"input_ids": [encoded[i] for i in batch_idx]}, return_tensors='pt', **padding)
+                pooled = self._mean_pooling(self._forward(inputs), inputs["attention_mask"])
+                embeddings[batch_idx] = pooled.cpu().numpy()
         return embeddings
 
+    # 批量轉換
+    def get_multiple_embeddings(self, sentences, batch_size=None):
+        sentences = list(sentences)
+        matrix = self.encode(sentences, batch_size, desc="Loading datastore embeddings")
+        return {sentence: matrix[i] for i, sentence in enumerate(sentences)}
+
     # 將嵌入向量的list轉換為Faiss索引
     @staticmethod
-    def embeddings2faiss(embeddings): # input type: list
-        # 將嵌入向量轉換為Numpy數組
-        np_embeddings = numpy.vstack(embeddings)
-        #獲取嵌入維度並創建faiss索引
-        faiss_index = faiss.IndexFlatL2(len(np_embeddings[0]))
-        # 将数据添加到Faiss索引
-        faiss_index.add(np_embeddings)
-        return faiss_index
+    def embeddings2faiss(embeddings, index_type="flat", index_path=None, **index_params): # input type: list or 2-D matrix
+        # index_params 可含 model_name / fingerprint，決定已存的索引能否沿用（見 build_index）
+        # 將嵌入向量轉換為Numpy數組（已是矩陣時不再 vstack）
+        if isinstance(embeddings, numpy.ndarray) and embeddings.ndim == 2:
+            np_embeddings = numpy.ascontiguousarray(embeddings, dtype=numpy.float32)
+        else:
+            np_embeddings = numpy.vstack(embeddings)
+        # 依 index_type 建立 faiss 索引（flat / ivf / hnsw / ip，見 index_factory）
+        return build_index(np_embeddings, index_type, index_path, **index_params)
+
+
+def backend_report(model_name, matrix, keys, backends=("int8", "torchscript"), k=10, num_queries=200, seed=0,
+                   batch_size=32, seq_buckets=DEFAULT_SEQ_BUCKETS):
+    """
+    Compare embedding backends against the float model on one datastore.
+
+    Queries are datastore sentences embedded by each backend. Their nearest
+    neighbours in the stored (float) matrix, excluding the sentence itself, are
+    compared with those of the float model's query vectors.
+
+    Returns:
+        list: One dict per backend (the float baseline first) with batched throughput,
+            single-sentence latency (ms), cosine similarity to the float vectors and
+            top-1 / top-k neighbour agreement.
+    """
+    rng = numpy.random.default_rng(seed)
+    picks = rng.choice(len(keys), size=min(num_queries, len(keys)), replace=False)
+    queries = [keys[i] for i in picks]
+    k = min(k, len(keys) - 1)
+    index = build_index(matrix, "flat")
+
+    def neighbours(vectors):
+        _, found = index.search(numpy.ascontiguousarray(vectors, dtype=numpy.float32), k + 1)
+        return [[j for j in row if j != query][:k] for query, row in zip(picks, found)]
+
+    report, reference, truth = [], None, None
+    for backend in ("torch", *backends):
+        model = EmbeddingModel(model_name, batch_size, backend=backend, seq_buckets=seq_buckets)
+        model.encode(queries)   # 預熱：載入權重、trace 各長度的圖
+        start = time.perf_counter()
+        vectors = model.encode(queries)
+        batch_seconds = time.perf_counter() - start
+        singles = queries[:50]
+        start = time.perf_counter()
+        for query in singles:
+            model.get_single_embedding(query)
+        single_ms = (time.perf_counter() - start) / len(singles) * 1000
+
+        found = neighbours(vectors)
+        if reference is None:
+            reference, truth = vectors, found
+        cosine = (vectors * reference).sum(axis=1) / (numpy.linalg.norm(vectors, axis=1) * numpy.linalg.norm(reference, axis=1))
+        report.append({
+            "backend": backend,
+            "sentences_per_s": round(len(queries) / batch_seconds, 1),
+            "single_ms": round(single_ms, 3),
+            "cosine_mean": round(float(cosine.mean()), 6),
+            "cosine_min": round(float(cosine.min()), 6),
+            "top1_agreement": round(float(numpy.mean([t[:1] == f[:1] for t, f in zip(truth, found)])), 4),
+            f"top{k}_agreement": round(float(numpy.mean([len(set(t) & set(f)) / k for t, f in zip(truth, found)])), 4),
+        })
+    return report
+
+
+# Backend check: python -m src.models.embedding [--backends int8 torchscript] [--k 10] [--output report.json]
+if __name__ == "__main__":
+    import os
+    import json
+    import src.utils.config_parser as config_parser
+    from src.models.language_registry import discover_languages
+    from src.utils.embedding_store import EmbeddingStore, store_dir, store_exists
+
+    defaults = config_parser.load_config()
+    parser = argparse.ArgumentParser(description="Cosine drift and top-k neighbour agreement of embedding backends against the float model.")
+    parser.add_argument("--emb_model", type=str, default=defaults["emb_model"])
+    parser.add_argument("--base_path", type=str, default=defaults["base_path"])
+    parser.add_argument("--languages", type=str, nargs="+", default=None, help="Corpora to check (default: every corpus under --base_path).")
+    parser.add_argument("--backends", type=str, nargs="+", default=list(BACKENDS[1:]), choices=BACKENDS[1:])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--num_queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--emb_batch_size", type=int, default=defaults["emb_batch_size"])
+    parser.add_argument("--emb_threads", type=int, default=defaults["emb_threads"])
+    parser.add_argument("--emb_seq_buckets", type=int, nargs="+", default=defaults["emb_seq_buckets"])
+    parser.add_argument("--output", type=str, default=None, help="Optional JSON file for the report.")
+    cli_args = parser.parse_args()
+
+    if cli_args.emb_threads:
+        import torch
+        torch.set_num_threads(cli_args.emb_threads)
+    results = {}
+    for language in cli_args.languages or discover_languages(cli_args.base_path):
+        path = os.path.join(cli_args.base_path, f"{language}_sentences_embedding.npy")
+        if not store_exists(path):
+            print(f"Skipping {language}: no embedding store for {path} (load the language once first).")
+            continue
+        store = EmbeddingStore.load(store_dir(path))
+        if store.model_name and store.model_name != cli_args.emb_model:
+            print(f"Skipping {language}: store was built with {store.model_name}, not {cli_args.emb_model}.")
+            continue
+        results[language] = backend_report(cli_args.emb_model, store.matrix, store.key_list, cli_args.backends, cli_args.k,
+                                           cli_args.num_queries, cli_args.seed, cli_args.emb_batch_size, cli_args.emb_seq_buckets)
+        print(f"{language} ({len(store)} sentences)")
+        for row in results[language]:
+            print("  " + "  ".join(f"{key}={value}" for key, value in row.items()))
 
+    if cli_args.output:
+        with open(cli_args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=4)
+        print(f"Report saved to {cli_args.output}")
@@ -0,0 +1,102 @@
+import sqlite3
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+class EmbeddingCache:
+    def __init__(self, max_entries=10000, path=None):
+        """
+        Two-tier embedding cache: a bounded in-memory LRU in front of an optional SQLite store.
+
+        Args:
+            max_entries (int): Maximum number of vectors kept in memory.
+            path (str): SQLite file used to persist vectors across runs (memory only when empty).
+        """
+        self.max_entries = max_entries
+        self.path = path or None
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if self.path:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, text TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, text))"
+            )
+            self._db.commit()
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, model_name, text):
+        return self.get_many(model_name, [text])[0]
+
+    def get_many(self, model_name, texts):
+        """Return a list aligned with texts holding cached vectors, or None for misses."""
+        results = [None] * len(texts)
+        pending = []
+        with self._lock:
+            for i, text in enumerate(texts):
+                key = (model_name, text)
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    results[i] = self._memory[key]
+                    self.memory_hits += 1
+                else:
+                    pending.append(i)
+
+            for i in pending:
+                row = None
+                if self._db is not None:
+                    row = self._db.execute(
+                        "SELECT vector FROM embeddings WHERE model = ? AND text = ?", (model_name, texts[i])
+                    ).fetchone()
+                if row is None:
+                    self.misses += 1
+                    continue
+                vector = np.frombuffer(row[0], dtype=np.float32)
+                self._remember((model_name, texts[i]), vector)
+                results[i] = vector
+                self.disk_hits += 1
+        return results
+
+    def put(self, model_name, text, vector):
+        self.put_many(model_name, [text], [vector])
+
+    def put_many(self, model_name, texts, vectors):
+        vectors = [np.array(vector, dtype=np.float32) for vector in vectors]
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                self._remember((model_name, text), vector)
+            if self._db is not None:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, text, vector) VALUES (?, ?, ?)",
+                    [(model_name, text, vector.tobytes()) for text, vector in zip(texts, vectors)],
+                )
+                self._db.commit()
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
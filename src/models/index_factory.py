@@ -0,0 +1,236 @@
+import os
+import math
+import time
+import json
+import hashlib
+import argparse
+import numpy as np
+
+# faiss 在實際建立/讀取索引時才 import
+# flat: exact L2；ivf: 倒排分群；hnsw: 圖索引；ip: L2 正規化後的內積（cosine）
+# sq16: 向量以 float16 存放的 flat；pq: 乘積量化，每筆只存 pq_m 個碼
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ip", "sq16", "pq")
+
+
+def _pq_shape(dim, count, pq_m=0):
+    # 預設每 16 維一個子向量；faiss 每個分群中心至少要 39 筆訓練資料，資料少時降低每個子向量的碼數
+    pq_m = pq_m or max(1, dim // 16)
+    if dim % pq_m:
+        raise ValueError(f"pq_m={pq_m} must divide the embedding dimension {dim}.")
+    nbits = max(1, min(8, int(math.log2(max(count, 78) / 39))))
+    return pq_m, nbits
+
+
+def _factory_string(index_type, count, nlist=0, hnsw_m=32, dim=0, pq_m=0):
+    import faiss
+    if index_type == "flat":
+        return "Flat", faiss.METRIC_L2
+    if index_type == "ivf":
+        nlist = nlist or max(1, int(4 * math.sqrt(count)))
+        return f"IVF{min(nlist, max(1, count))},Flat", faiss.METRIC_L2
+    if index_type == "hnsw":
+        return f"HNSW{hnsw_m}", faiss.METRIC_L2
+    if index_type == "ip":
+        return "L2norm,Flat", faiss.METRIC_INNER_PRODUCT
+    if index_type == "sq16":
+        return "SQfp16", faiss.METRIC_L2
+    if index_type == "pq":
+        pq_m, nbits = _pq_shape(dim, count, pq_m)
+        return f"PQ{pq_m}x{nbits}", faiss.METRIC_L2
+    # 其他字串直接交給 faiss.index_factory
+    return index_type, faiss.METRIC_L2
+
+
+def embeddings_fingerprint(embeddings):
+    """Content hash of a float32 matrix (shape and values), stored with saved indexes."""
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    digest = hashlib.sha1(str(embeddings.shape).encode("utf-8"))
+    digest.update(memoryview(embeddings).cast("B"))
+    return digest.hexdigest()
+
+
+def _metadata_file(index_path):
+    return os.path.splitext(index_path)[0] + ".json"
+
+
+def _read_metadata(index_path):
+    try:
+        with open(_metadata_file(index_path), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_index(index, index_path, metadata):
+    import faiss
+    os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+    faiss.write_index(index, index_path)
+    with open(_metadata_file(index_path), "w", encoding="utf-8") as f:
+        json.dump(metadata, f, ensure_ascii=False)
+
+
+def _set_search_params(index, nprobe=8, ef_search=64):
+    import faiss
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(nprobe, ivf.nlist)
+    base = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexPreTransform) else index
+    if isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efSearch = ef_search
+
+
+def build_index(embeddings, index_type="flat", index_path=None, nlist=0, nprobe=8, hnsw_m=32, ef_search=64, pq_m=0,
+                model_name=None, fingerprint=None):
+    """
+    Build (or reload) a FAISS index over a 2-D float32 matrix.
+
+    Args:
+        embeddings (numpy.ndarray): One row per vector.
+        index_type (str): flat, ivf, hnsw, ip, sq16, pq, or any faiss.index_factory string.
+        index_path (str): When set, a saved index is reloaded from here if it was built
+            from the same vectors (model name and content fingerprint, kept in a .json
+            next to it) with the same settings; otherwise it is rebuilt and saved here.
+            A saved IVF index of the same model keeps its trained clusters and is refilled.
+        nlist (int): IVF cluster count (0 = 4 * sqrt(n)).
+        nprobe (int): IVF clusters visited per query.
+        hnsw_m (int): HNSW neighbours per node.
+        ef_search (int): HNSW search breadth.
+        pq_m (int): PQ sub-vectors per vector (0 = dim / 16).
+        model_name (str): Embedding model of the vectors, recorded with a saved index.
+        fingerprint (str): embeddings_fingerprint(embeddings), if already known.
+
+    Returns:
+        faiss.Index: An index with the usual search(queries, k) interface.
+    """
+    import faiss
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    metadata = None
+    if index_path:
+        metadata = {
+            "model": model_name,
+            "fingerprint": fingerprint or embeddings_fingerprint(embeddings),
+            "count": len(embeddings),
+            "dim": int(embeddings.shape[1]),
+            "index_type": index_type,
+            "settings": {"nlist": nlist, "hnsw_m": hnsw_m, "pq_m": pq_m},
+        }
+
+    if index_path and os.path.exists(index_path):
+        saved = _read_metadata(index_path)
+        index = faiss.read_index(index_path)
+        if saved == metadata and index.ntotal == len(embeddings) and index.d == embeddings.shape[1]:
+            _set_search_params(index, nprobe, ef_search)
+            return index
+        same_build = all(saved.get(key) == metadata[key] for key in ("model", "dim", "index_type", "settings"))
+        if same_build and index.d == embeddings.shape[1] and faiss.try_extract_index_ivf(index) is not None:
+            # 同一模型與設定、資料有增刪或修改：沿用已訓練的分群中心，只重新加入向量
+            index.reset()
+            index.add(embeddings)
+            _set_search_params(index, nprobe, ef_search)
+            _write_index(index, index_path, metadata)
+            return index
+        print(f"[WARN] Saved index {index_path} was built from other embeddings or settings; rebuilding.")
+
+    description, metric = _factory_string(index_type, len(embeddings), nlist, hnsw_m, embeddings.shape[1], pq_m)
+    index = faiss.index_factory(embeddings.shape[1], description, metric)
+    if not index.is_trained:
+        index.train(embeddings)
+    index.add(embeddings)
+    _set_search_params(index, nprobe, ef_search)
+
+    if index_path:
+        _write_index(index, index_path, metadata)
+    return index
+
+
+def compact_index_type(index_type, compact=False):
+    """
+    Index type to build with compact storage: flat would expand the float16 store into a
+    float32 copy inside the index, so it becomes sq16 (float16 vectors, same neighbours).
+    """
+    return "sq16" if compact and index_type == "flat" else index_type
+
+
+def index_file(store_path, index_type):
+    """Location of a saved index inside an embedding store directory (None for untrained types)."""
+    if index_type in ("flat", "ip", "sq16"):
+        return None
+    name = "".join(c if c.isalnum() else "_" for c in index_type)
+    return os.path.join(store_path, f"index_{name}.faiss")
+
+
+def recall_report(embeddings, index_types=INDEX_TYPES, k=10, num_queries=200, seed=0, **index_params):
+    """
+    Compare index types against the exact flat baseline.
+
+    Queries are datastore vectors themselves (the hit on itself is counted like any other).
+
+    Returns:
+        list: One dict per index type with recall@k, mean per-query latency (ms) and build time (s).
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    queries = embeddings[rng.choice(len(embeddings), size=min(num_queries, len(embeddings)), replace=False)]
+    k = min(k, len(embeddings))
+
+    baseline = build_index(embeddings, "flat")
+    _, truth = baseline.search(queries, k)
+
+    report = []
+    for index_type in index_types:
+        start = time.perf_counter()
+        index = build_index(embeddings, index_type, **index_params)
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for query in queries:
+            index.search(query[None, :], k)
+        latency = (time.perf_counter() - start) / len(queries) * 1000
+
+        _, found = index.search(queries, k)
+        recall = np.mean([len(set(t) & set(f)) / k for t, f in zip(truth, found)])
+        report.append({
+            "index_type": index_type,
+            f"recall@{k}": round(float(recall), 4),
+            "latency_ms": round(latency, 4),
+            "build_s": round(build_time, 4),
+        })
+    return report
+
+
+# Recall/latency report: python -m src.models.index_factory [--k 10] [--output report.json]
+if __name__ == "__main__":
+    import src.utils.config_parser as config_parser
+    from src.utils.embedding_store import EmbeddingStore, store_dir, store_exists
+
+    defaults = config_parser.load_config()
+    parser = argparse.ArgumentParser(description="Recall@k and latency of FAISS index types against the flat baseline.")
+    parser.add_argument("--sentence_embedding_path", type=str, default=defaults["sentence_embedding_path"])
+    parser.add_argument("--lexicon_embedding_path", type=str, default=defaults["lexicon_embedding_path"])
+    parser.add_argument("--index_types", type=str, nargs="+", default=list(INDEX_TYPES))
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--num_queries", type=int, default=200)
+    parser.add_argument("--ivf_nlist", type=int, default=defaults["ivf_nlist"])
+    parser.add_argument("--ivf_nprobe", type=int, default=defaults["ivf_nprobe"])
+    parser.add_argument("--hnsw_m", type=int, default=defaults["hnsw_m"])
+    parser.add_argument("--hnsw_ef_search", type=int, default=defaults["hnsw_ef_search"])
+    parser.add_argument("--pq_m", type=int, default=defaults["pq_m"])
+    parser.add_argument("--output", type=str, default=None, help="Optional JSON file for the report.")
+    cli_args = parser.parse_args()
+
+    params = {"nlist": cli_args.ivf_nlist, "nprobe": cli_args.ivf_nprobe, "hnsw_m": cli_args.hnsw_m, "ef_search": cli_args.hnsw_ef_search, "pq_m": cli_args.pq_m}
+    results = {}
+    for name, path in [("sentences", cli_args.sentence_embedding_path), ("lexicon", cli_args.lexicon_embedding_path)]:
+        if not store_exists(path):
+            print(f"Skipping {name}: no embedding store for {path} (load it once or run python -m src.utils.embedding_store).")
+            continue
+        matrix = EmbeddingStore.load(store_dir(path)).matrix
+        results[name] = recall_report(matrix, cli_args.index_types, cli_args.k, cli_args.num_queries, **params)
+        print(f"{name} ({len(matrix)} vectors)")
+        for row in results[name]:
+            print("  " + "  ".join(f"{key}={value}" for key, value in row.items()))
+
+    if cli_args.output:
+        with open(cli_args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=4)
+        print(f"Report saved to {cli_args.output}")
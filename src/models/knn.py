@@ -1,115 +1,256 @@
 import re
 import numpy as np
-import jieba
 import string
+import threading
+import functools
 import src.utils.config_parser as config_parser
-from src.models.embedding import EmbeddingModel
+from src.models.embedding import get_embedding_model
+from src.models.index_factory import compact_index_type, index_file
+from src.models.lexicon_matcher import LexiconTrie
+from src.models.lexicon_table import LexiconTable
+from src.models.retrieval_cache import RetrievalCache
+from src.models.segmenter import get_segmenter, lexicon_user_words
 from src.utils.dataset_utils import DatasetUtils
+import src.utils.instrumentation as instrumentation
+
+
+def _consistent(method):
+    # 查詢期間持有 _state_lock：refresh() 換上新的詞表與索引時，不會讀到一半新一半舊
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._state_lock:
+            return method(self, *args, **kwargs)
+    return wrapper
 
 
 class KNNRetriever:
     def __init__(self, args, sentences_emb):
-        self.embedding_model = EmbeddingModel(args.emb_model)
+        self.embedding_model = get_embedding_model(args.emb_model, **config_parser.embedding_options(args))
         self.sentences_path = args.sentences_path
         self.lexicon_path = args.lexicon_path
+        self.sentence_embedding_path = args.sentence_embedding_path
         self.lexicon_embedding_path = args.lexicon_embedding_path
-        self.sentences_emb = sentences_emb
+        self.sentence_index_type = compact_index_type(args.sentence_index, args.compact_storage)
+        self.lexicon_index_type = compact_index_type(args.lexicon_index, args.compact_storage)
+        self.index_params = config_parser.index_options(args)
+        self.jieba_dict_dir = args.jieba_dict_dir
+        self.jieba_user_words = args.jieba_user_words
+        # 組好的範例字串快取（0 = 不快取），refresh() 後整個作廢
+        self.retrieval_cache = RetrievalCache(args.retrieval_cache_size) if args.retrieval_cache_size else None
         
-        self.data_utils = DatasetUtils(args.emb_model)
+        self.compact = args.compact_storage
+        self.data_utils = DatasetUtils(args.emb_model, compact=self.compact)
+        # 保護下列檢索狀態：查詢讀取、refresh() 一次換上整組新狀態
+        self._state_lock = threading.RLock()
         self.all_ch2amis = self.data_utils._load_json(self.sentences_path, invert=True)
-        self.lexicon, self.lexicon_list = self.data_utils._load_lexicon(self.lexicon_path)
-        self.faiss_index, self.lexicon_mapping = self.data_utils._load_lexicon_embeddings(self.lexicon_embedding_path, self.lexicon_list)
+        self._set_state(self._load_lexicon(), self._build_sentence_index(sentences_emb))
+    
+    def _set_state(self, lexicon_state, sentence_state):
+        self.lexicon, self.lexicon_list, self.lexicon_trie, self.segmenter, self.faiss_index, self.lexicon_mapping = lexicon_state
+        self.sentences_emb, self.sentence_keys, self.sentence_index = sentence_state
+    
+    def _load_lexicon(self):
+        lexicon, lexicon_list = self.data_utils._load_lexicon(self.lexicon_path)
+        if self.compact:
+            table = LexiconTable(lexicon)
+            lexicon, lexicon_list = table.entries, table.gloss_lists
+        lexicon_trie = LexiconTrie(lexicon_list)
+        # jieba 字典在第一次斷詞時才載入
+        segmenter = get_segmenter(self.jieba_dict_dir, lexicon_user_words(lexicon_list) if self.jieba_user_words else ())
+        faiss_index, lexicon_mapping = self.data_utils._load_lexicon_embeddings(
+            self.lexicon_embedding_path, lexicon_list, self.lexicon_index_type, **self.index_params)
+        return lexicon, lexicon_list, lexicon_trie, segmenter, faiss_index, lexicon_mapping
+    
+    def _build_sentence_index(self, sentences_emb):
+        # 句子索引只建一次，sentence_keys[i] 對應索引中的第 i 筆
+        sentence_keys = list(sentences_emb.keys())
+        sentence_matrix = getattr(sentences_emb, "matrix", None)
+        if sentence_matrix is None:
+            sentence_matrix = [sentences_emb[key] for key in sentence_keys]
+        store_path = getattr(sentences_emb, "path", None)
+        sentence_index = self.embedding_model.embeddings2faiss(
+            sentence_matrix, self.sentence_index_type, store_path and index_file(store_path, self.sentence_index_type),
+            model_name=getattr(sentences_emb, "model_name", None), fingerprint=getattr(sentences_emb, "fingerprint", None),
+            **self.index_params)
+        return sentences_emb, sentence_keys, sentence_index
+    
+    def refresh(self):
+        """
+        Re-read the sentence and lexicon JSON files and update the retriever in place
+        (for retrievers built on the full sentence store, as in single mode or the server).
+
+        Only sentences and glosses that are new or edited are embedded; deleted ones
+        are dropped from the stores. The FAISS indexes and the lexicon mapping are
+        rebuilt from the updated stores (a saved IVF index keeps its trained clusters
+        and is refilled). Everything is built first and then swapped in while no
+        query is running, so a query sees either the old or the new state.
+        """
+        all_ch2amis = self.data_utils._load_json(self.sentences_path, invert=True)
+        sentences_emb = self.data_utils._load_embeddings(self.sentence_embedding_path, all_ch2amis)
+        lexicon_state, sentence_state = self._load_lexicon(), self._build_sentence_index(sentences_emb)
+        with self._state_lock:
+            self.all_ch2amis = all_ch2amis
+            self._set_state(lexicon_state, sentence_state)
+            if self.retrieval_cache is not None:
+                self.retrieval_cache.invalidate()
         
         
     # find_similar word
+    @_consistent
     def find_similar(self, term):
         embedding = self.embedding_model.get_single_embedding(term)
-        _, indices = self.faiss_index.search(np.array([embedding]), k=1)
-        return self.lexicon_mapping[int(indices[0][0])]
-
-    # _find_longest_match    
-    def _find_longest_match(self, sentence):
-        temp_list = []
-        max_len = 0
-        for e, w in enumerate(self.lexicon_list):
-            for e2, w2 in enumerate(w):
-                if len(sentence) >= len(w2) and w2 == sentence[:len(w2)]:
-                    temp_list.append([e, e2])
-                    max_len = max(max_len, len(w2))
-
-        # 檢查是否有空字串資料
-        if temp_list and max_len == 0:
-            raise ValueError("Data Error: lexicon_list contains empty string elements.")
-        
-        return [item for item in temp_list if len(self.lexicon_list[item[0]][item[1]]) == max_len]
+        with instrumentation.timed("faiss_search"):
+            _, indices = self.faiss_index.search(np.array([embedding]), k=1)
+        return self._mapping_entry(indices[0][0])
+
+    # find_similar for many terms: one batched embedding pass and one search
+    @_consistent
+    def find_similar_batch(self, terms):
+        terms = list(dict.fromkeys(terms))
+        if not terms:
+            return {}
+        embeddings = self.embedding_model.encode(terms)
+        with instrumentation.timed("faiss_search"):
+            _, indices = self.faiss_index.search(embeddings, k=1)
+        return {term: self._mapping_entry(indices[i][0]) for i, term in enumerate(terms)}
+
+    # 第 index 筆詞義的 (詞條, 詞義) 位置；mapping 可能是 list 或 int32 陣列
+    def _mapping_entry(self, index):
+        entry = self.lexicon_mapping[int(index)]
+        return int(entry[0]), int(entry[1])
+
+    # _find_longest_match
+    def _find_longest_match(self, sentence, start=0):
+        with instrumentation.timed("lexicon_match"):
+            return self.lexicon_trie.longest_match(sentence, start)
 
 
     # format_parallel_data
     def _format_parallel_data(self, data_idx):
         return f"[zh]: {'/'.join(self.lexicon_list[data_idx[0]])}\n[amis]: {self.lexicon[data_idx[0]][0]}\n\n"
 
-    # check_not_found_sentence
+    # check_not_found_sentence：斷詞後所有片段一次 embedding、一次 search
+    @_consistent
     def _check_not_found_sentence(self, sentence):
         if not sentence:
             return ""
         
-        seg_list = jieba.cut(sentence, cut_all=False)
-        return ''.join(
-            f"[*zh]: {text}\n[zh]: {'/'.join(self.lexicon_list[e[0]])}\n[amis]: {self.lexicon[e[0]][0]}\n\n"
-            for text in seg_list if text.strip() and (e := self.find_similar(text))
-        )
+        parts = [("similar", self._cut_not_found(sentence))]
+        return self._format_lexicon(parts, [], self.find_similar_batch(self._similar_terms(parts)))
 
-    # 查找詞表
+    # 查找詞表：先比對整句，找不到的片段最後一起查
+    @_consistent
     def trans(self, sentence):
-        ans = ""
-        cant_find_sentence = ""
-        while sentence:
-            index_list = self._find_longest_match(sentence)
-            if index_list:
-                ans += self._check_not_found_sentence(cant_find_sentence)
-                cant_find_sentence = ""
-                ans += ''.join(self._format_parallel_data(index) for index in index_list)
-                sentence = sentence[len(self.lexicon_list[index_list[0][0]][index_list[0][1]]):]
-            else:
-                cant_find_sentence += sentence[0]
-                sentence = sentence[1:]
-        ans += self._check_not_found_sentence(cant_find_sentence)
-        return ans
+        parts = self._segment_lexicon(sentence)
+        return self._format_lexicon(parts, [], self.find_similar_batch(self._similar_terms(parts)))
 
     # find_knn_examples_topN_sentence
+    @_consistent
     def find_knn_examples_topN_sentence(self, sentence, k):
         
         if k == 0:
             return []
         
-        cp_datastore_embeddings = self.sentences_emb.copy()
-        if sentence in cp_datastore_embeddings:
-            del cp_datastore_embeddings[sentence]
+        # 多取一筆，排除輸入句本身
+        fetch_k = min(k + 1, len(self.sentence_keys))
+        embedding = self.embedding_model.get_single_embedding(sentence)
+        with instrumentation.timed("faiss_search"):
+            _, indices = self.sentence_index.search(np.array([embedding]), fetch_k)
+
+        neighbours = [self.sentence_keys[index] for index in indices[0]
+                      if index >= 0 and self.sentence_keys[index] != sentence][:k]
+        return [[key, self.all_ch2amis[key]] for key in neighbours]
 
-        datastore_index = self.embedding_model.embeddings2faiss(list(cp_datastore_embeddings.values()))
+    # find_knn_examples_topN_sentence for many sentences: one embedding batch, one search
+    @_consistent
+    def find_knn_examples_topN_sentence_batch(self, sentences, k):
+        if k == 0 or not sentences:
+            return [[] for _ in sentences]
         
-        _, indices = datastore_index.search(np.array([self.embedding_model.get_single_embedding(sentence)]), k)
+        fetch_k = min(k + 1, len(self.sentence_keys))
+        embeddings = self.embedding_model.encode(sentences)
+        with instrumentation.timed("faiss_search"):
+            _, indices = self.sentence_index.search(embeddings, fetch_k)
+        
+        results = []
+        for sentence, row in zip(sentences, indices):
+            neighbours = [self.sentence_keys[index] for index in row
+                          if index >= 0 and self.sentence_keys[index] != sentence][:k]
+            results.append([[key, self.all_ch2amis[key]] for key in neighbours])
+        return results
 
-        return [[list(cp_datastore_embeddings.keys())[index], self.all_ch2amis[list(cp_datastore_embeddings.keys())[index]]]
-                for index in indices[0]]
+    # 詞表比對結果：("match", index_list) 或 ("similar", 找不到的片段經 jieba 斷詞後的詞)
+    def _segment_lexicon(self, sentence):
+        parts = []
+        cant_find_sentence = ""
+        pos = 0
+        while pos < len(sentence):
+            index_list = self._find_longest_match(sentence, pos)
+            if index_list:
+                if cant_find_sentence:
+                    parts.append(("similar", self._cut_not_found(cant_find_sentence)))
+                    cant_find_sentence = ""
+                parts.append(("match", index_list))
+                pos += len(self.lexicon_list[index_list[0][0]][index_list[0][1]])
+            else:
+                cant_find_sentence += sentence[pos]
+                pos += 1
+        if cant_find_sentence:
+            parts.append(("similar", self._cut_not_found(cant_find_sentence)))
+        return parts
 
-    # find_lexicon
-    def _find_lexicon(self, sentence):
+    def _cut_not_found(self, sentence):
+        with instrumentation.timed("jieba"):
+            return [text for text in self.segmenter.cut(sentence) if text.strip()]
+
+    @staticmethod
+    def _similar_terms(parts):
+        # 詞表找不到、需以 find_similar 查詢的詞
+        return [text for kind, value in parts if kind == "similar" for text in value]
+
+    def _prepare_lexicon(self, sentence):
         translator = str.maketrans("，。！", "   ", string.punctuation)
         sentence_cleaned = sentence.translate(translator)
+        return self._segment_lexicon(re.sub(r'[a-zA-Z]+', '', sentence_cleaned)), re.findall(r'[a-zA-Z]+', sentence_cleaned)
 
-        # 去除英文字，查找中文詞表
-        examples = self.trans(re.sub(r'[a-zA-Z]+', '', sentence_cleaned))
-
-        # 英文詞直接保留
-        for lexicon in re.findall(r'[a-zA-Z]+', sentence_cleaned):
+    def _format_lexicon(self, parts, english_words, similar):
+        examples = ""
+        for kind, value in parts:
+            if kind == "match":
+                examples += ''.join(self._format_parallel_data(index) for index in value)
+            else:
+                examples += ''.join(
+                    f"[*zh]: {text}\n[zh]: {'/'.join(self.lexicon_list[e[0]])}\n[amis]: {self.lexicon[e[0]][0]}\n\n"
+                    for text in value if (e := similar[text])
+                )
+        for lexicon in english_words:
             examples += f"[zh]: {lexicon}\n[amis]: {lexicon}\n\n"
-        
         return examples
 
+    # find_lexicon
+    @_consistent
+    def _find_lexicon(self, sentence):
+        # 去除英文字查找中文詞表，英文詞直接保留
+        parts, english_words = self._prepare_lexicon(sentence)
+        return self._format_lexicon(parts, english_words, self.find_similar_batch(self._similar_terms(parts)))
+
     
     # knn主程式
+    @_consistent
     def find_knn_examples(self, sentence, k, findlexicon=True):
+        key = self.retrieval_cache.key(sentence, k, findlexicon) if self.retrieval_cache is not None else None
+        if key is not None:
+            examples = self.retrieval_cache.get(key)
+            instrumentation.count("retrieval_cache_hits" if examples is not None else "retrieval_cache_misses")
+            if examples is not None:
+                return examples
+        
+        examples = self._assemble_examples(sentence, k, findlexicon)
+        if key is not None:
+            self.retrieval_cache.put(key, examples)
+        return examples
+
+    def _assemble_examples(self, sentence, k, findlexicon):
         examples = ''.join(
             f"[zh]: {zh_example}\n[amis]: {amis_example}\n\n"
             for zh_example, amis_example in self.find_knn_examples_topN_sentence(sentence, k)
@@ -120,6 +261,43 @@ class KNNRetriever:
 
         return examples
 
+    # knn主程式（批次版）：與逐句呼叫 find_knn_examples 產生相同的字串
+    @_consistent
+    def find_knn_examples_batch(self, sentences, k, findlexicon=True):
+        sentences = list(sentences)
+        if self.retrieval_cache is None:
+            return self._assemble_examples_batch(sentences, k, findlexicon)
+        
+        # 只為快取沒有的句子做檢索
+        keys = [self.retrieval_cache.key(sentence, k, findlexicon) for sentence in sentences]
+        examples = [self.retrieval_cache.get(key) for key in keys]
+        missing = [sentence for sentence, example in zip(sentences, examples) if example is None]
+        instrumentation.count("retrieval_cache_hits", len(sentences) - len(missing))
+        instrumentation.count("retrieval_cache_misses", len(missing))
+        missing = list(dict.fromkeys(missing))
+        if missing:
+            found = dict(zip(missing, self._assemble_examples_batch(missing, k, findlexicon)))
+            for i, sentence in enumerate(sentences):
+                if examples[i] is None:
+                    examples[i] = found[sentence]
+                    self.retrieval_cache.put(keys[i], examples[i])
+        return examples
+
+    def _assemble_examples_batch(self, sentences, k, findlexicon):
+        examples = [
+            ''.join(f"[zh]: {zh_example}\n[amis]: {amis_example}\n\n" for zh_example, amis_example in topN)
+            for topN in self.find_knn_examples_topN_sentence_batch(sentences, k)
+        ]
+
+        if findlexicon:
+            prepared = [self._prepare_lexicon(sentence) for sentence in sentences]
+            # 整批句子的片段一起查：一次 embedding 批次、一次 search
+            similar = self.find_similar_batch(text for parts, _ in prepared for text in self._similar_terms(parts))
+            examples = [example + self._format_lexicon(parts, english_words, similar)
+                        for example, (parts, english_words) in zip(examples, prepared)]
+
+        return examples
+
 
 
 # Test
@@ -130,8 +308,8 @@ if __name__ == "__main__":
     config_defaults = config_parser.get_combined_config()
     args = config_parser.parse_arguments(config_defaults)
     
-    data_utils = DatasetUtils(args.emb_model)
-    all_ch2amis = data_utils._load_json(args.sentences_path, invert=True)
+    data_utils = DatasetUtils(args.emb_model, args.compact_storage, **config_parser.embedding_options(args))
+    all_ch2amis = DatasetUtils._load_json(args.sentences_path, invert=True)
     sentence_embeddings = data_utils._load_embeddings(args.sentence_embedding_path, all_ch2amis)
     knn = KNNRetriever(args, sentence_embeddings)
     
@@ -0,0 +1,180 @@
+import os
+import glob
+import time
+import argparse
+import threading
+from collections import OrderedDict
+import src.utils.config_parser as config_parser
+from src.models.callLLM import build_llm
+from src.models.translation import Ch2AmisTranslator
+from src.utils.dataset_utils import DatasetUtils
+
+SENTENCES_SUFFIX = "_sentences.json"
+
+
+def discover_languages(base_path):
+    """Languages with both <name>_sentences.json and <name>_lexicon.json under base_path."""
+    languages = []
+    for path in sorted(glob.glob(os.path.join(base_path, f"*{SENTENCES_SUFFIX}"))):
+        language = os.path.basename(path)[:-len(SENTENCES_SUFFIX)]
+        if os.path.exists(os.path.join(base_path, f"{language}_lexicon.json")):
+            languages.append(language)
+    return languages
+
+
+def _language_prompt(prompt_path, name, fallback):
+    path = os.path.join(prompt_path, name)
+    if os.path.exists(path):
+        return path
+    print(f"[WARNING]: {path} not found, using {fallback}.")
+    return fallback
+
+
+def language_args(args, language):
+    """Copy of args with the corpus, embedding, prompt and mistake bank paths of one language."""
+    base_path = args.base_path
+    return argparse.Namespace(**{
+        **vars(args),
+        "language": language,
+        "sentences_path": os.path.join(base_path, f"{language}_sentences.json"),
+        "lexicon_path": os.path.join(base_path, f"{language}_lexicon.json"),
+        "sentence_embedding_path": os.path.join(base_path, f"{language}_sentences_embedding.npy"),
+        "lexicon_embedding_path": os.path.join(base_path, f"{language}_lexicon_embedding.npy"),
+        "mistake_bank_path": os.path.join(base_path, f"{language}_mistake_bank.json"),
+        # 目前只有部分語言有專屬 prompt，其餘沿用設定檔中的 prompt
+        "rpc_prompt_path": _language_prompt(args.prompt_path, f"{language}_translation_prompt.txt", args.rpc_prompt_path),
+        "cot_prompt_path": _language_prompt(args.prompt_path, f"{language}_COT_prompt.json", args.cot_prompt_path),
+    })
+
+
+class LanguageRegistry:
+    def __init__(self, args, factory=None, max_loaded=2, idle_seconds=1800):
+        """
+        Lazily loaded translators for every corpus under args.base_path.
+
+        A language's lexicon, matcher, embeddings and indexes are loaded on its first
+        request. All languages share the process-wide embedding model and one LLM client.
+        Beyond max_loaded languages the least recently used one is evicted, and so is
+        any language idle for idle_seconds.
+
+        Args:
+            args (Namespace): Parsed arguments; per-language paths are derived from them.
+            factory (callable): Builds the loaded value from (language args, llm).
+                Defaults to a Ch2AmisTranslator. Values with a close() method are
+                closed on eviction.
+            max_loaded (int): Most languages kept in memory (0 = unbounded).
+            idle_seconds (float): Evict languages unused for this long (0 = never).
+        """
+        self.args = args
+        self.languages = discover_languages(args.base_path)
+        if not self.languages:
+            raise FileNotFoundError(f"No *{SENTENCES_SUFFIX} corpora found in {args.base_path}.")
+        self.factory = factory or self._build_translator
+        self.max_loaded = max_loaded
+        self.idle_seconds = idle_seconds
+        self.llm = None
+        self._entries = OrderedDict()      # language -> [value, last used]
+        self._lock = threading.Lock()
+        self._llm_lock = threading.Lock()
+        self._load_locks = {language: threading.Lock() for language in self.languages}
+
+    @staticmethod
+    def _build_translator(args, llm):
+        data_utils = DatasetUtils(args.emb_model, args.compact_storage, **config_parser.embedding_options(args))
+        all_ch2amis = DatasetUtils._load_json(args.sentences_path, invert=True)
+        sentence_embeddings = data_utils._load_embeddings(args.sentence_embedding_path, all_ch2amis)
+        return Ch2AmisTranslator(args, sentence_embeddings, llm)
+
+    def _shared_llm(self):
+        # 不同語言可能同時第一次載入：LLM client（含限速與快取）只建一個
+        with self._llm_lock:
+            if self.llm is None:
+                self.llm = build_llm(self.args)
+            return self.llm
+
+    def _lookup(self, language):
+        with self._lock:
+            entry = self._entries.get(language)
+            if entry is None:
+                return None
+            entry[1] = time.monotonic()
+            self._entries.move_to_end(language)
+            return entry[0]
+
+    def get(self, language=None):
+        """Loaded value for language (the configured language when None)."""
+        language = language or self.args.language
+        if language not in self._load_locks:
+            raise ValueError(f"Language {language} not found. Available: {', '.join(self.languages)}.")
+
+        value = self._lookup(language)
+        if value is not None:
+            return value
+
+        # 同一語言只載入一次；不同語言可同時載入
+        with self._load_locks[language]:
+            value = self._lookup(language)
+            if value is None:
+                print(f"Loading language {language} ...")
+                value = self.factory(language_args(self.args, language), self._shared_llm())
+                with self._lock:
+                    self._entries[language] = [value, time.monotonic()]
+        self._evict(keep=language)
+        return value
+
+    def _evict(self, keep=None):
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            for language, (value, last_used) in list(self._entries.items()):
+                if language == keep:
+                    continue
+                over_capacity = self.max_loaded > 0 and len(self._entries) > self.max_loaded
+                idle = self.idle_seconds > 0 and now - last_used > self.idle_seconds
+                if over_capacity or idle:
+                    del self._entries[language]
+                    evicted.append((language, value))
+        for language, value in evicted:
+            self._release(value)
+            print(f"Evicted language {language}")
+
+    def evict_idle(self):
+        self._evict()
+
+    @staticmethod
+    def _release(value):
+        close = getattr(value, "close", None)
+        if close is not None:
+            close()
+
+    def loaded(self):
+        with self._lock:
+            return list(self._entries)
+
+    def peek(self, language):
+        """Loaded value for language, or None; neither loads it nor counts as a use."""
+        with self._lock:
+            entry = self._entries.get(language)
+            return entry[0] if entry is not None else None
+
+    def close(self):
+        with self._lock:
+            values = [value for value, _ in self._entries.values()]
+            self._entries.clear()
+        for value in values:
+            self._release(value)
+
+
+# Test
+if __name__ == "__main__":
+    config_defaults = config_parser.get_combined_config()
+    args = config_parser.parse_arguments(config_defaults)
+
+    registry = LanguageRegistry(args, max_loaded=args.max_languages, idle_seconds=args.language_idle_seconds)
+    print("Available languages:", registry.languages)
+    if args.input_sentence:
+        for language in registry.languages:
+            translator = registry.get(language)
+            print(f"[{language}]:", translator.translate(args.input_sentence, args.translation_mode))
+            print("Loaded:", registry.loaded())
+    registry.close()
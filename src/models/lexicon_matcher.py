@@ -0,0 +1,44 @@
+# 詞表前綴樹：取代逐一比對所有詞條的 _find_longest_match
+
+_END = ""  # 節點上存放 (entry, gloss) 索引的鍵；單一字元永遠不會是空字串
+
+
+class LexiconTrie:
+    def __init__(self, lexicon_list):
+        """
+        Build a character trie over every gloss of every lexicon entry.
+
+        Args:
+            lexicon_list (list): lexicon_list[e][e2] is the e2-th Chinese gloss of entry e.
+        """
+        self.root = {}
+        for e, glosses in enumerate(lexicon_list):
+            for e2, gloss in enumerate(glosses):
+                node = self.root
+                for char in gloss:
+                    node = node.setdefault(char, {})
+                node.setdefault(_END, []).append([e, e2])
+
+    def longest_match(self, sentence, start=0):
+        """
+        Return every [entry, gloss] index whose gloss is the longest prefix of sentence[start:].
+
+        Matches are listed in lexicon order, the same as a linear scan would produce.
+        """
+        node = self.root
+        best = node.get(_END)
+        best_len = 0
+        for pos in range(start, len(sentence)):
+            node = node.get(sentence[pos])
+            if node is None:
+                break
+            if _END in node:
+                best = node[_END]
+                best_len = pos - start + 1
+
+        if not best:
+            return []
+        # 檢查是否有空字串資料
+        if best_len == 0:
+            raise ValueError("Data Error: lexicon_list contains empty string elements.")
+        return [list(item) for item in best]
@@ -0,0 +1,63 @@
+import sys
+import numpy as np
+from collections.abc import Sequence
+
+# 精簡詞表（compact_storage）：所有字串 intern，詞義攤平成一個 list，以 int32 offsets 切出每個詞條
+
+
+class LexiconTable:
+    def __init__(self, lexicon):
+        """
+        Array-backed lexicon holding the same data as DatasetUtils._load_lexicon.
+
+        Every string is interned, so a gloss repeated across entries (or across
+        languages) is stored once. The glosses of entry e are
+        glosses[offsets[e]:offsets[e + 1]]. .entries and .gloss_lists are read-only
+        views indexed like the (lexicon, lexicon_list) pair they replace.
+
+        Args:
+            lexicon (list): (Amis word, list of Chinese glosses) pairs in lexicon order.
+        """
+        self.amis = [sys.intern(amis) for amis, _ in lexicon]
+        self.glosses = [sys.intern(gloss) for _, glosses in lexicon for gloss in glosses]
+        self.offsets = np.zeros(len(lexicon) + 1, dtype=np.int32)
+        np.cumsum([len(glosses) for _, glosses in lexicon], out=self.offsets[1:])
+        self.entries = LexiconEntries(self)
+        self.gloss_lists = GlossLists(self)
+
+    def __len__(self):
+        return len(self.amis)
+
+    def glosses_of(self, e):
+        return self.glosses[self.offsets[e]:self.offsets[e + 1]]
+
+
+class _TableView(Sequence):
+    def __init__(self, table):
+        self.table = table
+
+    def __len__(self):
+        return len(self.table)
+
+    def _check(self, e):
+        if isinstance(e, slice):
+            raise TypeError("Lexicon table views do not support slicing.")
+        e = int(e)
+        if e < 0:
+            e += len(self.table)
+        if not 0 <= e < len(self.table):
+            raise IndexError("lexicon index out of range")
+        return e
+
+
+class LexiconEntries(_TableView):
+    """View indexed like lexicon: entries[e] is (Amis word, list of glosses)."""
+    def __getitem__(self, e):
+        e = self._check(e)
+        return self.table.amis[e], self.table.glosses_of(e)
+
+
+class GlossLists(_TableView):
+    """View indexed like lexicon_list: gloss_lists[e] is the list of entry e's glosses."""
+    def __getitem__(self, e):
+        return self.table.glosses_of(self._check(e))
@@ -0,0 +1,109 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+CACHE_MODES = ("off", "readwrite", "readonly", "replay")
+
+
+class ResponseCache:
+    """
+    Interface for LLM response caches.
+
+    Modes:
+        readwrite: serve hits, store new responses.
+        readonly:  serve hits, never write.
+        replay:    serve hits only; a miss is an error, so no request leaves the machine.
+    """
+    def __init__(self, mode="readwrite"):
+        if mode not in CACHE_MODES or mode == "off":
+            raise ValueError(f"Unsupported LLM cache mode: {mode}. Choose from {', '.join(CACHE_MODES[1:])}.")
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model, messages, temperature, max_output_tokens):
+        payload = json.dumps(
+            {"model": model, "messages": messages, "temperature": temperature, "max_output_tokens": max_output_tokens},
+            ensure_ascii=False, sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def put(self, key, response):
+        raise NotImplementedError
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0}
+
+
+class SQLiteResponseCache(ResponseCache):
+    def __init__(self, path, mode="readwrite", max_entries=100000):
+        """
+        File-based response cache with least-recently-used eviction.
+
+        Args:
+            path (str): SQLite file holding the responses.
+            mode (str): readwrite, readonly or replay.
+            max_entries (int): Oldest entries are evicted beyond this size (0 = unbounded).
+        """
+        super().__init__(mode)
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        if self.mode == "readwrite":
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._db.commit()
+        self._size = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if self.mode == "readwrite":
+                self._db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+                self._db.commit()
+            return row[0]
+
+    def put(self, key, response):
+        if self.mode != "readwrite":
+            return
+        with self._lock:
+            existed = self._db.execute("SELECT 1 FROM responses WHERE key = ?", (key,)).fetchone() is not None
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, response, last_access) VALUES (?, ?, ?)",
+                (key, response, time.time()),
+            )
+            if not existed:
+                self._size += 1
+            if self.max_entries and self._size > self.max_entries:
+                overflow = self._size - self.max_entries
+                self._db.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access LIMIT ?)",
+                    (overflow,),
+                )
+                self._size -= overflow
+            self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+
+def build_response_cache(path, mode="readwrite", max_entries=100000):
+    """Create the configured response cache, or None when caching is off."""
+    if not path or mode == "off":
+        return None
+    return SQLiteResponseCache(path, mode, max_entries)
@@ -0,0 +1,156 @@
+import os
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tqdm import tqdm
+import src.utils.config_parser as config_parser
+
+
+def _read(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        return file.read()
+
+
+def bank_stamp(args, sentences_emb):
+    """
+    Settings that determine a COT answer. A bank built under a different stamp is discarded.
+
+    COT prompts show retrieved datastore examples, so the stamp also covers the datastore:
+    the sentence store's fingerprint and the sentence and lexicon files (for the Amis side,
+    which the embeddings do not see). Any datastore edit therefore rebuilds the whole bank.
+
+    Args:
+        args (argparse.Namespace): Language arguments.
+        sentences_emb (EmbeddingStore): The translator's sentence embeddings.
+    """
+    prompts = _read(args.rpc_prompt_path) + _read(args.cot_prompt_path)
+    corpus = _read(args.sentences_path) + (_read(args.lexicon_path) if args.findlexicon else "")
+    return {
+        "gpt_model": args.gpt_model,
+        "emb_model": args.emb_model,
+        "knn_k": args.Knn_k,
+        "findlexicon": str(args.findlexicon),
+        "prompt_sha256": hashlib.sha256(prompts.encode("utf-8")).hexdigest(),
+        "sentence_store": sentences_emb.fingerprint,
+        "corpus_sha256": hashlib.sha256(corpus.encode("utf-8")).hexdigest(),
+    }
+
+
+class MistakeBank:
+    def __init__(self, path, stamp):
+        """
+        Precomputed COT answers for datastore sentences, used as LFM's wrong examples.
+
+        Each entry stores [zh] -> (correct answer, COT answer). Neighbours are still
+        found with the translator's sentence KNN index; only the COT round-trips are
+        replaced by lookups. An entry whose correct answer changed is treated as missing.
+
+        Args:
+            path (str): JSON file holding the bank.
+            stamp (dict): Current model, prompt and datastore settings (see bank_stamp).
+        """
+        self.path = path
+        self.stamp = stamp
+        self.entries = {}
+        self.dirty = False
+        self._lock = threading.Lock()
+
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            if data.get("stamp") == stamp:
+                self.entries = data["entries"]
+                print(f"Loaded mistake bank from {path}. Number of entries: {len(self.entries)}.")
+            else:
+                print(f"Mistake bank {path} was built with different settings; it will be refreshed.")
+                self.dirty = True
+
+    def restamp(self, stamp):
+        """Switch to new settings (e.g. after a datastore reload), dropping every entry if they changed."""
+        with self._lock:
+            if stamp == self.stamp:
+                return
+            self.stamp = stamp
+            self.entries = {}
+            self.dirty = True
+        print(f"Mistake bank {self.path}: settings changed; entries dropped.")
+
+    def get(self, chinese, correct):
+        # 批次評估時多個執行緒同時查詢與寫入
+        with self._lock:
+            entry = self.entries.get(chinese)
+        if entry is None or entry["correct"] != correct:
+            return None
+        return entry["llm_answer"]
+
+    def add(self, chinese, correct, llm_answer):
+        with self._lock:
+            self.entries[chinese] = {"correct": correct, "llm_answer": llm_answer}
+            self.dirty = True
+
+    def stale(self, datastore):
+        """Return datastore sentences ({zh: amis}) that are missing or out of date in the bank."""
+        return [chinese for chinese, correct in datastore.items() if self.get(chinese, correct) is None]
+
+    def prune(self, datastore):
+        """Drop entries for sentences no longer in the datastore."""
+        with self._lock:
+            removed = [chinese for chinese in self.entries if chinese not in datastore]
+            for chinese in removed:
+                del self.entries[chinese]
+            if removed:
+                self.dirty = True
+        return len(removed)
+
+    def save(self):
+        with self._lock:
+            if not self.dirty:
+                return
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump({"stamp": self.stamp, "entries": self.entries}, file, ensure_ascii=False, indent=4)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+            count = len(self.entries)
+        print(f"Mistake bank saved to {self.path}. Number of entries: {count}.")
+
+    def refresh(self, translator, datastore, workers=1, save_every=50):
+        """
+        COT-translate every missing or outdated datastore sentence and save the bank.
+
+        Args:
+            translator (Ch2AmisTranslator): Translator whose KNN datastore is datastore.
+            datastore (dict): {zh: amis} sentences the bank should cover.
+            workers (int): Concurrent COT translations.
+            save_every (int): Checkpoint interval in finished sentences.
+        """
+        removed = self.prune(datastore)
+        pending = self.stale(datastore)
+        print(f"Mistake bank refresh: {len(pending)} to translate, {removed} removed.")
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = {executor.submit(translator.translate, chinese, "COT"): chinese for chinese in pending}
+            for done, future in enumerate(tqdm(as_completed(futures), total=len(futures), desc="Building mistake bank"), 1):
+                chinese = futures[future]
+                self.add(chinese, datastore[chinese], future.result())
+                if done % save_every == 0:
+                    self.save()
+        self.save()
+
+
+# Build / refresh the bank for the configured language: python -m src.models.mistake_bank
+if __name__ == "__main__":
+    from src.models.translation import Ch2AmisTranslator
+    from src.utils.dataset_utils import DatasetUtils
+
+    config_defaults = config_parser.get_combined_config()
+    args = config_parser.parse_arguments(config_defaults)
+    args.use_mistake_bank = True
+
+    data_utils = DatasetUtils(args.emb_model, args.compact_storage, **config_parser.embedding_options(args))
+    all_ch2amis = DatasetUtils._load_json(args.sentences_path, invert=True)
+    sentence_embeddings = data_utils._load_embeddings(args.sentence_embedding_path, all_ch2amis)
+
+    translator = Ch2AmisTranslator(args, sentence_embeddings)
+    datastore = {chinese: all_ch2amis[chinese] for chinese in sentence_embeddings.keys()}
+    translator.mistake_bank.refresh(translator, datastore, args.gpt_max_concurrency)
@@ -0,0 +1,34 @@
+import time
+import threading
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        """
+        Token bucket refilled continuously at per_minute units per minute.
+
+        Args:
+            per_minute (float): Bucket capacity and refill rate; 0 disables the limit.
+        """
+        self.capacity = float(per_minute or 0)
+        self.tokens = self.capacity
+        self.rate = self.capacity / 60.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        """Block until amount units are available, then take them."""
+        if self.capacity <= 0:
+            return
+        # 單次請求超過容量時，最多等待一整桶
+        amount = min(float(amount), self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
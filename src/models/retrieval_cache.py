@@ -0,0 +1,60 @@
+import threading
+from collections import OrderedDict
+
+
+class RetrievalCache:
+    def __init__(self, max_entries=2000):
+        """
+        Bounded in-memory LRU of assembled retrieval contexts (the strings find_knn_examples returns).
+
+        Keys carry the cache version, which invalidate() bumps whenever the datastore or
+        lexicon changes; results computed against the old data are then never stored.
+
+        Args:
+            max_entries (int): Maximum number of example strings kept.
+        """
+        self.max_entries = max_entries
+        self.version = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, sentence, k, findlexicon):
+        return (self.version, sentence, k, findlexicon)
+
+    def get(self, key):
+        with self._lock:
+            examples = self._memory.get(key)
+            if examples is None:
+                self.misses += 1
+                return None
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return examples
+
+    def put(self, key, examples):
+        with self._lock:
+            # 查詢途中資料已更新：結果作廢，不寫入
+            if key[0] != self.version:
+                return
+            self._memory[key] = examples
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def invalidate(self):
+        """Drop every entry and start a new version (call after the datastore or lexicon changed)."""
+        with self._lock:
+            self.version += 1
+            self._memory.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": len(self._memory),
+            "version": self.version,
+        }
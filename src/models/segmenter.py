@@ -0,0 +1,137 @@
+import os
+import re
+import json
+import hashlib
+import argparse
+import threading
+
+# jieba 斷詞：前綴字典（詞 -> 詞頻）預先建好存成 JSON（比 jieba 自帶的 marshal 快取載入快，
+# 且讀檔不會執行任何程式碼），第一次實際斷詞時才 import jieba 並載入字典。
+_SEGMENTERS = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def lexicon_user_words(lexicon_list):
+    """Multi-character Chinese glosses of a lexicon (parenthesised notes removed), for jieba user words."""
+    words = set()
+    for glosses in lexicon_list:
+        for gloss in glosses:
+            word = re.sub(r"\(.*?\)", "", gloss).strip()
+            if len(word) > 1 and not re.search(r"\s", word):
+                words.add(word)
+    return sorted(words)
+
+
+def dictionary_path(dict_dir, user_words=()):
+    """Prebuilt dictionary file for a user-word set (the plain jieba dictionary when empty)."""
+    if not user_words:
+        return os.path.join(dict_dir, "jieba.json")
+    digest = hashlib.sha1("\n".join(user_words).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(dict_dir, f"jieba_{digest}.json")
+
+
+def _source_stamp(jieba):
+    # jieba 版本或內建字典變了就重建
+    return [jieba.__version__, os.path.getmtime(os.path.join(os.path.dirname(jieba.__file__), jieba.DEFAULT_DICT_NAME))]
+
+
+class Segmenter:
+    def __init__(self, dict_dir=None, user_words=()):
+        """
+        jieba tokenizer backed by a prebuilt prefix dictionary.
+
+        Args:
+            dict_dir (str): Directory of the prebuilt dictionaries; None keeps jieba's own loading.
+            user_words (iterable): Words added to the dictionary (e.g. lexicon glosses).
+        """
+        self.user_words = tuple(sorted(set(user_words)))
+        self.path = dictionary_path(dict_dir, self.user_words) if dict_dir else None
+        self._tokenizer = None
+        self._lock = threading.Lock()
+
+    def _read(self, jieba):
+        # 檔案缺漏、損毀或格式不符都改用 jieba 重建，不讓斷詞因快取失敗
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data["stamp"] != _source_stamp(jieba):
+                return None
+            freq, total = data["freq"], int(data["total"])
+            if not isinstance(freq, dict):
+                return None
+        except Exception:
+            return None
+        tokenizer = jieba.Tokenizer()
+        tokenizer.FREQ, tokenizer.total = freq, total
+        tokenizer.initialized = True
+        return tokenizer
+
+    def build(self):
+        """Build the prefix dictionary from jieba's default dictionary and the user words, and save it."""
+        import jieba
+        tokenizer = jieba.Tokenizer()
+        tokenizer.initialize()
+        for word in self.user_words:
+            tokenizer.add_word(word)
+        if self.path:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({"stamp": _source_stamp(jieba), "total": tokenizer.total, "freq": tokenizer.FREQ}, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(temp_path, self.path)
+        return tokenizer
+
+    def initialize(self):
+        """Load the dictionary now (the first cut() does this otherwise)."""
+        with self._lock:
+            if self._tokenizer is None:
+                import jieba
+                tokenizer = self._read(jieba) if self.path else None
+                if tokenizer is None:
+                    if self.path:
+                        print(f"Building jieba dictionary {self.path} ...")
+                    tokenizer = self.build()
+                self._tokenizer = tokenizer
+        return self._tokenizer
+
+    def cut(self, sentence):
+        tokenizer = self._tokenizer or self.initialize()
+        return tokenizer.cut(sentence, cut_all=False)
+
+
+def get_segmenter(dict_dir=None, user_words=()):
+    """Shared Segmenter per (dictionary directory, user-word set); languages without user words share one."""
+    segmenter = Segmenter(dict_dir, user_words)
+    key = (dict_dir, segmenter.user_words)
+    with _REGISTRY_LOCK:
+        return _SEGMENTERS.setdefault(key, segmenter)
+
+
+# Prebuild: python -m src.models.segmenter [--jieba_user_words] [--languages ...]
+if __name__ == "__main__":
+    import time
+    import src.utils.config_parser as config_parser
+    from src.models.language_registry import discover_languages
+    from src.utils.dataset_utils import DatasetUtils
+
+    defaults = config_parser.load_config()
+    parser = argparse.ArgumentParser(description="Prebuild the jieba dictionaries used for lexicon fallback segmentation.")
+    parser.add_argument("--base_path", type=str, default=defaults["base_path"])
+    parser.add_argument("--jieba_dict_dir", type=str, default=defaults["jieba_dict_dir"])
+    parser.add_argument("--jieba_user_words", action=argparse.BooleanOptionalAction, default=defaults["jieba_user_words"],
+                        help="Also build one dictionary per language with its lexicon glosses as user words.")
+    parser.add_argument("--languages", type=str, nargs="+", default=None, help="Languages to build (default: every corpus under --base_path).")
+    cli_args = parser.parse_args()
+
+    word_sets = [("default", ())]
+    if cli_args.jieba_user_words:
+        for language in cli_args.languages or discover_languages(cli_args.base_path):
+            _, lexicon_list = DatasetUtils._load_lexicon(os.path.join(cli_args.base_path, f"{language}_lexicon.json"))
+            word_sets.append((language, lexicon_user_words(lexicon_list)))
+
+    for name, words in word_sets:
+        segmenter = Segmenter(cli_args.jieba_dict_dir, words)
+        segmenter.build()
+        start = time.perf_counter()
+        segmenter.initialize()
+        print(f"{name}: {segmenter.path} ({len(words)} user words), loads in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,118 @@
+import re
+import json
+import time
+import hashlib
+import argparse
+import threading
+from typing import Union
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import src.utils.instrumentation as instrumentation
+
+# 取 prompt 中第一個檢索到的阿美語例句作為「翻譯」
+AMIS_LINE = re.compile(r"^\[amis\]:\s*(.+)$", re.MULTILINE)
+
+
+def stub_answer(messages):
+    """Deterministic answer for a chat request: the first [amis] example of the last message, else a hash."""
+    content = messages[-1]["content"]
+    match = AMIS_LINE.search(content)
+    if match:
+        return match.group(1).strip()
+    return "stub-" + hashlib.sha1(content.encode("utf-8")).hexdigest()[:12]
+
+
+class StubLLM():
+    """
+    Offline stand-in for GPT with the same get_response / get_responses interface.
+
+    The answer is derived from the prompt alone (see stub_answer), so runs are
+    deterministic and need no API key or network.
+    """
+    def __init__(self, model: str = "stub", latency: float = 0.0, max_concurrency: int = 4):
+        self.model = model
+        self.cache = None
+        self.latency = latency
+        self.max_concurrency = max(1, max_concurrency)
+        self.calls = 0
+        self._lock = threading.Lock()
+        print(f"Initalized stub LLM (latency {latency:.3f}s); no API requests will be made")
+
+    def get_response(self, prompt: Union[str, list[dict[str, str]]], model: str = None, max_output_tokens: int = 512, temperature: float = 0):
+        messages = prompt if type(prompt) == list else [{"role": "user", "content": prompt}]
+        with self._lock:
+            self.calls += 1
+        instrumentation.count("llm_calls")
+        if self.latency > 0:
+            with instrumentation.timed("llm"):
+                time.sleep(self.latency)
+        return stub_answer(messages)
+
+    def get_responses(self, prompts: list, model: str = None, max_output_tokens: int = 512, temperature: float = 0):
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            return list(executor.map(lambda prompt: self.get_response(prompt, model, max_output_tokens, temperature), prompts))
+
+
+class StubCompletionHandler(BaseHTTPRequestHandler):
+    """OpenAI-compatible POST .../chat/completions answering with stub_answer after a fixed delay."""
+    latency = 0.0
+
+    def do_POST(self):
+        if not self.path.endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        messages = body["messages"]
+        if self.latency > 0:
+            time.sleep(self.latency)
+        answer = stub_answer(messages)
+        # 粗估 token：中文約一字一 token
+        prompt_tokens = sum(len(message["content"]) for message in messages)
+        reply = {
+            "id": "stub-" + hashlib.sha1(json.dumps(messages, ensure_ascii=False).encode("utf-8")).hexdigest()[:12],
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": answer}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(answer), "total_tokens": prompt_tokens + len(answer)},
+        }
+        data = json.dumps(reply, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_stub(host="127.0.0.1", port=0, latency=0.0):
+    """
+    Start the OpenAI-compatible stub server in a background thread.
+
+    Returns:
+        tuple: (server, base_url) -- pass base_url as --gpt_base_url; call server.shutdown() to stop.
+    """
+    handler = type("StubHandler", (StubCompletionHandler,), {"latency": latency})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stub-llm-server", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+# Stub server: python -m src.models.stub_llm --port 18555 --latency_ms 200
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub LLM server with a fixed response latency.")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18555)
+    parser.add_argument("--latency_ms", type=float, default=0.0, help="Delay before each response.")
+    cli_args = parser.parse_args()
+
+    server, base_url = serve_stub(cli_args.host, cli_args.port, cli_args.latency_ms / 1000)
+    print(f"Stub LLM server listening on {base_url} (use --gpt_base_url {base_url})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
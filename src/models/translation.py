@@ -1,12 +1,15 @@
 import json
 import random
+import threading
 import src.utils.config_parser as config_parser
-from src.models.callLLM import GPT
+from src.models.callLLM import build_llm
+from src.models.mistake_bank import MistakeBank, bank_stamp
 from src.models.knn import KNNRetriever
 from src.utils.dataset_utils import DatasetUtils
+import src.utils.instrumentation as instrumentation
 
 class Ch2AmisTranslator:
-    def __init__(self, args, sentences_emb):
+    def __init__(self, args, sentences_emb, llm=None):
         self.knn = KNNRetriever(args, sentences_emb)
         self.knn_k = args.Knn_k
         self.lfm_num = args.LFM_num
@@ -14,14 +17,20 @@ class Ch2AmisTranslator:
         self.findlexicon = args.findlexicon
         self.sentences_emb = sentences_emb
         
-        self.llm = GPT(args.openai_api_key, args.gpt_model)
+        self.llm = llm if llm is not None else build_llm(args)
         
         self.rpc_prompt_path = args.rpc_prompt_path
         self.cot_prompt_path = args.cot_prompt_path
         self.lfm_prompt_path = args.lfm_prompt_path
-        self.all_ch2amis = DatasetUtils(args.emb_model)._load_json(args.sentences_path, invert=True)
+        self.all_ch2amis = self.knn.all_ch2amis
+        
+        # Precomputed COT answers for LFM's wrong examples (None = translate live)
+        self.args = args
+        self.mistake_bank = MistakeBank(args.mistake_bank_path, bank_stamp(args, sentences_emb)) if args.use_mistake_bank else None
         
         self.LFM_in_context_examples = None
+        self.rng = random.Random(args.seed)
+        self._incexp_lock = threading.Lock()
 
     def _get_rpc_prompt(self, input_sentence: str, examples: str) -> str:
         try:
@@ -48,8 +57,12 @@ class Ch2AmisTranslator:
     def create_wrong_set(self, topN_sentences):
         wr = []
         for i in topN_sentences:
-            #翻譯 (knn func 已排除找到原句的狀況)
-            response = self.translate(i[0], "COT")
+            # 先查 mistake bank，沒有才即時翻譯 (knn func 已排除找到原句的狀況)
+            response = self.mistake_bank.get(i[0], i[1]) if self.mistake_bank is not None else None
+            if response is None:
+                response = self.translate(i[0], "COT")
+                if self.mistake_bank is not None:
+                    self.mistake_bank.add(i[0], i[1], response)
             wr.append([i[0], response, i[1]])
         return wr
     
@@ -64,8 +77,9 @@ class Ch2AmisTranslator:
     # get in-context-learning examples for LFM
     def get_incexp(self, k):
         pf = set()
+        keys = list(self.sentences_emb.keys())
         while len(pf) < k:
-            temp = random.choice(list(self.sentences_emb.keys()))
+            temp = self.rng.choice(keys)
             temp = (temp, self.all_ch2amis[temp])
             if temp not in pf:
                 pf.add(temp)
@@ -100,44 +114,94 @@ class Ch2AmisTranslator:
         except FileNotFoundError:
             raise FileNotFoundError(f"Prompt 文件 {self.lfm_prompt_path} 找不到，請檢查文件是否存在。")
     
-    def translate(self, sentence, mode):
-        if mode == "RPC":
-            examples = self.knn.find_knn_examples(sentence, self.knn_k, self.findlexicon)
-            prompt_content = self._get_rpc_prompt(sentence, examples)
-            response = self.llm.get_response(prompt_content)
-            return response
+    def translate_modes(self, sentence, modes, examples=None):
+        """
+        Translate one sentence in several modes, sharing the stages they have in common.
+
+        KNN retrieval and lexicon lookup run once and feed every mode, and the COT
+        answer is handed to LFM as its initial translation instead of being redone.
+
+        Args:
+            sentence (str): The Chinese input sentence.
+            modes (list): Any of "RPC", "COT", "LFM".
+            examples (str): Retrieval context prefetched with knn.find_knn_examples_batch (optional).
+
+        Returns:
+            dict: mode -> translation.
+        """
+        for mode in modes:
+            if mode not in ("RPC", "COT", "LFM"):
+                raise ValueError(f"Translation mode {mode} not supported.")
         
-        if mode == "COT":
-            examples = self.knn.find_knn_examples(sentence, self.knn_k, self.findlexicon)
-            prompt_content = self._get_cot_prompt(sentence, examples)
-            response = self.llm.get_response(prompt_content)
-            return response
-        elif mode == "LFM":
-            # get in-context-learning examples
-            if self.LFM_in_context_examples is None:
-                self.LFM_in_context_examples = self.get_incexp(self.lfm_ict_num)
-            
-            # get wrong example
-            wrong_example = self.find_wrong_example(sentence, self.lfm_num)
-            
-            # get initial translation
-            examples = self.knn.find_knn_examples(sentence, self.knn_k, self.findlexicon)
-            init_translation = self.translate(sentence, "COT")
-            
-            prompt_content = self._get_lfm_prompt(sentence, examples, init_translation, wrong_example)
-            response = self.llm.get_response(prompt_content)
-            return response
+        results = {}
+        if examples is None:
+            with instrumentation.timed("retrieval"):
+                examples = self.knn.find_knn_examples(sentence, self.knn_k, self.findlexicon)
+        
+        if "RPC" in modes:
+            with instrumentation.mode_scope("RPC"):
+                with instrumentation.timed("prompt"):
+                    prompt_content = self._get_rpc_prompt(sentence, examples)
+                results["RPC"] = self.llm.get_response(prompt_content)
+        
+        if "COT" in modes or "LFM" in modes:
+            # COT 答案同時是 LFM 的初始翻譯；只跑 LFM 時記在 LFM 名下
+            with instrumentation.mode_scope("COT" if "COT" in modes else "LFM"):
+                with instrumentation.timed("prompt"):
+                    prompt_content = self._get_cot_prompt(sentence, examples)
+                cot_response = self.llm.get_response(prompt_content)
+            if "COT" in modes:
+                results["COT"] = cot_response
+        
+        if "LFM" in modes:
+            with instrumentation.mode_scope("LFM"):
+                # get in-context-learning examples (once, shared by concurrent callers)
+                if self.LFM_in_context_examples is None:
+                    with self._incexp_lock:
+                        if self.LFM_in_context_examples is None:
+                            self.LFM_in_context_examples = self.get_incexp(self.lfm_ict_num)
+                
+                # get wrong example
+                wrong_example = self.find_wrong_example(sentence, self.lfm_num)
+                
+                # initial translation = COT answer from above
+                with instrumentation.timed("prompt"):
+                    prompt_content = self._get_lfm_prompt(sentence, examples, cot_response, wrong_example)
+                results["LFM"] = self.llm.get_response(prompt_content)
+        
+        return results
+    
+    def prefetch_examples(self, sentences):
+        """Retrieve the examples of many sentences at once; returns {sentence: examples}."""
+        sentences = list(dict.fromkeys(sentences))
+        with instrumentation.timed("retrieval"):
+            return dict(zip(sentences, self.knn.find_knn_examples_batch(sentences, self.knn_k, self.findlexicon)))
+    
+    def reload(self):
+        """Pick up edits to the sentence and lexicon files (see KNNRetriever.refresh)."""
+        self.knn.refresh()
+        # get_incexp 在 _incexp_lock 內讀這兩個欄位，一起換掉
+        with self._incexp_lock:
+            self.sentences_emb = self.knn.sentences_emb
+            self.all_ch2amis = self.knn.all_ch2amis
+            self.LFM_in_context_examples = None
+        # bank 的 COT 答案依賴舊的 datastore
+        if self.mistake_bank is not None:
+            self.mistake_bank.restamp(bank_stamp(self.args, self.sentences_emb))
+    
+    def close(self):
+        if self.mistake_bank is not None:
+            self.mistake_bank.save()
+    
+    def translate(self, sentence, mode):
+        if mode in ("RPC", "COT", "LFM"):
+            return self.translate_modes(sentence, [mode])[mode]
         elif mode == "ALL":
-            print("Testing RPC...")
-            rpc_response = self.translate(sentence, "RPC")
-            print("[RPC response]:", rpc_response)
-            print("Testing COT...")
-            cot_response = self.translate(sentence, "COT")
-            print("[COT response]:", cot_response)
-            print("Testing LFM...")
-            lfm_response = self.translate(sentence, "LFM")
-            print("[LFM response]:", lfm_response)
-            return {"RPC": rpc_response, "COT": cot_response, "LFM": lfm_response}
+            results = self.translate_modes(sentence, ["RPC", "COT", "LFM"])
+            print("[RPC response]:", results["RPC"])
+            print("[COT response]:", results["COT"])
+            print("[LFM response]:", results["LFM"])
+            return results
         else:
             raise ValueError(f"Translation mode {mode} not supported.")
 
@@ -147,8 +211,8 @@ if __name__ == "__main__":
     args = config_parser.parse_arguments(config_defaults)
     
     # Initialize the translator
-    data_utils = DatasetUtils(args.emb_model)
-    all_ch2amis = data_utils._load_json(args.sentences_path, invert=True)
+    data_utils = DatasetUtils(args.emb_model, args.compact_storage, **config_parser.embedding_options(args))
+    all_ch2amis = DatasetUtils._load_json(args.sentences_path, invert=True)
     sentence_embeddings = data_utils._load_embeddings(args.sentence_embedding_path, all_ch2amis)
     
     translator = Ch2AmisTranslator(args, sentence_embeddings)
@@ -161,6 +225,8 @@ if __name__ == "__main__":
     print("Translation mode:", args.translation_mode)
     result  = translator.translate(args.input_sentence, args.translation_mode)
     print("Translation:", result)
+    if translator.mistake_bank is not None:
+        translator.mistake_bank.save()
     print("Test completed")
     
     
@@ -0,0 +1,379 @@
+import json
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import src.utils.config_parser as config_parser
+from src.models.embedding import get_embedding_model
+from src.models.language_registry import LanguageRegistry
+import src.utils.instrumentation as instrumentation
+
+MODES = ("RPC", "COT", "LFM", "ALL")
+
+
+class MicroBatcher:
+    def __init__(self, fn, max_batch=16, max_wait=0.01):
+        """
+        Gather items submitted by concurrent callers and process them in one call.
+
+        The first item of a batch waits at most max_wait seconds for others to join,
+        so a lone request pays only that delay.
+
+        Args:
+            fn (callable): Maps a list of items to {item: result}.
+            max_batch (int): Most items per call.
+            max_wait (float): Seconds to wait for a batch to fill.
+        """
+        self.fn = fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait)
+        self._queue = queue.Queue()
+        self._closed = False
+        self._state_lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, item):
+        future = Future()
+        with self._state_lock:
+            if not self._closed:
+                self._queue.put((item, future))
+                return future
+        # 已關閉：直接在呼叫端執行
+        self._process([(item, future)])
+        return future
+
+    def close(self):
+        """Stop the worker once the items already queued are processed."""
+        with self._state_lock:
+            if not self._closed:
+                self._closed = True
+                self._queue.put(None)
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                self._queue.put(None)   # 下一輪再結束
+                break
+            batch.append(entry)
+        return batch
+
+    def _process(self, batch):
+        try:
+            results = self.fn([item for item, _ in batch])
+            for item, future in batch:
+                future.set_result(results[item])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            self._process(batch)
+
+
+class LanguageWorker:
+    def __init__(self, translator, batcher):
+        """Warm translator of one language with its retrieval micro-batcher."""
+        self.translator = translator
+        self.batcher = batcher
+
+    def close(self):
+        self.batcher.close()
+        self.translator.close()
+
+
+class TranslationService:
+    def __init__(self, args, max_batch=16, max_wait_ms=10.0):
+        """
+        Warm translators for every language under args.base_path, shared by all requests.
+
+        Languages load on first use through a LanguageRegistry (one embedding model and
+        one LLM client for all of them). Embedding and FAISS retrieval of concurrent
+        requests for the same language run as one micro-batch; the LLM calls then
+        proceed per request on the handler threads.
+        """
+        self.args = args
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.registry = LanguageRegistry(args, self._build_worker, args.max_languages, args.language_idle_seconds)
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.requests = {}              # (language, mode, status) -> count
+        self.completed = {}             # language -> count
+        self.request_seconds = {}       # language -> total seconds
+        self.retrieval_seconds = {}     # language -> total seconds
+        self.batches = {}               # language -> [micro-batches, sentences]
+
+        if args.language_idle_seconds > 0:
+            threading.Thread(target=self._janitor, name="language-janitor", daemon=True).start()
+
+    def _build_worker(self, args, llm):
+        translator = LanguageRegistry._build_translator(args, llm)
+        language = args.language
+
+        def prefetch(sentences):
+            # 計數放在 service，語言被卸載後 counter 也不會倒退
+            with self._lock:
+                counts = self.batches.setdefault(language, [0, 0])
+                counts[0] += 1
+                counts[1] += len(sentences)
+            return translator.prefetch_examples(sentences)
+
+        return LanguageWorker(translator, MicroBatcher(prefetch, self.max_batch, self.max_wait))
+
+    def _janitor(self):
+        interval = min(60.0, self.args.language_idle_seconds / 2)
+        while True:
+            time.sleep(interval)
+            self.registry.evict_idle()
+
+    def warm_up(self, language=None):
+        # 先跑一次檢索：載入 BERT、jieba 字典與 FAISS 索引
+        start = time.perf_counter()
+        translator = self.registry.get(language).translator
+        translator.knn.segmenter.initialize()
+        translator.prefetch_examples([next(iter(translator.all_ch2amis))])
+        print(f"Warm-up retrieval done in {time.perf_counter() - start:.2f}s")
+
+    def count(self, language, mode, status):
+        with self._lock:
+            key = (language, mode, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def translate(self, sentence, mode, language=None):
+        language = language or self.args.language
+        modes = ["RPC", "COT", "LFM"] if mode == "ALL" else [mode]
+        with self._lock:
+            self.in_flight += 1
+        start = time.perf_counter()
+        try:
+            worker = self.registry.get(language)
+            examples = worker.batcher.submit(sentence).result()
+            retrieval = time.perf_counter() - start
+            results = worker.translator.translate_modes(sentence, modes, examples)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.completed[language] = self.completed.get(language, 0) + 1
+            self.request_seconds[language] = self.request_seconds.get(language, 0.0) + elapsed
+            self.retrieval_seconds[language] = self.retrieval_seconds.get(language, 0.0) + retrieval
+        return {
+            "sentence": sentence,
+            "language": language,
+            "mode": mode,
+            "translation": results if mode == "ALL" else results[mode],
+            "retrieval_ms": round(retrieval * 1000, 2),
+            "elapsed_ms": round(elapsed * 1000, 2),
+        }
+
+    def reload(self, language=None):
+        """Re-read a loaded language's corpus files; unloaded languages sync on their next load."""
+        language = language or self.args.language
+        if language not in self.registry.loaded():
+            return {"language": language, "reloaded": False}
+        start = time.perf_counter()
+        translator = self.registry.get(language).translator
+        translator.reload()
+        return {
+            "language": language,
+            "reloaded": True,
+            "datastore_sentences": len(translator.all_ch2amis),
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
+        }
+
+    def health(self):
+        return {
+            "status": "ok",
+            "uptime_s": round(time.time() - self.started, 1),
+            "languages": self.registry.languages,
+            "loaded_languages": self.registry.loaded(),
+            "in_flight": self.in_flight,
+        }
+
+    def metrics(self):
+        """Prometheus text exposition of the service counters."""
+        # 計數器由處理請求的執行緒更新：在鎖內取一致的快照
+        with self._lock:
+            requests = sorted(self.requests.items())
+            completed = dict(self.completed)
+            totals = [("request", sorted(self.request_seconds.items())), ("retrieval", sorted(self.retrieval_seconds.items()))]
+            batches = sorted((language, tuple(counts)) for language, counts in self.batches.items())
+            in_flight = self.in_flight
+        lines = ["# TYPE ch2amis_requests_total counter"]
+        lines += [f'ch2amis_requests_total{{language="{language}",mode="{mode}",status="{status}"}} {count}'
+                  for (language, mode, status), count in requests]
+        for name, seconds_by_language in totals:
+            lines.append(f"# TYPE ch2amis_{name}_seconds summary")
+            for language, seconds in seconds_by_language:
+                lines.append(f'ch2amis_{name}_seconds_sum{{language="{language}"}} {seconds:.6f}')
+                lines.append(f'ch2amis_{name}_seconds_count{{language="{language}"}} {completed[language]}')
+        lines.append("# TYPE ch2amis_microbatches_total counter")
+        lines += [f'ch2amis_microbatches_total{{language="{language}"}} {count}'
+                  for language, (count, _) in batches]
+        lines.append("# TYPE ch2amis_microbatch_sentences_total counter")
+        lines += [f'ch2amis_microbatch_sentences_total{{language="{language}"}} {sentences}'
+                  for language, (_, sentences) in batches]
+        lines += [
+            "# TYPE ch2amis_in_flight_requests gauge",
+            f"ch2amis_in_flight_requests {in_flight}",
+            "# TYPE ch2amis_loaded_languages gauge",
+            f"ch2amis_loaded_languages {len(self.registry.loaded())}",
+        ]
+        embedding_cache = get_embedding_model(self.args.emb_model).cache
+        if embedding_cache is not None:
+            for name, value in embedding_cache.stats().items():
+                lines.append(f"ch2amis_embedding_cache_{name} {value}")
+        llm_cache = getattr(self.registry.llm, "cache", None)
+        if llm_cache is not None:
+            for name, value in llm_cache.stats().items():
+                lines.append(f"ch2amis_llm_cache_{name} {value}")
+        for language in self.registry.loaded():
+            worker = self.registry.peek(language)
+            retrieval_cache = worker.translator.knn.retrieval_cache if worker is not None else None
+            if retrieval_cache is not None:
+                for name, value in retrieval_cache.stats().items():
+                    lines.append(f'ch2amis_retrieval_cache_{name}{{language="{language}"}} {value}')
+        text = "\n".join(lines) + "\n"
+        if instrumentation.enabled():
+            text += instrumentation.prometheus_text()
+        return text
+
+    def close(self):
+        self.registry.close()
+
+
+class TranslationHandler(BaseHTTPRequestHandler):
+    service = None      # set by serve()
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status, body, content_type="application/json; charset=utf-8"):
+        data = body.encode("utf-8") if isinstance(body, str) else json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send(200, self.service.health())
+        elif self.path == "/metrics":
+            self._send(200, self.service.metrics(), "text/plain; version=0.0.4")
+        else:
+            self._send(404, {"error": f"Unknown path {self.path}"})
+
+    def _read_body(self):
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            # 無法得知請求內容的長度：回應後關閉連線，不讓殘留的內容被當成下一個請求
+            self.close_connection = True
+            raise ValueError("Invalid Content-Length header.")
+        return self.rfile.read(length) if length > 0 else b""
+
+    def _read_json(self):
+        request = json.loads(self._read_body() or b"{}")
+        if not isinstance(request, dict):
+            raise ValueError("Request body must be a JSON object.")
+        return request
+
+    def do_POST(self):
+        if self.path == "/reload":
+            self._reload()
+            return
+        if self.path != "/translate":
+            # keep-alive 連線：先讀掉請求內容再回應
+            try:
+                self._read_body()
+            except ValueError:
+                pass
+            self._send(404, {"error": f"Unknown path {self.path}"})
+            return
+        try:
+            request = self._read_json()
+            sentence = request.get("sentence", "").strip()
+            mode = request.get("mode", "RPC")
+            language = request.get("language") or self.service.args.language
+            if not sentence:
+                raise ValueError("Field 'sentence' is required.")
+            if mode not in MODES:
+                raise ValueError(f"Translation mode {mode} not supported.")
+            if language not in self.service.registry.languages:
+                raise ValueError(f"Language {language} not found. Available: {', '.join(self.service.registry.languages)}.")
+        except (ValueError, AttributeError) as e:
+            self._send(400, {"error": str(e)})
+            return
+
+        try:
+            result = self.service.translate(sentence, mode, language)
+        except Exception as e:
+            self.service.count(language, mode, "error")
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        self.service.count(language, mode, "ok")
+        self._send(200, result)
+
+    def _reload(self):
+        try:
+            language = self._read_json().get("language") or self.service.args.language
+            if language not in self.service.registry.languages:
+                raise ValueError(f"Language {language} not found. Available: {', '.join(self.service.registry.languages)}.")
+        except (ValueError, AttributeError) as e:
+            self._send(400, {"error": str(e)})
+            return
+        try:
+            self._send(200, self.service.reload(language))
+        except Exception as e:
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(service, host, port):
+    TranslationHandler.service = service
+    server = ThreadingHTTPServer((host, port), TranslationHandler)
+    server.daemon_threads = True
+    print(f"Translation server listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return server
+
+
+# Test
+if __name__ == "__main__":
+    config_defaults = config_parser.get_combined_config()
+    args = config_parser.parse_arguments(config_defaults)
+    instrumentation.enable(args.instrument)
+
+    # Load the default language up front; the others load on their first request
+    service = TranslationService(args, args.server_max_batch, args.server_max_wait_ms)
+    print("Languages:", ", ".join(service.registry.languages))
+    service.warm_up()
+    serve(service, args.host, args.port)
+
+    service.close()
+    print("Server stopped")
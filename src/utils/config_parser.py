@@ -20,6 +20,30 @@ def load_config(config_path="config.ini"):
         "LFM_ICT_num": config.getint("ch2amis", "LFM_ICT_num", fallback=2),
         "findlexicon": config.get("ch2amis", "Find_lexicon", fallback=True),
         "emb_model":config.get("ch2amis", "embedding_model", fallback="DMetaSoul/sbert-chinese-general-v2"),
+        "emb_batch_size": config.getint("ch2amis", "embedding_batch_size", fallback=32),
+        "emb_threads": config.getint("ch2amis", "embedding_threads", fallback=0),
+        "emb_backend": config.get("ch2amis", "embedding_backend", fallback="torch"),
+        "emb_seq_buckets": [int(length) for length in config.get("ch2amis", "embedding_seq_buckets", fallback="16,32,64,128,256,512").split(",") if length.strip()],
+        "jieba_dict_dir": config.get("ch2amis", "jieba_dict_dir", fallback="./data/jieba"),
+        "jieba_user_words": config.getboolean("ch2amis", "jieba_user_words", fallback=False),
+        "emb_cache_size": config.getint("cache", "embedding_cache_size", fallback=10000),
+        "emb_cache_path": config.get("cache", "embedding_cache_path", fallback=""),
+        "retrieval_cache_size": config.getint("cache", "retrieval_cache_size", fallback=2000),
+        "sentence_index": config.get("index", "sentence_index", fallback="flat"),
+        "lexicon_index": config.get("index", "lexicon_index", fallback="flat"),
+        "ivf_nlist": config.getint("index", "ivf_nlist", fallback=0),
+        "ivf_nprobe": config.getint("index", "ivf_nprobe", fallback=8),
+        "hnsw_m": config.getint("index", "hnsw_m", fallback=32),
+        "hnsw_ef_search": config.getint("index", "hnsw_ef_search", fallback=64),
+        "pq_m": config.getint("index", "pq_m", fallback=0),
+        "compact_storage": config.getboolean("index", "compact_storage", fallback=False),
+        "llm_cache_path": config.get("cache", "llm_cache_path", fallback=""),
+        "llm_cache_mode": config.get("cache", "llm_cache_mode", fallback="readwrite"),
+        "llm_cache_max_entries": config.getint("cache", "llm_cache_max_entries", fallback=100000),
+        "base_path": config.get('datapath', 'base_path', fallback="./data"),
+        "prompt_path": config.get('datapath', 'prompt_path', fallback="./src/prompt"),
+        "max_languages": config.getint('languages', 'max_loaded', fallback=2),
+        "language_idle_seconds": config.getfloat('languages', 'idle_seconds', fallback=1800),
         "sentences_path": config['datapath']['sentences'],
         "lexicon_path": config['datapath']['lexicon'],
         "sentence_embedding_path": config['datapath']['sentence_embedding'],
@@ -27,11 +51,28 @@ def load_config(config_path="config.ini"):
         "rpc_prompt_path": config['datapath']['rpc_prompt'],
         "cot_prompt_path": config['datapath']['cot_prompt'],
         "lfm_prompt_path": config['datapath']['lfm_prompt'],
+        "mistake_bank_path": config.get('datapath', 'mistake_bank', fallback="./data/mistake_bank.json"),
+        "use_mistake_bank": config.getboolean("ch2amis", "use_mistake_bank", fallback=False),
         "gpt_model": config['gpt']['model'],
         "gpt_temperature": config.getfloat('gpt', 'temperature', fallback=0.0),
         "gpt_max_output_tokens": config.getint('gpt', 'max_output_tokens', fallback=512),
+        "gpt_base_url": config.get('gpt', 'base_url', fallback=""),
+        "gpt_max_concurrency": config.getint('gpt', 'max_concurrency', fallback=4),
+        "gpt_requests_per_minute": config.getint('gpt', 'requests_per_minute', fallback=0),
+        "gpt_tokens_per_minute": config.getint('gpt', 'tokens_per_minute', fallback=0),
+        "gpt_max_retries": config.getint('gpt', 'max_retries', fallback=5),
         "batch_result_path": config['batch']['result_path'],
-        "batch_test_num": config.getint('batch', 'test_num', fallback=100)
+        "batch_test_num": config.getint('batch', 'test_num', fallback=100),
+        "batch_workers": config.getint('batch', 'workers', fallback=4),
+        "kfold": config.getint('batch', 'kfold', fallback=0),
+        "seed": config.getint('batch', 'seed') if config.get('batch', 'seed', fallback="").strip() else None,
+        "server_host": config.get('server', 'host', fallback="127.0.0.1"),
+        "server_port": config.getint('server', 'port', fallback=8000),
+        "server_max_batch": config.getint('server', 'max_batch', fallback=16),
+        "server_max_wait_ms": config.getfloat('server', 'max_wait_ms', fallback=10.0),
+        "stub_llm": config.getboolean('server', 'stub_llm', fallback=False),
+        "instrument": config.getboolean('instrumentation', 'enabled', fallback=False),
+        "stub_latency_ms": config.getfloat('server', 'stub_latency_ms', fallback=0.0)
     }
 
 def get_combined_config(config_path="config.ini"):
@@ -42,9 +83,44 @@ def get_combined_config(config_path="config.ini"):
     return config
 
 
-def parse_arguments(defaults):
-    """Parse command-line arguments, overriding config defaults."""
-    parser = argparse.ArgumentParser(description="Chinese-to-Amis translations.")
+def embedding_options(args):
+    """Collect the shared embedding model settings from parsed arguments."""
+    return {
+        "batch_size": args.emb_batch_size,
+        "num_threads": args.emb_threads,
+        "backend": args.emb_backend,
+        "seq_buckets": args.emb_seq_buckets,
+        "cache_size": args.emb_cache_size,
+        "cache_path": args.emb_cache_path,
+    }
+
+
+def index_options(args):
+    """Collect the FAISS index parameters from parsed arguments."""
+    return {
+        "nlist": args.ivf_nlist,
+        "nprobe": args.ivf_nprobe,
+        "hnsw_m": args.hnsw_m,
+        "ef_search": args.hnsw_ef_search,
+        "pq_m": args.pq_m,
+    }
+
+
+def llm_options(args):
+    """Collect the LLM client settings from parsed arguments or the config dict."""
+    get = args.get if isinstance(args, dict) else lambda key: getattr(args, key)
+    return {
+        "base_url": get("gpt_base_url"),
+        "max_concurrency": get("gpt_max_concurrency"),
+        "requests_per_minute": get("gpt_requests_per_minute"),
+        "tokens_per_minute": get("gpt_tokens_per_minute"),
+        "max_retries": get("gpt_max_retries"),
+    }
+
+
+def build_parser(defaults, description="Chinese-to-Amis translations."):
+    """Command-line parser with config defaults; tools may add their own options before parsing."""
+    parser = argparse.ArgumentParser(description=description)
     parser.add_argument("input_sentence", type=str, nargs="?", help="Input sentence to process.")
     parser.add_argument("--batch", action="store_true", help="Run in batch evaluation mode.")
     parser.add_argument("--language", type=str, default=defaults["language"], help="Language to translate to.")
@@ -53,20 +129,67 @@ def parse_arguments(defaults):
     parser.add_argument("--LFM_num", type=int, default=defaults["LFM_num"], help="Number of examples for LFM.")
     parser.add_argument("--LFM_ICT_num", type=int, default=defaults["LFM_ICT_num"], help="Number of in-context-learning examples for LFM.")
     parser.add_argument("--findlexicon", type=bool, default=defaults["findlexicon"], help="Whether to find lexicon.")
+    parser.add_argument("--base_path", type=str, default=defaults["base_path"], help="Directory holding the <language>_sentences/lexicon corpora.")
+    parser.add_argument("--prompt_path", type=str, default=defaults["prompt_path"], help="Directory holding the <language> prompt files.")
+    parser.add_argument("--max_languages", type=int, default=defaults["max_languages"], help="Most languages a multi-language server keeps loaded (0 = unbounded).")
+    parser.add_argument("--language_idle_seconds", type=float, default=defaults["language_idle_seconds"], help="Unload languages unused for this long (0 = never).")
     parser.add_argument("--sentences_path", type=str, default=defaults["sentences_path"], help="Path to the sentences file.")
     parser.add_argument("--lexicon_path", type=str, default=defaults["lexicon_path"], help="Path to the lexicon file.")
     parser.add_argument("--sentence_embedding_path", type=str, default=defaults["sentence_embedding_path"], help="Path to the sentence embedding file.")
     parser.add_argument("--lexicon_embedding_path", type=str, default=defaults["lexicon_embedding_path"], help="Path to the lexicon embedding file.")
     parser.add_argument("--emb_model", type=str, default=defaults["emb_model"], help="Type of embedding model to use.")
+    parser.add_argument("--emb_batch_size", type=int, default=defaults["emb_batch_size"], help="Number of sentences per embedding forward pass.")
+    parser.add_argument("--emb_threads", type=int, default=defaults["emb_threads"], help="Torch CPU threads for embedding (0 = torch default).")
+    parser.add_argument("--emb_backend", type=str, default=defaults["emb_backend"], choices=["torch", "int8", "torchscript"], help="Embedding inference backend.")
+    parser.add_argument("--emb_seq_buckets", type=int, nargs="+", default=defaults["emb_seq_buckets"], help="Token lengths embedding batches are grouped by.")
+    parser.add_argument("--emb_cache_size", type=int, default=defaults["emb_cache_size"], help="In-memory embedding cache entries (0 disables the cache).")
+    parser.add_argument("--emb_cache_path", type=str, default=defaults["emb_cache_path"], help="SQLite file persisting the embedding cache across runs.")
+    parser.add_argument("--retrieval_cache_size", type=int, default=defaults["retrieval_cache_size"], help="Retrieval contexts cached per language (0 disables the cache).")
+    parser.add_argument("--jieba_dict_dir", type=str, default=defaults["jieba_dict_dir"], help="Directory of the prebuilt jieba dictionaries.")
+    parser.add_argument("--jieba_user_words", action=argparse.BooleanOptionalAction, default=defaults["jieba_user_words"], help="Add the lexicon glosses to jieba as user words.")
+    parser.add_argument("--sentence_index", type=str, default=defaults["sentence_index"], help="Sentence datastore index type (flat, ivf, hnsw, ip, sq16, pq).")
+    parser.add_argument("--lexicon_index", type=str, default=defaults["lexicon_index"], help="Lexicon index type (flat, ivf, hnsw, ip, sq16, pq).")
+    parser.add_argument("--ivf_nlist", type=int, default=defaults["ivf_nlist"], help="IVF cluster count (0 = 4*sqrt(n)).")
+    parser.add_argument("--ivf_nprobe", type=int, default=defaults["ivf_nprobe"], help="IVF clusters searched per query.")
+    parser.add_argument("--hnsw_m", type=int, default=defaults["hnsw_m"], help="HNSW neighbours per node.")
+    parser.add_argument("--hnsw_ef_search", type=int, default=defaults["hnsw_ef_search"], help="HNSW search breadth.")
+    parser.add_argument("--pq_m", type=int, default=defaults["pq_m"], help="PQ sub-vectors per vector for index type pq (0 = dim/16).")
+    parser.add_argument("--compact_storage", action=argparse.BooleanOptionalAction, default=defaults["compact_storage"], help="Retrieve from float16 copies of the embedding stores (flat indexes become sq16), with an int32 lexicon mapping and an interned lexicon table.")
+    parser.add_argument("--llm_cache_path", type=str, default=defaults["llm_cache_path"], help="SQLite file caching LLM responses (empty disables the cache).")
+    parser.add_argument("--llm_cache_mode", type=str, default=defaults["llm_cache_mode"], choices=["off", "readwrite", "readonly", "replay"], help="LLM cache mode; replay never calls the API.")
+    parser.add_argument("--llm_cache_max_entries", type=int, default=defaults["llm_cache_max_entries"], help="Maximum cached LLM responses before eviction (0 = unbounded).")
     parser.add_argument("--rpc_prompt_path", type=str, default=defaults["rpc_prompt_path"], help="Path to the prompt file.")
     parser.add_argument("--cot_prompt_path", type=str, default=defaults["cot_prompt_path"], help="Path to the prompt file.")
     parser.add_argument("--lfm_prompt_path", type=str, default=defaults["lfm_prompt_path"], help="Path to the prompt file.")
+    parser.add_argument("--mistake_bank_path", type=str, default=defaults["mistake_bank_path"], help="Path to the LFM mistake bank file.")
+    parser.add_argument("--use_mistake_bank", action=argparse.BooleanOptionalAction, default=defaults["use_mistake_bank"], help="Use precomputed COT answers for LFM wrong examples.")
     parser.add_argument("--openai_api_key", type=str, default=defaults["env"]["openai_api_key"], help="OpenAI API key.")
     parser.add_argument("--gpt_model", type=str, default=defaults["gpt_model"], help="OpenAI GPT model to use.")
     parser.add_argument("--gpt_temperature", type=float, default=defaults["gpt_temperature"], help="Temperature for GPT sampling.")
     parser.add_argument("--gpt_max_output_tokens", type=int, default=defaults["gpt_max_output_tokens"], help="Maximum number of tokens to output.")
+    parser.add_argument("--gpt_base_url", type=str, default=defaults["gpt_base_url"], help="OpenAI-compatible API base URL (empty = OpenAI).")
+    parser.add_argument("--gpt_max_concurrency", type=int, default=defaults["gpt_max_concurrency"], help="Maximum number of in-flight LLM requests.")
+    parser.add_argument("--gpt_requests_per_minute", type=int, default=defaults["gpt_requests_per_minute"], help="LLM request rate limit (0 = unlimited).")
+    parser.add_argument("--gpt_tokens_per_minute", type=int, default=defaults["gpt_tokens_per_minute"], help="LLM token rate limit (0 = unlimited).")
+    parser.add_argument("--gpt_max_retries", type=int, default=defaults["gpt_max_retries"], help="Retries with exponential backoff on 429/5xx errors.")
+    parser.add_argument("--stub_llm", action=argparse.BooleanOptionalAction, default=defaults["stub_llm"], help="Answer with the offline stub LLM instead of calling the API.")
+    parser.add_argument("--stub_latency_ms", type=float, default=defaults["stub_latency_ms"], help="Simulated latency of each stub LLM call.")
+    parser.add_argument("--instrument", action=argparse.BooleanOptionalAction, default=defaults["instrument"], help="Record per-stage timings, counters and token usage.")
     parser.add_argument("--batch_result_path", type=str, default=defaults["batch_result_path"], help="Path to the batch result file.")
     parser.add_argument("--batch_test_num", type=int, default=defaults["batch_test_num"], help="Number of test cases to run in batch mode.")
-    return parser.parse_args()
+    parser.add_argument("--batch_workers", type=int, default=defaults["batch_workers"], help="Number of test sentences evaluated concurrently.")
+    parser.add_argument("--kfold", type=int, default=defaults["kfold"], help="Run K-fold cross-validation instead of a single split (0/1 = off).")
+    parser.add_argument("--seed", type=int, default=defaults["seed"], help="Random seed for test splits and LFM example sampling.")
+    parser.add_argument("--resume", type=str, nargs="?", const="latest", default=None, help="Resume a batch run: a result folder, or the latest one for the language when no path is given.")
+    parser.add_argument("--host", type=str, default=defaults["server_host"], help="Translation server bind address.")
+    parser.add_argument("--port", type=int, default=defaults["server_port"], help="Translation server port.")
+    parser.add_argument("--server_max_batch", type=int, default=defaults["server_max_batch"], help="Most concurrent requests retrieved in one micro-batch.")
+    parser.add_argument("--server_max_wait_ms", type=float, default=defaults["server_max_wait_ms"], help="How long a micro-batch waits for more requests.")
+    return parser
+
+
+def parse_arguments(defaults):
+    """Parse command-line arguments, overriding config defaults."""
+    return build_parser(defaults).parse_args()
 
 
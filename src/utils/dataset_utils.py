@@ -2,13 +2,20 @@ import os
 import re
 import json
 import numpy as np
-from tqdm import tqdm
-from src.models.embedding import EmbeddingModel
+from src.models.embedding import get_embedding_model
+from src.models.index_factory import index_file
+from src.utils.embedding_store import EmbeddingStore, store_dir, store_exists
+from src.models.index_factory import embeddings_fingerprint
 
 
 class DatasetUtils:
-    def __init__(self, model_name):
-        self.embedding_model = EmbeddingModel(model_name)
+    def __init__(self, model_name, compact=False, **model_options):
+        # Shared per-process model, loaded lazily on first embedding call
+        # (store rows are embedded by its store_model: float even with the int8 backend)
+        self.embedding_model = get_embedding_model(model_name, **model_options)
+        # compact_storage：另存 float16 的 store 來檢索，詞表 mapping 用 int32 陣列
+        self.compact = compact
+        self.store_dtype = "float16" if compact else "float32"
     
     @staticmethod
     def _load_json(path, invert=False):
@@ -23,55 +30,194 @@ class DatasetUtils:
         lexicon_list = [w[1] for w in lexicon]
         return lexicon, lexicon_list
 
+    @staticmethod
+    def _flatten_lexicon(lexicon_list):
+        # 詞表中每個中文詞義一筆，順序與 lexicon embedding 的列一致
+        return [lexicon for s_lexicon_list in lexicon_list for lexicon in s_lexicon_list]
+
+    def _same_model(self, store):
+        # 沒記錄模型的 store 視為相同；legacy 或其他模型的向量不能沿用
+        return not store.model_name or store.model_name == self.embedding_model.model_name
+
+    def _reusable(self, store):
+        # 舊版 compact_storage 直接把 store 改寫成 float16：精度已失，與其他模型一樣重新嵌入
+        return self._same_model(store) and store.dtype == "float32"
+
+    @staticmethod
+    def _warn_legacy(path, lexicon=False):
+        # 舊格式 .npy 不記錄模型且需 unpickle：載入時不讀，只提示以轉換工具明確指定模型
+        if store_exists(path) or not os.path.exists(path):
+            return
+        lexicon_option = " --lexicon <lexicon.json>" if lexicon else ""
+        print(f"[WARN] Ignoring legacy embeddings {path}; embedding from scratch. To keep its vectors, run "
+              f"python -m src.utils.embedding_store {path}{lexicon_option} --emb_model <model that produced them>.")
+
+    def _match_store_dtype(self, store, path):
+        """
+        Return the store to retrieve from: the float32 store itself, or with compact
+        storage its float16 copy in store_dir(path, "float16").
+
+        The copy records the fingerprint of the float32 store it was made from and is
+        rewritten whenever that store changed. The float32 store is never modified,
+        so turning compact_storage off again serves full-precision vectors.
+        """
+        if self.store_dtype == store.dtype:
+            return store
+        source = store.fingerprint or embeddings_fingerprint(store.matrix)
+        compact_path = store_dir(path, self.store_dtype)
+        if store_exists(path, self.store_dtype):
+            compact = EmbeddingStore.load(compact_path)
+            if compact.source == source and compact.dtype == self.store_dtype and compact.key_list == store.key_list:
+                return compact
+        EmbeddingStore(store.matrix, store.key_list, store.model_name).save(compact_path, self.store_dtype, source=source)
+        print(f"Wrote {self.store_dtype} copy of {store.path} to {compact_path}.")
+        return EmbeddingStore.load(compact_path)
+
+
+    def _update_store(self, store, keys, texts=None, desc=None):
+        """
+        Build the store for keys (in that order), embedding only the keys store lacks.
+
+        Rows are looked up by key, i.e. by the content that was embedded, so entries
+        added or edited in the source JSON are embedded, deleted ones are dropped and
+        unchanged ones keep their vectors. A store built with another model (or
+        rounded to float16 by an older compact layout) is re-embedded in full.
+
+        Args:
+            store (EmbeddingStore): The existing store, or None.
+            keys (list): Row keys in the desired order (duplicates allowed).
+            texts (list): The text to embed for each key (defaults to the keys).
+            desc (str): Progress bar label.
+
+        Returns:
+            tuple: (EmbeddingStore, number of newly embedded keys, number of dropped keys)
+        """
+        keys = list(keys)
+        texts = keys if texts is None else list(texts)
+        if store is not None and not self._same_model(store):
+            print(f"[WARN] Store was built with {store.model_name}; re-embedding every entry with {self.embedding_model.model_name}.")
+            store = None
+        elif store is not None and not self._reusable(store):
+            print(f"[WARN] Store holds {store.dtype} vectors; re-embedding every entry at full precision.")
+            store = None
+
+        text_of = dict(zip(keys, texts))
+        missing = [key for key in text_of if store is None or key not in store]
+        added = self.embedding_model.store_model.encode([text_of[key] for key in missing], desc=desc) if missing else None
+        dim = store.dim if store is not None and len(store) else added.shape[1]
+
+        matrix = np.empty((len(keys), dim), dtype=np.float32)
+        new_rows = {key: i for i, key in enumerate(missing)}
+        old_pos = [i for i, key in enumerate(keys) if key not in new_rows]
+        if old_pos:
+            matrix[old_pos] = store.matrix[[store.offset(keys[i]) for i in old_pos]]
+        if missing:
+            new_pos = [i for i, key in enumerate(keys) if key in new_rows]
+            matrix[new_pos] = added[[new_rows[keys[i]] for i in new_pos]]
+
+        dropped = len(set(store.key_list) - set(text_of)) if store is not None else 0
+        return EmbeddingStore(matrix, keys, self.embedding_model.model_name), len(missing), dropped
+
 
     def _load_embeddings(self, path, keys):
         """
         Load embeddings from a file or generate them if the file does not exist.
 
+        Embeddings live in a memory-mapped store directory derived from path
+        (see src/utils/embedding_store.py). A legacy pickled .npy at path is never
+        unpickled here: its model is unknown, so the store is embedded from scratch
+        (convert it with the embedding_store CLI to keep its vectors). When keys differ from
+        the stored ones, only the new keys are embedded and deleted ones are dropped.
+        With compact storage the float16 copy of the store is returned.
+
         Args:
             path (str): The file path to save/load embeddings.
-            keys (list): A list of keys to generate embeddings for if the file doesn't exist.
+            keys (list): The keys the store must hold, in order.
 
         Returns:
-            dict: A dictionary mapping keys to their embeddings.
+            EmbeddingStore: A read-only mapping of keys to their embeddings.
         """
-        if os.path.exists(path):
-            embeddings = np.load(path, allow_pickle=True).item()
-            print(f"Loaded embeddings successfully from {path}. Number of entries: {len(embeddings)}.")
+        keys = list(keys)
+        self._warn_legacy(path)
+
+        if store_exists(path):
+            embeddings = EmbeddingStore.load(store_dir(path))
+            if embeddings.key_list == keys and self._reusable(embeddings):
+                embeddings = self._match_store_dtype(embeddings, path)
+                print(f"Loaded embeddings successfully from {embeddings.path}. Number of entries: {len(embeddings)}.")
+                return embeddings
+
+            # 資料集有增刪：只嵌入新句子（模型不同時全部重新嵌入）
+            store, added, dropped = self._update_store(embeddings, keys, desc="Updating datastore embeddings")
+            store.save(store_dir(path))
+            embeddings = self._match_store_dtype(EmbeddingStore.load(store_dir(path)), path)
+            print(f"Updated embeddings in {store_dir(path)}: {added} embedded, {dropped} removed. Number of entries: {len(embeddings)}.")
             return embeddings
 
         # Generate embeddings if the file does not exist
         print(f"File not found: {path}. Generating embeddings...")
-        embeddings = self.embedding_model.get_multiple_embeddings(keys)  # Generate embeddings
-        np.save(path, embeddings)  # Save embeddings to file
-        print(f"Embeddings generated and saved to {path}. Number of entries: {len(embeddings)}.")
+        matrix = self.embedding_model.store_model.encode(keys, desc="Loading datastore embeddings")  # Generate embeddings
+        EmbeddingStore(matrix, keys, self.embedding_model.model_name).save(store_dir(path))  # Save embeddings to file
+        embeddings = self._match_store_dtype(EmbeddingStore.load(store_dir(path)), path)
+        print(f"Embeddings generated and saved to {store_dir(path)}. Number of entries: {len(embeddings)}.")
         return embeddings
 
 
-    def _load_lexicon_embeddings(self, path, lexicon_list):
+    def _subset_embeddings(self, embeddings, keys):
+        """
+        Slice the rows of keys out of a loaded EmbeddingStore; only keys the store lacks are embedded.
+
+        Returns:
+            EmbeddingStore: An in-memory store in the order of keys.
+        """
+        keys = list(keys)
+        missing = [key for key in keys if key not in embeddings]
+        if missing:
+            print(f"{len(missing)} sentences are not in the embedding store. Generating embeddings...")
+            extra = EmbeddingStore(self.embedding_model.store_model.encode(missing), missing, self.embedding_model.model_name)
+            combined = np.vstack([embeddings.subset([key for key in keys if key in embeddings]).matrix, extra.matrix])
+            embeddings = EmbeddingStore(combined, [key for key in keys if key in embeddings] + missing, self.embedding_model.model_name)
+        return embeddings.subset(keys)
+
+
+    def _load_lexicon_embeddings(self, path, lexicon_list, index_type="flat", **index_params):
         """
         Load or generate embeddings for the lexicon and create a FAISS index.
 
+        Rows follow DatasetUtils._flatten_lexicon(lexicon_list) and are keyed by gloss.
+        When the lexicon changed, only new or edited glosses are embedded. Trained
+        index types (ivf, hnsw) are saved inside the store directory (the float16 copy
+        with compact storage) and reloaded on the next start.
+
         Returns:
             tuple: A tuple containing:
-                - embeddings (list): The list of embeddings for the lexicon.
                 - faiss_index: The FAISS index created from the embeddings.
-                - mapping (list): A list of mappings from lexicon index to original positions.
+                - mapping (list): A list of mappings from lexicon index to original positions
+                  (an (n, 2) int32 array with compact storage).
         """
-        if os.path.exists(path):
-            embeddings = np.load(path, allow_pickle=True)
-            print(f"Loaded lexicon embeddings successfully from {path}. Number of entries: {len(embeddings)}.")
+        glosses = self._flatten_lexicon(lexicon_list)
+        self._warn_legacy(path, lexicon=True)
+
+        store = EmbeddingStore.load(store_dir(path)) if store_exists(path) else None
+        if store is not None and store.key_list == glosses and self._reusable(store):
+            store = self._match_store_dtype(store, path)
+            embeddings = store.matrix
+            print(f"Loaded lexicon embeddings successfully from {store.path}. Number of entries: {len(embeddings)}.")
         else:
-            embeddings = [
-                self.embedding_model.get_single_embedding(re.sub(r"\(.*?\)", "", lexicon).strip() or lexicon)
-                for s_lexicon_list in tqdm(lexicon_list, desc="Loading lexicon embeddings")
-                for lexicon in s_lexicon_list
-            ]
-            np.save(path, embeddings)
-            print(f"Generated and saved lexicon embeddings to {path}. Number of entries: {len(embeddings)}.")
+            # 以詞義文字為鍵：只嵌入新增或修改的詞義
+            texts = [re.sub(r"\(.*?\)", "", lexicon).strip() or lexicon for lexicon in glosses]
+            store, added, dropped = self._update_store(store, glosses, texts, desc="Loading lexicon embeddings")
+            store.save(store_dir(path))
+            store = self._match_store_dtype(EmbeddingStore.load(store_dir(path)), path)
+            embeddings = store.matrix
+            print(f"Updated lexicon embeddings in {store_dir(path)}: {added} embedded, {dropped} removed. Number of entries: {len(embeddings)}.")
 
         # Create FAISS index and mapping
-        faiss_index = self.embedding_model.embeddings2faiss(embeddings)
+        faiss_index = self.embedding_model.embeddings2faiss(
+            embeddings, index_type, index_file(store.path, index_type),
+            model_name=store.model_name, fingerprint=store.fingerprint, **index_params)
         mapping = [[i, j] for i, lst in enumerate(lexicon_list) for j in range(len(lst))]
+        if self.compact:
+            mapping = np.array(mapping, dtype=np.int32) if mapping else np.zeros((0, 2), dtype=np.int32)
 
         return faiss_index, mapping
\ No newline at end of file
@@ -0,0 +1,187 @@
+import os
+import json
+import shutil
+import argparse
+import numpy as np
+from collections.abc import Mapping
+from src.models.index_factory import embeddings_fingerprint
+
+STORE_FORMAT = "lfm-embedding-store"
+STORE_VERSION = 1
+VECTORS_FILE = "vectors.npy"
+INDEX_FILE = "index.json"
+# float16 只用於精簡儲存（compact_storage）：另存一份 *.f16.store，float32 的 store 不會被覆寫
+STORE_DTYPES = ("float32", "float16")
+# 舊格式檔案無從得知是哪個模型產生的：標記為 legacy，載入時會重新嵌入
+LEGACY_MODEL = "legacy-unknown"
+
+
+def store_dir(path, dtype="float32"):
+    """Map a configured embedding path (e.g. *_embedding.npy) to its store directory (*.f16.store for float16)."""
+    base = path[:-len(".npy")] if path.endswith(".npy") else path
+    return base + (".f16.store" if dtype == "float16" else ".store")
+
+
+def store_exists(path, dtype="float32"):
+    return os.path.exists(os.path.join(store_dir(path, dtype), INDEX_FILE))
+
+
+class EmbeddingStore(Mapping):
+    """
+    Embeddings kept as one contiguous float32 (or float16) matrix plus a key/offset index.
+
+    On disk a store is a directory holding vectors.npy (the matrix, memory-mapped
+    on load so forked workers share its pages) and index.json (a header with the
+    model name, dimension and content fingerprint, and the keys in row order).
+    A float16 store derived from a float32 one also records the source fingerprint. The store behaves as a
+    read-only dict from key to its row, so it can stand in for the old pickled
+    {sentence: embedding} dicts (keys must then be unique; lexicon stores keep
+    duplicate glosses and are used through .matrix only).
+    """
+    def __init__(self, matrix, keys, model_name=None):
+        self.matrix = matrix
+        self.key_list = list(keys)
+        self.model_name = model_name
+        self.path = None
+        # 存檔內容的雜湊（save/load 時設定），供已存的 FAISS 索引比對
+        self.fingerprint = None
+        # 由哪一份 float32 store 轉出（只有 float16 store 有）
+        self.source = None
+        if len(self.key_list) != len(self.matrix):
+            raise ValueError(f"Embedding store has {len(self.matrix)} vectors but {len(self.key_list)} keys.")
+        self._offsets = {key: i for i, key in enumerate(self.key_list)}
+
+    @property
+    def dim(self):
+        return int(self.matrix.shape[1]) if self.matrix.ndim == 2 else 0
+
+    @property
+    def dtype(self):
+        return self.matrix.dtype.name
+
+    def offset(self, key):
+        return self._offsets[key]
+
+    def __getitem__(self, key):
+        return self.matrix[self._offsets[key]]
+
+    def __iter__(self):
+        return iter(self._offsets)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def subset(self, keys):
+        """Return a new in-memory store holding only the given keys, in that order."""
+        keys = list(keys)
+        rows = np.fromiter((self._offsets[key] for key in keys), dtype=np.int64, count=len(keys))
+        return EmbeddingStore(np.ascontiguousarray(self.matrix[rows]), keys, self.model_name)
+
+    def save(self, path, dtype="float32", source=None):
+        """
+        Write the store to the directory path (replacing any existing store, keeping its saved indexes).
+
+        Args:
+            path (str): The store directory.
+            dtype (str): float32, or float16 for a compact copy.
+            source (str): Fingerprint of the float32 store a float16 copy was made from.
+        """
+        if dtype not in STORE_DTYPES:
+            raise ValueError(f"Embedding store dtype {dtype} not supported. Choose from {', '.join(STORE_DTYPES)}.")
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        self.source = source
+        matrix = np.ascontiguousarray(self.matrix, dtype=dtype)
+        np.save(os.path.join(tmp_path, VECTORS_FILE), matrix)
+        # 以實際寫入的向量計算，改了任何一列（筆數不變）已存的索引也不會被沿用
+        self.fingerprint = embeddings_fingerprint(matrix)
+        header = {
+            "format": STORE_FORMAT,
+            "version": STORE_VERSION,
+            "model": self.model_name,
+            "dim": self.dim,
+            "count": len(self.key_list),
+            "dtype": dtype,
+            "fingerprint": self.fingerprint,
+        }
+        if source:
+            header["source"] = source
+        with open(os.path.join(tmp_path, INDEX_FILE), "w", encoding="utf-8") as f:
+            json.dump({"header": header, "keys": self.key_list}, f, ensure_ascii=False)
+        # 保留目錄中已存的 FAISS 索引，由 build_index 判斷是否沿用
+        if os.path.isdir(path):
+            for name in os.listdir(path):
+                if name not in (VECTORS_FILE, INDEX_FILE):
+                    shutil.move(os.path.join(path, name), os.path.join(tmp_path, name))
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        with open(os.path.join(path, INDEX_FILE), "r", encoding="utf-8") as f:
+            index = json.load(f)
+        header = index["header"]
+        if header.get("format") != STORE_FORMAT or header.get("version") != STORE_VERSION:
+            raise ValueError(f"Unsupported embedding store format in {path}: {header.get('format')} v{header.get('version')}.")
+        matrix = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r" if mmap else None)
+        if matrix.ndim != 2 or matrix.shape[1] != header["dim"] or matrix.dtype.name != header.get("dtype", "float32"):
+            raise ValueError(f"Embedding store {path} is corrupt: expected {header.get('dtype', 'float32')} vectors of dimension {header['dim']}, got {matrix.dtype.name} {matrix.shape}.")
+        store = cls(matrix, index["keys"], header.get("model"))
+        store.path = path
+        store.fingerprint = header.get("fingerprint")
+        store.source = header.get("source")
+        return store
+
+    @classmethod
+    def from_dict(cls, embeddings, model_name=None):
+        keys = list(embeddings.keys())
+        matrix = np.vstack([embeddings[key] for key in keys]).astype(np.float32) if keys else np.zeros((0, 0), dtype=np.float32)
+        return cls(matrix, keys, model_name)
+
+
+def convert_legacy(npy_path, model_name=None, keys=None):
+    """
+    Convert a legacy .npy embedding file into an embedding store next to it.
+
+    Args:
+        npy_path (str): A pickled {key: embedding} dict, or a plain (n, dim) array.
+        model_name (str): Embedding model that produced the vectors. When None the store
+            is labelled LEGACY_MODEL, so DatasetUtils re-embeds it on load.
+        keys (list): Row keys for a plain array (e.g. lexicon glosses); ignored for dicts.
+
+    Returns:
+        str: The store directory.
+    """
+    model_name = model_name or LEGACY_MODEL
+    data = np.load(npy_path, allow_pickle=True)
+    if data.dtype == object and data.shape == ():
+        store = EmbeddingStore.from_dict(data.item(), model_name)
+    else:
+        if keys is None:
+            raise ValueError(f"{npy_path} holds a plain array; the row keys must be provided.")
+        store = EmbeddingStore(np.asarray(data, dtype=np.float32), keys, model_name)
+    path = store_dir(npy_path)
+    store.save(path)
+    return path
+
+
+# Converter: python -m src.utils.embedding_store <file.npy> [--lexicon <lexicon.json>] --emb_model <model>
+if __name__ == "__main__":
+    import src.utils.config_parser as config_parser
+    from src.utils.dataset_utils import DatasetUtils
+
+    defaults = config_parser.load_config()
+    parser = argparse.ArgumentParser(description="Convert legacy .npy embedding files to the memory-mapped store format.")
+    parser.add_argument("paths", nargs="+", help="Legacy .npy embedding files.")
+    parser.add_argument("--lexicon", type=str, default=None, help="Lexicon JSON giving row keys for lexicon embedding arrays.")
+    # 只有在這裡才會 unpickle 舊檔：使用者以 --emb_model 擔保向量來源
+    parser.add_argument("--emb_model", type=str, required=True,
+                        help=f"Embedding model that produced the vectors (e.g. {defaults['emb_model']}). Only convert files you trust: legacy .npy files are unpickled.")
+    cli_args = parser.parse_args()
+
+    lexicon_keys = None
+    if cli_args.lexicon:
+        lexicon_keys = DatasetUtils._flatten_lexicon(DatasetUtils._load_lexicon(cli_args.lexicon)[1])
+    for npy_path in cli_args.paths:
+        print(f"Converted {npy_path} -> {convert_legacy(npy_path, cli_args.emb_model, lexicon_keys)}")
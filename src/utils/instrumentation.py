@@ -0,0 +1,180 @@
+import os
+import json
+import time
+import threading
+
+# Process-wide recorder: per-stage timers and counters, keyed by translation mode.
+# When disabled, timed() / mode_scope() return a shared no-op context and count() returns at once.
+SHARED = "shared"
+
+
+class _Noop:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _Noop()
+_local = threading.local()
+
+
+class _Timer:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        RECORDER.observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class _ModeScope:
+    __slots__ = ("mode", "outer")
+
+    def __init__(self, mode):
+        self.mode = mode
+
+    def __enter__(self):
+        # 外層模式優先：LFM 內部為錯誤範例做的 COT 翻譯仍記在 LFM
+        self.outer = getattr(_local, "mode", None)
+        if self.outer is None:
+            _local.mode = self.mode
+        return self
+
+    def __exit__(self, *exc):
+        _local.mode = self.outer
+        return False
+
+
+def current_mode():
+    return getattr(_local, "mode", None) or SHARED
+
+
+class Recorder:
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}        # (mode, stage) -> [calls, total seconds, max seconds]
+            self.counters = {}      # (mode, name) -> value
+            self.started = time.time()
+
+    def observe(self, stage, seconds):
+        key = (current_mode(), stage)
+        with self._lock:
+            entry = self.stages.get(key)
+            if entry is None:
+                self.stages[key] = [1, seconds, seconds]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+                entry[2] = max(entry[2], seconds)
+
+    def count(self, name, value=1):
+        key = (current_mode(), name)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def snapshot(self):
+        """Stage timings and counters per mode, with LLM cache hit rates."""
+        with self._lock:
+            stages, counters = dict(self.stages), dict(self.counters)
+        result = {"elapsed_s": round(time.time() - self.started, 3), "modes": {}}
+        for (mode, stage), (calls, total, longest) in sorted(stages.items()):
+            result["modes"].setdefault(mode, {"stages": {}, "counters": {}})["stages"][stage] = {
+                "calls": calls,
+                "total_s": round(total, 6),
+                "mean_ms": round(total / calls * 1000, 3),
+                "max_ms": round(longest * 1000, 3),
+            }
+        for (mode, name), value in sorted(counters.items()):
+            result["modes"].setdefault(mode, {"stages": {}, "counters": {}})["counters"][name] = value
+        for entry in result["modes"].values():
+            hits, misses = entry["counters"].get("llm_cache_hits", 0), entry["counters"].get("llm_cache_misses", 0)
+            if hits + misses:
+                entry["counters"]["llm_cache_hit_rate"] = round(hits / (hits + misses), 4)
+        return result
+
+    def prometheus_text(self, prefix="ch2amis"):
+        with self._lock:
+            stages, counters = dict(self.stages), dict(self.counters)
+        lines = [f"# TYPE {prefix}_stage_seconds summary"]
+        for (mode, stage), (calls, total, _) in sorted(stages.items()):
+            labels = f'mode="{mode}",stage="{stage}"'
+            lines.append(f"{prefix}_stage_seconds_sum{{{labels}}} {total:.6f}")
+            lines.append(f"{prefix}_stage_seconds_count{{{labels}}} {calls}")
+        names = sorted({name for _, name in counters})
+        for name in names:
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines += [f'{prefix}_{name}_total{{mode="{mode}"}} {value}'
+                      for (mode, counter), value in sorted(counters.items()) if counter == name]
+        return "\n".join(lines) + "\n"
+
+
+RECORDER = Recorder()
+
+
+def enable(enabled=True):
+    RECORDER.enabled = bool(enabled)
+
+
+def enabled():
+    return RECORDER.enabled
+
+
+def timed(stage):
+    """Context manager timing one stage (no-op when instrumentation is off)."""
+    return _Timer(stage) if RECORDER.enabled else _NOOP
+
+
+def mode_scope(mode):
+    """Attribute the stages and counters inside the block to a translation mode."""
+    return _ModeScope(mode) if RECORDER.enabled else _NOOP
+
+
+def count(name, value=1):
+    if RECORDER.enabled:
+        RECORDER.count(name, value)
+
+
+def reset():
+    RECORDER.reset()
+
+
+def snapshot():
+    return RECORDER.snapshot()
+
+
+def prometheus_text(prefix="ch2amis"):
+    return RECORDER.prometheus_text(prefix)
+
+
+def save(path, **extra):
+    """Write the snapshot (plus extra sections such as cache stats) to a JSON file."""
+    data = snapshot()
+    data.update(extra)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+    return path
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        # 非 Linux：退回整個行程的最高值
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
@@ -0,0 +1,160 @@
+import gc
+import os
+import sys
+import json
+import random
+import shutil
+import argparse
+import tempfile
+import numpy as np
+import src.utils.config_parser as config_parser
+import src.utils.instrumentation as instrumentation
+from src.models.knn import KNNRetriever
+from src.models.language_registry import discover_languages, language_args
+from src.utils.dataset_utils import DatasetUtils
+from src.utils.embedding_store import STORE_DTYPES, VECTORS_FILE, store_dir, store_exists
+
+# 每個語言分別以現行格式（float32 store、flat 索引、list 詞表）與精簡格式載入，比較記憶體與檢索結果
+
+
+def deep_size(obj, seen=None):
+    """Bytes held by obj and everything it references; shared objects are counted once, memory-mapped data not at all."""
+    seen = set() if seen is None else seen
+    total, stack = 0, [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        # ndarray 只有擁有資料時 getsizeof 才含資料本身
+        total += sys.getsizeof(item)
+        if isinstance(item, np.ndarray) and isinstance(item.base, np.ndarray):
+            stack.append(item.base)
+        if isinstance(item, (str, bytes, int, float, np.ndarray)):
+            continue
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        elif hasattr(item, "__dict__"):
+            stack.append(vars(item))
+    return total
+
+
+def _index_bytes(index):
+    import faiss
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def _file_bytes(path, dtype="float32"):
+    vectors = os.path.join(store_dir(path, dtype), VECTORS_FILE)
+    return os.path.getsize(vectors) if os.path.exists(vectors) else 0
+
+
+def copy_corpus(base_path, language, out_dir):
+    """Copy a language's JSON files and embedding stores, so stores and indexes written while loading leave base_path untouched."""
+    os.makedirs(out_dir, exist_ok=True)
+    for name in (f"{language}_sentences.json", f"{language}_lexicon.json"):
+        shutil.copy(os.path.join(base_path, name), out_dir)
+    for name in (f"{language}_sentences_embedding.npy", f"{language}_lexicon_embedding.npy"):
+        for dtype in STORE_DTYPES:
+            if store_exists(os.path.join(base_path, name), dtype):
+                shutil.copytree(store_dir(os.path.join(base_path, name), dtype), store_dir(os.path.join(out_dir, name), dtype))
+    return out_dir
+
+
+def load_retriever(args):
+    data_utils = DatasetUtils(args.emb_model, args.compact_storage, **config_parser.embedding_options(args))
+    all_ch2amis = DatasetUtils._load_json(args.sentences_path, invert=True)
+    return KNNRetriever(args, data_utils._load_embeddings(args.sentence_embedding_path, all_ch2amis))
+
+
+def memory_usage(knn):
+    """Bytes of each per-language retrieval structure (resident) and of the store files (memory-mapped)."""
+    usage = {
+        "lexicon_table": deep_size((knn.lexicon, knn.lexicon_list)),
+        "lexicon_mapping": deep_size(knn.lexicon_mapping),
+        "lexicon_trie": deep_size(knn.lexicon_trie.root),
+        "lexicon_index": _index_bytes(knn.faiss_index),
+        "sentence_index": _index_bytes(knn.sentence_index),
+    }
+    usage["resident_total"] = sum(usage.values())
+    dtype = knn.data_utils.store_dtype
+    usage["lexicon_store_file"] = _file_bytes(knn.lexicon_embedding_path, dtype)
+    usage["sentence_store_file"] = _file_bytes(knn.sentence_embedding_path, dtype)
+    return usage
+
+
+def agreement(reference, candidate, sentences, k):
+    """Top-k sentence neighbour overlap and the share of identical lexicon and full example strings."""
+    truth = reference.find_knn_examples_topN_sentence_batch(sentences, k)
+    found = candidate.find_knn_examples_topN_sentence_batch(sentences, k)
+    overlap = [len({key for key, _ in t} & {key for key, _ in f}) / max(1, len(t)) for t, f in zip(truth, found)]
+    lexicon_a = reference.find_knn_examples_batch(sentences, 0)
+    lexicon_b = candidate.find_knn_examples_batch(sentences, 0)
+    examples_a = reference.find_knn_examples_batch(sentences, k)
+    examples_b = candidate.find_knn_examples_batch(sentences, k)
+    return {
+        f"top{k}_agreement": round(float(np.mean(overlap)), 4),
+        "lexicon_identical": round(float(np.mean([a == b for a, b in zip(lexicon_a, lexicon_b)])), 4),
+        "examples_identical": round(float(np.mean([a == b for a, b in zip(examples_a, examples_b)])), 4),
+    }
+
+
+def language_report(args, language, work_dir, num_sentences=200, seed=0):
+    """
+    Load one language in the current layout (float32 stores, flat indexes, list lexicon)
+    and in the compact layout (float16 store copies, int32 mapping, interned lexicon table
+    and the configured index types, flat becoming sq16), and compare their memory use and
+    retrieval output.
+    """
+    layouts = {
+        "current": {"compact_storage": False, "sentence_index": "flat", "lexicon_index": "flat"},
+        "compact": {"compact_storage": True, "sentence_index": args.sentence_index, "lexicon_index": args.lexicon_index},
+    }
+
+    report, retrievers = {"language": language}, {}
+    for name, layout in layouts.items():
+        base_path = copy_corpus(args.base_path, language, os.path.join(work_dir, name))
+        layout_args = language_args(argparse.Namespace(**{**vars(args), **layout, "base_path": base_path}), language)
+        gc.collect()
+        before = instrumentation.current_rss_mb()
+        retrievers[name] = load_retriever(layout_args)
+        gc.collect()
+        report[name] = {**layout, "sentence_index": retrievers[name].sentence_index_type, "lexicon_index": retrievers[name].lexicon_index_type,
+                        **memory_usage(retrievers[name]), "rss_delta_mb": round(instrumentation.current_rss_mb() - before, 1)}
+
+    corpus = list(retrievers["current"].all_ch2amis)
+    sentences = random.Random(seed).sample(corpus, min(num_sentences, len(corpus)))
+    report["agreement"] = agreement(retrievers["current"], retrievers["compact"], sentences, args.Knn_k)
+    return report
+
+
+# Memory report: python -m src.utils.memory_report [--sentence_index sq16] [--lexicon_index pq] [--languages ...]
+if __name__ == "__main__":
+    config_defaults = config_parser.get_combined_config()
+    parser = config_parser.build_parser(config_defaults, "Per-language memory use and retrieval agreement of the compact storage layout.")
+    parser.add_argument("--languages", type=str, nargs="+", default=None, help="Languages to report (default: every corpus under --base_path).")
+    parser.add_argument("--check_sentences", type=int, default=200, help="Sentences compared between the two layouts.")
+    parser.add_argument("--output", type=str, default=None, help="Optional JSON file for the report.")
+    args = parser.parse_args()
+
+    reports = []
+    with tempfile.TemporaryDirectory(prefix="memory_report_") as work_dir:
+        for language in args.languages or discover_languages(args.base_path):
+            report = language_report(args, language, os.path.join(work_dir, language), args.check_sentences, args.seed or 0)
+            reports.append(report)
+            print(f"{language}:")
+            for name in ("current", "compact"):
+                row = report[name]
+                print(f"  {name:<8} resident {row['resident_total'] / 1024:.1f}KiB "
+                      f"(lexicon table {row['lexicon_table'] / 1024:.1f}KiB, mapping {row['lexicon_mapping'] / 1024:.1f}KiB, "
+                      f"lexicon index {row['lexicon_index'] / 1024:.1f}KiB, sentence index {row['sentence_index'] / 1024:.1f}KiB), "
+                      f"store files {(row['lexicon_store_file'] + row['sentence_store_file']) / 1024:.1f}KiB, RSS +{row['rss_delta_mb']}MB")
+            print("  agreement " + "  ".join(f"{key}={value}" for key, value in report["agreement"].items()))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(reports, f, ensure_ascii=False, indent=4)
+        print(f"Report saved to {args.output}")
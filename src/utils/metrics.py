@@ -0,0 +1,187 @@
+import sys
+import math
+import json
+import argparse
+from collections import Counter
+import numpy as np
+
+# 與 BatchEvaluator 原本傳給 nltk sentence_bleu 的權重相同
+BLEU_WEIGHTS = {
+    "BLEU1": (1, 0, 0, 0),
+    "BLEU2": (0.5, 0.5, 0, 0),
+    "BLEU3": (0.33, 0.33, 0.33, 0),
+    "BLEU4": (0.25, 0.25, 0.25, 0.25),
+}
+MAX_ORDER = 4
+# sacreBLEU chrF++ 斷詞時從詞首或詞尾分出的標點
+CHRF_PUNCTUATION = set('!"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~')
+
+
+def _ngram_counts(tokens, max_order):
+    return [Counter(zip(*(tokens[i:] for i in range(n)))) for n in range(1, max_order + 1)]
+
+
+def bleu_stats(reference, hypothesis, max_order=MAX_ORDER):
+    """
+    Count BLEU statistics for one whitespace-tokenized sentence pair in a single pass.
+
+    Returns:
+        numpy.ndarray: [matches_1..N, totals_1..N, hyp_len, ref_len], where totals follow
+        nltk's modified_precision (at least 1).
+    """
+    ref_tokens = reference.split()
+    hyp_tokens = hypothesis.split()
+    ref_counts = _ngram_counts(ref_tokens, max_order)
+    hyp_counts = _ngram_counts(hyp_tokens, max_order)
+    stats = np.zeros(2 * max_order + 2, dtype=np.int64)
+    for n in range(max_order):
+        stats[n] = sum(min(count, ref_counts[n][ngram]) for ngram, count in hyp_counts[n].items())
+        stats[max_order + n] = max(1, sum(hyp_counts[n].values()))
+    stats[-2] = len(hyp_tokens)
+    stats[-1] = len(ref_tokens)
+    return stats
+
+
+def bleu_from_stats(stats, weights=BLEU_WEIGHTS, max_order=MAX_ORDER):
+    """
+    BLEU scores from (summed) statistics, following nltk's default (method0, no smoothing).
+
+    Returns:
+        dict: name -> score for every entry of weights.
+    """
+    matches = stats[:max_order]
+    totals = stats[max_order:2 * max_order]
+    hyp_len, ref_len = int(stats[-2]), int(stats[-1])
+    if matches[0] == 0:
+        return {name: 0 for name in weights}
+
+    if hyp_len > ref_len:
+        bp = 1
+    elif hyp_len == 0:
+        bp = 0
+    else:
+        bp = math.exp(1 - ref_len / hyp_len)
+
+    log_p = [math.log(m / t) if m else math.log(sys.float_info.min) for m, t in zip(matches, totals)]
+    return {name: bp * math.exp(math.fsum(w * lp for w, lp in zip(weight, log_p))) for name, weight in weights.items()}
+
+
+def sentence_bleu_scores(reference, hypothesis):
+    """BLEU1-4 of one sentence pair, matching nltk sentence_bleu with the evaluator's weights."""
+    return bleu_from_stats(bleu_stats(reference, hypothesis))
+
+
+def corpus_bleu_scores(references, hypotheses):
+    """Corpus-level BLEU1-4 (statistics summed over all sentences, as nltk corpus_bleu)."""
+    stats = np.vstack([bleu_stats(r, h) for r, h in zip(references, hypotheses)]) if references else np.zeros((1, 2 * MAX_ORDER + 2), dtype=np.int64)
+    return bleu_from_stats(stats.sum(axis=0))
+
+
+def chrf_words(sentence):
+    """
+    Word tokens for chrF++ (sacreBLEU 2.x): whitespace tokens, with one punctuation
+    character split off the end of a word, or else off its start.
+    """
+    words = []
+    for word in sentence.split():
+        if len(word) > 1 and word[-1] in CHRF_PUNCTUATION:
+            words += [word[:-1], word[-1]]
+        elif len(word) > 1 and word[0] in CHRF_PUNCTUATION:
+            words += [word[0], word[1:]]
+        else:
+            words.append(word)
+    return words
+
+
+def chrf_stats(reference, hypothesis, char_order=6, word_order=0):
+    """
+    chrF statistics per n-gram order: rows of [hyp_total, ref_total, matches].
+
+    Character n-grams ignore all whitespace; word n-grams (chrF++ when word_order=2)
+    use chrf_words tokens.
+    """
+    rows = []
+    ref_chars = "".join(reference.split())
+    hyp_chars = "".join(hypothesis.split())
+    for n in range(1, char_order + 1):
+        ref_counts = Counter(ref_chars[i:i + n] for i in range(len(ref_chars) - n + 1))
+        hyp_counts = Counter(hyp_chars[i:i + n] for i in range(len(hyp_chars) - n + 1))
+        rows.append([sum(hyp_counts.values()), sum(ref_counts.values()), sum((hyp_counts & ref_counts).values())])
+    if word_order:
+        ref_words = _ngram_counts(chrf_words(reference), word_order)
+        hyp_words = _ngram_counts(chrf_words(hypothesis), word_order)
+        for ref_counts, hyp_counts in zip(ref_words, hyp_words):
+            rows.append([sum(hyp_counts.values()), sum(ref_counts.values()), sum((hyp_counts & ref_counts).values())])
+    return np.array(rows, dtype=np.float64)
+
+
+def chrf_from_stats(stats, beta=2):
+    """
+    chrF (0-1) from per-order statistics, as sacreBLEU 2.x computes it by default:
+    precision and recall are averaged over the orders present in both sentences,
+    then combined into one F-score.
+    """
+    hyp_total, ref_total, matches = stats[:, 0], stats[:, 1], stats[:, 2]
+    effective = (hyp_total > 0) & (ref_total > 0)
+    if not effective.any():
+        return 0.0
+    precision = float((matches[effective] / hyp_total[effective]).mean())
+    recall = float((matches[effective] / ref_total[effective]).mean())
+    if precision + recall == 0:
+        return 0.0
+    return (1 + beta ** 2) * precision * recall / (beta ** 2 * precision + recall)
+
+
+def sentence_chrf(reference, hypothesis, char_order=6, word_order=0, beta=2):
+    return chrf_from_stats(chrf_stats(reference, hypothesis, char_order, word_order), beta)
+
+
+def corpus_chrf(references, hypotheses, char_order=6, word_order=0, beta=2):
+    """Corpus-level chrF: statistics summed over all sentences before the F-score."""
+    stats = sum(chrf_stats(r, h, char_order, word_order) for r, h in zip(references, hypotheses))
+    return chrf_from_stats(stats, beta) if references else 0.0
+
+
+def corpus_scores(references, hypotheses):
+    """
+    Corpus-level metrics for a result file.
+
+    Returns:
+        dict: corpus_BLEU1-4, corpus_chrF and corpus_chrF++ (all 0-1).
+    """
+    scores = {f"corpus_{name}": round(score, 4) for name, score in corpus_bleu_scores(references, hypotheses).items()}
+    scores["corpus_chrF"] = round(corpus_chrf(references, hypotheses), 4)
+    scores["corpus_chrF++"] = round(corpus_chrf(references, hypotheses, word_order=2), 4)
+    return scores
+
+
+def rescore_result_file(path):
+    """Recompute sentence and corpus metrics of a <mode>_evaluation_result.json file."""
+    with open(path, "r", encoding="utf-8") as f:
+        result = json.load(f)
+    evaluations = [row for row in result if "input_sentence" in row]
+    references = [row["ground_truth"] for row in evaluations]
+    hypotheses = [row["translation"] for row in evaluations]
+    sentence_scores = np.array([list(sentence_bleu_scores(r, h).values()) for r, h in zip(references, hypotheses)])
+    summary = {f"avg_{name}": round(float(score), 4) for name, score in zip(BLEU_WEIGHTS, sentence_scores.mean(axis=0))}
+    summary.update(corpus_scores(references, hypotheses))
+    return summary
+
+
+# Re-score result files: python -m src.utils.metrics result/*/*_evaluation_result.json
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-score evaluation result files with sentence and corpus BLEU / chrF.")
+    parser.add_argument("paths", nargs="+", help="<mode>_evaluation_result.json files.")
+    parser.add_argument("--output", type=str, default=None, help="Optional JSON file for the scores.")
+    cli_args = parser.parse_args()
+
+    scores = {}
+    for path in cli_args.paths:
+        scores[path] = rescore_result_file(path)
+        print(path)
+        print("  " + "  ".join(f"{key}={value}" for key, value in scores[path].items()))
+
+    if cli_args.output:
+        with open(cli_args.output, "w", encoding="utf-8") as f:
+            json.dump(scores, f, ensure_ascii=False, indent=4)
+        print(f"Scores saved to {cli_args.output}")
@@ -0,0 +1,100 @@
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+# 啟動時間剖析：每個情境都是全新的 python 行程，量牆鐘時間並列出載入了哪些重量級套件
+HEAVY_MODULES = ("torch", "transformers", "faiss", "openai", "jieba", "nltk")
+IMPORT_LINE = re.compile(r"^import time:\s+\d+\s+\|\s+(\d+)\s+\|\s+(\S+)\s*$")
+
+
+def heavy_imports(command, env=None):
+    """Cumulative import time (ms) of each heavy package a command loads, from python -X importtime."""
+    completed = subprocess.run([sys.executable, "-X", "importtime", *command], env=env, capture_output=True, text=True)
+    loaded = {}
+    for line in completed.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match and match.group(2) in HEAVY_MODULES:
+            loaded[match.group(2)] = round(int(match.group(1)) / 1000, 1)
+    return loaded
+
+
+def time_command(command, env=None, repeat=3):
+    """Wall-clock seconds of each run of python <command>, plus the last exit code."""
+    seconds, returncode = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable, *command], env=env, capture_output=True, text=True)
+        seconds.append(time.perf_counter() - start)
+        returncode = completed.returncode
+    return seconds, returncode
+
+
+def build_scenarios(sentence, mode, cache_dir, main_args):
+    """(name, command, env, priming command) for --help, a config error and a fully cached translation."""
+    env = {**os.environ, "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY") or "startup-profile"}
+    caches = ["--llm_cache_path", os.path.join(cache_dir, "llm_cache.sqlite"),
+              "--emb_cache_path", os.path.join(cache_dir, "embedding_cache.sqlite")]
+    translate = ["-m", "src.main", sentence, "--translation_mode", mode, *caches, *main_args]
+    return [
+        ("help", ["-m", "src.main", "--help"], env, None),
+        ("config_error", ["-m", "src.main", *main_args], env, None),
+        # 先以本機 stub LLM 跑一次填滿快取，量測時以 replay 模式執行
+        ("cache_hit", [*translate, "--llm_cache_mode", "replay"], env, [*translate, "--llm_cache_mode", "readwrite"]),
+    ]
+
+
+def profile(sentence="我們工作很勤勞。", mode="RPC", repeat=3, main_args=()):
+    """
+    Time each startup scenario in fresh processes.
+
+    Returns:
+        list: One dict per scenario with median/min seconds, exit code and the heavy packages imported.
+    """
+    from src.models.stub_llm import serve_stub
+
+    stub_server, base_url = serve_stub()
+    report = []
+    with tempfile.TemporaryDirectory(prefix="startup_profile_") as cache_dir:
+        for name, command, env, priming in build_scenarios(sentence, mode, cache_dir, list(main_args)):
+            if priming is not None:
+                completed = subprocess.run([sys.executable, *priming, "--gpt_base_url", base_url], env=env, capture_output=True, text=True)
+                if completed.returncode != 0:
+                    print(f"[WARNING]: priming run for {name} failed:\n{completed.stderr[-2000:]}")
+            seconds, returncode = time_command(command, env, repeat)
+            report.append({
+                "scenario": name,
+                "median_s": round(statistics.median(seconds), 3),
+                "min_s": round(min(seconds), 3),
+                "exit_code": returncode,
+                "heavy_imports_ms": heavy_imports(command, env),
+            })
+    stub_server.shutdown()
+    return report
+
+
+# Startup profile: python -m src.utils.startup_profile [--repeat 3] [--output profile.json] [-- extra src.main arguments]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Wall-clock startup time of src.main for --help, a config error and a fully cached run.")
+    parser.add_argument("--sentence", type=str, default="我們工作很勤勞。", help="Sentence of the cached translation run.")
+    parser.add_argument("--mode", type=str, default="RPC", help="Translation mode of the cached run.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per scenario (the median is reported).")
+    parser.add_argument("--output", type=str, default=None, help="Optional JSON file for the report.")
+    parser.add_argument("main_args", nargs=argparse.REMAINDER, help="Extra arguments passed to src.main after --.")
+    cli_args = parser.parse_args()
+    main_args = cli_args.main_args[1:] if cli_args.main_args[:1] == ["--"] else cli_args.main_args
+
+    report = profile(cli_args.sentence, cli_args.mode, cli_args.repeat, main_args)
+    for row in report:
+        heavy = ", ".join(f"{name} {ms}ms" for name, ms in row["heavy_imports_ms"].items()) or "none"
+        print(f"{row['scenario']:<13} median {row['median_s']:.3f}s  min {row['min_s']:.3f}s  exit {row['exit_code']}  heavy imports: {heavy}")
+
+    if cli_args.output:
+        with open(cli_args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=4)
+        print(f"Report saved to {cli_args.output}")
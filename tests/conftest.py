@@ -0,0 +1,76 @@
+import os
+import shutil
+import string
+import argparse
+import pytest
+import src.utils.config_parser as config_parser
+from src.models.knn import KNNRetriever
+from src.models.language_registry import language_args
+from src.utils.dataset_utils import DatasetUtils
+
+# 測試用的小語料：Southern_Amis 的前 40 句與其中用到的詞條，語言名稱為 Test
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, "tests", "fixtures")
+LANGUAGE = "Test"
+SENTENCES_PATH = os.path.join(FIXTURES, f"{LANGUAGE}_sentences.json")
+LEXICON_PATH = os.path.join(FIXTURES, f"{LANGUAGE}_lexicon.json")
+# 不在語料中的查詢：含英文字、詞表沒有的片段
+EXTRA_QUERIES = ["我的老師很好。", "Panay喜歡紅色的書嗎？", "中興大學是一所位於台灣的優質學校", "他們明天要去台北開會。"]
+
+
+@pytest.fixture(scope="session")
+def ch2amis():
+    return DatasetUtils._load_json(SENTENCES_PATH, invert=True)
+
+
+@pytest.fixture(scope="session")
+def lexicon():
+    return DatasetUtils._load_lexicon(LEXICON_PATH)
+
+
+@pytest.fixture(scope="session")
+def tiny_model(tmp_path_factory, ch2amis, lexicon):
+    """
+    Path of a randomly initialised two-layer BERT (fixed seed) whose vocabulary covers the
+    fixture characters; usable as emb_model without network access.
+    """
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+    path = str(tmp_path_factory.mktemp("tiny_bert"))
+    chars = sorted({char for text in [*ch2amis, *(gloss for glosses in lexicon[1] for gloss in glosses)] for char in text if not char.isspace()})
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", *string.ascii_lowercase, *(f"##{c}" for c in string.ascii_lowercase), *chars]
+    with open(os.path.join(path, "vocab.txt"), "w", encoding="utf-8") as f:
+        f.write("\n".join(dict.fromkeys(vocab)) + "\n")
+    transformers.BertTokenizer(os.path.join(path, "vocab.txt")).save_pretrained(path)
+    torch.manual_seed(0)
+    config = transformers.BertConfig(vocab_size=len(dict.fromkeys(vocab)), hidden_size=32, num_hidden_layers=2,
+                                     num_attention_heads=2, intermediate_size=64, max_position_embeddings=128)
+    transformers.BertModel(config).save_pretrained(path)
+    return path
+
+
+@pytest.fixture(scope="session")
+def make_args(tmp_path_factory, tiny_model):
+    """Build parsed arguments for the fixture corpus, copied to a fresh base_path (stores are written there)."""
+    def make(**overrides):
+        base_path = str(tmp_path_factory.mktemp("corpus"))
+        for path in (SENTENCES_PATH, LEXICON_PATH):
+            shutil.copy(path, base_path)
+        defaults = config_parser.get_combined_config(os.path.join(ROOT, "config.ini"))
+        args = config_parser.build_parser(defaults).parse_args([
+            "--emb_model", tiny_model, "--base_path", base_path, "--jieba_dict_dir", os.path.join(base_path, "jieba"),
+            "--emb_cache_size", "0", "--retrieval_cache_size", "0",
+        ])
+        return language_args(argparse.Namespace(**{**vars(args), **overrides}), LANGUAGE)
+    return make
+
+
+def load_retriever(args):
+    data_utils = DatasetUtils(args.emb_model, args.compact_storage, **config_parser.embedding_options(args))
+    all_ch2amis = DatasetUtils._load_json(args.sentences_path, invert=True)
+    return KNNRetriever(args, data_utils._load_embeddings(args.sentence_embedding_path, all_ch2amis))
+
+
+@pytest.fixture(scope="session")
+def retriever(make_args):
+    return load_retriever(make_args())
@@ -0,0 +1,114 @@
+import os
+import json
+import shutil
+import pytest
+from src.main import BatchEvaluator
+from src.utils.dataset_utils import DatasetUtils
+
+
+@pytest.fixture
+def evaluator_args(make_args, tmp_path):
+    def make(**overrides):
+        return make_args(**{"stub_llm": True, "batch_result_path": str(tmp_path / "results"), "batch_workers": 2, **overrides})
+    return make
+
+
+def _fold_keys(root, folds):
+    return [set(DatasetUtils._load_json(os.path.join(root, f"fold_{fold + 1}", "test_data.json"))) for fold in range(folds)]
+
+
+def test_resumed_kfold_keeps_folds_disjoint(evaluator_args):
+    args = evaluator_args(seed=None, kfold=3)
+    evaluator = BatchEvaluator(args)
+    root = evaluator.version
+    sentence_embeddings = evaluator.data_utils._load_embeddings(args.sentence_embedding_path, evaluator.all_ch2amis)
+    evaluator.run_kfold(3, sentence_embeddings, ["RPC"])
+    before = _fold_keys(root, 3)
+
+    # 中斷在第 3 折之前：沒有 seed，續跑時也不能重新洗牌
+    shutil.rmtree(os.path.join(root, "fold_3"))
+    resumed = BatchEvaluator(evaluator_args(seed=None, kfold=3, resume=root))
+    resumed.run_kfold(3, sentence_embeddings, ["RPC"])
+    after = _fold_keys(root, 3)
+    assert after == before
+    assert not (after[0] & after[1] or after[0] & after[2] or after[1] & after[2])
+    assert set().union(*after) == set(evaluator.test_candidates())
+
+
+def test_kfold_splits_of_an_older_run_keep_its_saved_folds(evaluator_args):
+    evaluator = BatchEvaluator(evaluator_args(seed=None))
+    root = evaluator.version
+    first = evaluator.kfold_splits(3, root)
+    os.remove(os.path.join(root, "kfold_splits.json"))
+    evaluator.version = os.path.join(root, "fold_1")
+    os.makedirs(evaluator.version)
+    evaluator.save_split({key: evaluator.all_ch2amis[key] for key in first[0]}, {})
+
+    splits = BatchEvaluator(evaluator_args(seed=None, resume=root)).kfold_splits(3, root)
+    assert splits[0] == first[0]
+    assert not (set(splits[0]) & set(splits[1]) or set(splits[0]) & set(splits[2]) or set(splits[1]) & set(splits[2]))
+    assert sorted(key for split in splits for key in split) == sorted(evaluator.test_candidates())
+    with pytest.raises(ValueError):
+        evaluator.kfold_splits(4, root)
+
+
+def _evaluate(evaluator, modes, test_data=None, fail=(), evaluated=None):
+    # 可指定評估失敗的句子（模擬中斷），並記錄實際評估了哪些句子
+    if test_data is None:
+        test_data, test_datastore = evaluator.load_test_data() if evaluator.args.resume else evaluator.create_test_data()
+    else:
+        test_datastore = {key: value for key, value in evaluator.all_ch2amis.items() if key not in test_data}
+    evaluate_sentence = evaluator.evaluate_sentence
+
+    def counting(translator, input_sentence, *args, **kwargs):
+        if input_sentence in fail:
+            raise RuntimeError("interrupted")
+        if evaluated is not None:
+            evaluated.append(input_sentence)
+        return evaluate_sentence(translator, input_sentence, *args, **kwargs)
+
+    evaluator.evaluate_sentence = counting
+    sentence_embeddings = evaluator.data_utils._load_embeddings(evaluator.args.sentence_embedding_path, evaluator.all_ch2amis)
+    return test_data, evaluator.evaluate_modes(test_data, evaluator.data_utils._subset_embeddings(sentence_embeddings, test_datastore), modes)
+
+
+def _read_result(evaluator, mode):
+    with open(os.path.join(evaluator.version, f"{mode}_evaluation_result.json"), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def test_resume_finishes_an_interrupted_run_like_an_uninterrupted_one(evaluator_args):
+    modes = ["RPC", "COT", "LFM"]
+    args = dict(seed=7, batch_test_num=8, batch_workers=1, use_mistake_bank=False)
+    reference = BatchEvaluator(evaluator_args(**args))
+    test_data, _ = _evaluate(reference, modes)
+
+    # 中斷：一半的句子失敗，最後一筆完成的結果只寫了半行
+    interrupted = BatchEvaluator(evaluator_args(**args))
+    failing = list(test_data)[4:]
+    with pytest.raises(RuntimeError):
+        _evaluate(interrupted, modes, fail=failing)
+    for mode in modes:
+        path = os.path.join(interrupted.version, f"{mode}_evaluation_result.jsonl")
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+        assert len(lines) == 4
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(lines[:-1])
+            f.write(lines[-1][:len(lines[-1]) // 2])
+    cut = json.loads(lines[-1])["input_sentence"]
+
+    evaluated = []
+    resumed = BatchEvaluator(evaluator_args(**args, resume=interrupted.version))
+    _evaluate(resumed, modes, evaluated=evaluated)
+    assert sorted(evaluated) == sorted([cut, *failing])
+    for mode in modes:
+        assert _read_result(resumed, mode) == _read_result(reference, mode)
+        with open(os.path.join(resumed.version, f"{mode}_evaluation_result.jsonl"), "r", encoding="utf-8") as f:
+            keys = [json.loads(line)["input_sentence"] for line in f]
+        assert sorted(keys) == sorted(test_data)
+
+    # 全部完成後再續跑：不再評估任何句子
+    evaluated.clear()
+    _evaluate(BatchEvaluator(evaluator_args(**args, resume=interrupted.version)), modes, evaluated=evaluated)
+    assert evaluated == []
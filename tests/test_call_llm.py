@@ -0,0 +1,83 @@
+import json
+import threading
+import pytest
+from http.server import ThreadingHTTPServer
+from src.models.callLLM import GPT
+from src.models.stub_llm import StubCompletionHandler, stub_answer
+
+pytest.importorskip("openai")
+
+
+class FlakyHandler(StubCompletionHandler):
+    """Stub endpoint answering the first `failures` requests with `status` (and Retry-After: 0)."""
+    failures = 0
+    status = 429
+    requests = None
+
+    def do_POST(self):
+        self.requests.append(self.path)
+        if len(self.requests) <= self.failures:
+            body = json.dumps({"error": {"message": "throttled", "type": "rate_limit"}}).encode("utf-8")
+            # 讀掉請求內容，keep-alive 連線才能繼續使用
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            self.send_response(self.status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Retry-After", "0")
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        super().do_POST()
+
+
+@pytest.fixture
+def flaky_server():
+    def start(failures, status=429):
+        handler = type("Flaky", (FlakyHandler,), {"failures": failures, "status": status, "requests": []})
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return handler, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    servers = []
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+def test_retries_transient_errors(flaky_server, status):
+    handler, base_url = flaky_server(2, status)
+    gpt = GPT("test-key", "stub", base_url=base_url, max_retries=3, backoff_base=0.01)
+    prompt = "[zh]: 你好\n[amis]: Kapah haw\n\n"
+    assert gpt.get_response(prompt) == stub_answer([{"role": "user", "content": prompt}])
+    assert len(handler.requests) == 3
+
+
+def test_gives_up_after_max_retries(flaky_server):
+    import openai
+    handler, base_url = flaky_server(10)
+    gpt = GPT("test-key", "stub", base_url=base_url, max_retries=2, backoff_base=0.01)
+    with pytest.raises(openai.RateLimitError):
+        gpt.get_response("你好")
+    assert len(handler.requests) == 3
+
+
+def test_every_attempt_draws_from_the_rate_limits(flaky_server):
+    handler, base_url = flaky_server(2)
+    prompt = "你好"
+    gpt = GPT("test-key", "stub", base_url=base_url, max_retries=3, backoff_base=0.01,
+              requests_per_minute=3, tokens_per_minute=400)
+    gpt.get_response(prompt, max_output_tokens=100)
+    assert len(handler.requests) == 3
+    # 三次嘗試各取一次額度（測試期間補充的量很少）
+    assert gpt.request_bucket.tokens < 0.5
+    assert gpt.token_bucket.tokens < 400 - 3 * gpt._estimate_tokens([{"content": prompt}], 100) + 20
+
+
+def test_concurrent_responses_keep_prompt_order(flaky_server):
+    _, base_url = flaky_server(0)
+    gpt = GPT("test-key", "stub", base_url=base_url, max_concurrency=4)
+    prompts = [f"[amis]: answer {i}" for i in range(12)]
+    assert gpt.get_responses(prompts) == [f"answer {i}" for i in range(12)]
@@ -0,0 +1,89 @@
+import os
+import hashlib
+import numpy as np
+import pytest
+from conftest import EXTRA_QUERIES, load_retriever
+from src.utils.dataset_utils import DatasetUtils
+from src.utils.embedding_store import EmbeddingStore, store_dir
+from src.utils.memory_report import agreement
+
+faiss = pytest.importorskip("faiss")
+
+
+def _file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def _store_files(args):
+    return [os.path.join(store_dir(path), name) for path in (args.sentence_embedding_path, args.lexicon_embedding_path)
+            for name in ("vectors.npy", "index.json")]
+
+
+@pytest.fixture(scope="module")
+def layouts(make_args):
+    # 同一份語料先以 float32 載入，再以 compact_storage 載入
+    args = make_args(compact_storage=False)
+    full = load_retriever(args)
+    hashes = {path: _file_hash(path) for path in _store_files(args)}
+    compact = load_retriever(make_args(compact_storage=True, base_path=args.base_path))
+    return args, full, compact, hashes
+
+
+@pytest.fixture(scope="module")
+def queries(ch2amis):
+    return list(ch2amis) + EXTRA_QUERIES
+
+
+def test_float32_stores_are_left_untouched(layouts):
+    args, _, compact, hashes = layouts
+    assert {path: _file_hash(path) for path in _store_files(args)} == hashes
+    for path in (args.sentence_embedding_path, args.lexicon_embedding_path):
+        assert EmbeddingStore.load(store_dir(path)).dtype == "float32"
+        half = EmbeddingStore.load(store_dir(path, "float16"))
+        assert half.dtype == "float16" and half.source == EmbeddingStore.load(store_dir(path)).fingerprint
+    assert compact.sentences_emb.path == store_dir(args.sentence_embedding_path, "float16")
+
+
+def test_compact_flat_index_keeps_float16_vectors(layouts):
+    _, full, compact, _ = layouts
+    assert (compact.sentence_index_type, compact.lexicon_index_type) == ("sq16", "sq16")
+    assert isinstance(compact.sentence_index, faiss.IndexScalarQuantizer)
+    assert faiss.serialize_index(compact.sentence_index).nbytes < 0.6 * faiss.serialize_index(full.sentence_index).nbytes
+
+
+def test_float16_retrieval_agrees_with_float32(layouts, queries):
+    _, full, compact, _ = layouts
+    report = agreement(full, compact, queries, 5)
+    assert report["top5_agreement"] >= 0.9
+    assert report["lexicon_identical"] == 1.0
+
+
+def test_compact_storage_off_again_serves_full_precision(layouts, queries):
+    args, full, _, _ = layouts
+    again = load_retriever(args)
+    assert again.sentences_emb.dtype == "float32"
+    np.testing.assert_array_equal(again.sentences_emb.matrix, full.sentences_emb.matrix)
+    assert again.find_knn_examples_batch(queries, 5) == full.find_knn_examples_batch(queries, 5)
+
+
+def test_float16_copy_follows_the_float32_store(tmp_path, tiny_model, ch2amis):
+    keys = list(ch2amis)
+    path = str(tmp_path / "Test_sentences_embedding.npy")
+    data_utils = DatasetUtils(tiny_model, compact=True)
+    first = data_utils._load_embeddings(path, keys[:10])
+    assert first.dtype == "float16" and first.key_list == keys[:10]
+    second = data_utils._load_embeddings(path, keys[:12])
+    assert second.key_list == keys[:12]
+    assert second.source == EmbeddingStore.load(store_dir(path)).fingerprint != first.source
+
+
+def test_store_rounded_in_place_is_re_embedded(tmp_path, tiny_model, ch2amis):
+    # 舊版 compact_storage 會把 store 本身改寫成 float16
+    keys = list(ch2amis)[:5]
+    path = str(tmp_path / "Test_sentences_embedding.npy")
+    data_utils = DatasetUtils(tiny_model)
+    EmbeddingStore(data_utils.embedding_model.encode(keys), keys, tiny_model).save(store_dir(path), "float16")
+    store = data_utils._load_embeddings(path, keys)
+    assert store.dtype == "float32"
+    np.testing.assert_allclose(store.matrix, data_utils.embedding_model.encode(keys), atol=1e-5)
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from src.models.embedding import EmbeddingModel
+from src.models.embedding_cache import EmbeddingCache
+
+
+@pytest.fixture(scope="module")
+def sentences(ch2amis):
+    return list(ch2amis)[:6]
+
+
+def _forbid_model(monkeypatch, model):
+    # 之後任何一次 forward（批次或單句）都會失敗
+    def no_model(*args, **kwargs):
+        raise AssertionError("cached sentences must not reach the model")
+    monkeypatch.setattr(model, "_encode", no_model)
+    monkeypatch.setattr(model, "_load", no_model)
+    monkeypatch.setattr(model, "_model", None)
+
+
+def test_memory_tier_returns_identical_vectors_without_the_model(tiny_model, sentences, monkeypatch):
+    model = EmbeddingModel(tiny_model)
+    model.configure(cache_size=100)
+    vectors = model.encode(sentences)
+    single = model.get_single_embedding("老師很好")
+    _forbid_model(monkeypatch, model)
+    np.testing.assert_array_equal(model.encode(sentences), vectors)
+    np.testing.assert_array_equal(model.encode(sentences[::-1] + sentences[:1]), np.vstack([vectors[::-1], vectors[:1]]))
+    np.testing.assert_array_equal(model.get_single_embedding(sentences[0]), vectors[0])
+    np.testing.assert_array_equal(model.get_single_embedding("老師很好"), single)
+    assert model.cache.stats()["disk_hits"] == 0 and model.cache.stats()["memory_hits"] == 2 * len(sentences) + 3
+
+
+def test_new_model_reads_the_sqlite_tier(tiny_model, sentences, tmp_path, monkeypatch):
+    path = str(tmp_path / "embeddings.sqlite")
+    first = EmbeddingModel(tiny_model)
+    first.configure(cache_size=100, cache_path=path)
+    vectors = first.encode(sentences)
+    first.cache.close()
+
+    second = EmbeddingModel(tiny_model)
+    second.configure(cache_size=100, cache_path=path)
+    _forbid_model(monkeypatch, second)
+    np.testing.assert_array_equal(second.encode(sentences), vectors)
+    assert second.cache.stats()["disk_hits"] == len(sentences)
+    # 讀回後放進記憶體層
+    np.testing.assert_array_equal(second.get_single_embedding(sentences[0]), vectors[0])
+    assert second.cache.stats()["memory_hits"] == 1
+
+
+def test_int8_vectors_are_cached_apart_from_float(tiny_model, sentences, tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    float_model = EmbeddingModel(tiny_model)
+    float_model.configure(cache_size=100, cache_path=path)
+    float_model.encode(sentences)
+    int8_model = EmbeddingModel(tiny_model, backend="int8")
+    int8_model.configure(cache_size=100, cache_path=path)
+    int8_model.encode(sentences)
+    assert int8_model.cache.stats()["misses"] == len(sentences)
+
+
+def test_memory_tier_is_bounded():
+    cache = EmbeddingCache(max_entries=2)
+    for text in ("a", "b", "c"):
+        cache.put("m", text, np.full(4, ord(text), dtype=np.float32))
+    assert cache.get("m", "a") is None
+    assert cache.get("other", "b") is None
+    np.testing.assert_array_equal(cache.get("m", "c"), np.full(4, ord("c"), dtype=np.float32))
+    assert cache.stats()["memory_entries"] == 2
@@ -0,0 +1,133 @@
+import os
+import json
+import numpy as np
+import pytest
+from conftest import load_retriever
+from src.utils.dataset_utils import DatasetUtils
+from src.utils.embedding_store import LEGACY_MODEL, EmbeddingStore, convert_legacy, store_dir
+
+
+def _legacy_file(path, keys, dim=8, seed=0):
+    rng = np.random.default_rng(seed)
+    embeddings = {key: rng.standard_normal(dim).astype(np.float32) for key in keys}
+    np.save(path, embeddings, allow_pickle=True)
+    return embeddings
+
+
+def test_round_trip(tmp_path):
+    matrix = np.arange(12, dtype=np.float32).reshape(3, 4)
+    EmbeddingStore(matrix, ["a", "b", "c"], "model").save(str(tmp_path / "x.store"))
+    store = EmbeddingStore.load(str(tmp_path / "x.store"))
+    assert isinstance(store.matrix, np.memmap)
+    assert store.key_list == ["a", "b", "c"] and store.model_name == "model"
+    np.testing.assert_array_equal(store["b"], matrix[1])
+
+
+def test_convert_legacy_without_model_is_labelled_legacy(tmp_path):
+    path = str(tmp_path / "x_embedding.npy")
+    embeddings = _legacy_file(path, ["你好", "謝謝"])
+    store = EmbeddingStore.load(convert_legacy(path))
+    assert store.model_name == LEGACY_MODEL
+    np.testing.assert_array_equal(store["謝謝"], embeddings["謝謝"])
+
+
+def test_convert_legacy_with_named_model(tmp_path):
+    path = str(tmp_path / "x_embedding.npy")
+    _legacy_file(path, ["你好"])
+    assert EmbeddingStore.load(convert_legacy(path, "some/model")).model_name == "some/model"
+
+
+class _Unpickled:
+    # 被 unpickle 時會建立 marker 目錄
+    def __init__(self, marker):
+        self.marker = marker
+
+    def __reduce__(self):
+        return os.mkdir, (self.marker,)
+
+
+def test_legacy_file_is_re_embedded_without_unpickling(tmp_path, tiny_model, ch2amis):
+    keys = list(ch2amis)[:5]
+    marker = str(tmp_path / "unpickled")
+    path = str(tmp_path / "Test_sentences_embedding.npy")
+    np.save(path, {key: _Unpickled(marker) for key in keys}, allow_pickle=True)
+    lexicon_path = str(tmp_path / "Test_lexicon_embedding.npy")
+    np.save(lexicon_path, np.array([_Unpickled(marker)], dtype=object), allow_pickle=True)
+    data_utils = DatasetUtils(tiny_model)
+    store = data_utils._load_embeddings(path, keys)
+    data_utils._load_lexicon_embeddings(lexicon_path, [["老師"]])
+    assert not os.path.exists(marker)
+    assert store.model_name == tiny_model
+    np.testing.assert_allclose(store.matrix, data_utils.embedding_model.encode(keys), atol=1e-5)
+    assert EmbeddingStore.load(store_dir(path)).model_name == tiny_model
+
+
+def test_store_of_another_model_is_re_embedded(tmp_path, tiny_model, ch2amis):
+    keys = list(ch2amis)[:5]
+    path = str(tmp_path / "Test_sentences_embedding.npy")
+    EmbeddingStore(np.zeros((5, 32), dtype=np.float32), keys, "other/model").save(store_dir(path))
+    store = DatasetUtils(tiny_model)._load_embeddings(path, keys)
+    assert store.model_name == tiny_model
+    assert np.abs(np.asarray(store.matrix)).sum() > 0
+
+
+def test_mismatched_row_count_is_rejected():
+    with pytest.raises(ValueError):
+        EmbeddingStore(np.zeros((2, 4), dtype=np.float32), ["a"])
+
+
+def _rewrite_json(path, edit):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    edit(data)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+
+
+def _nearest_distances(index, matrix):
+    return index.search(np.ascontiguousarray(matrix, dtype=np.float32), 1)[0][:, 0]
+
+
+def test_saved_indexes_follow_a_row_edited_in_place(make_args):
+    pytest.importorskip("faiss")
+    args = make_args(sentence_index="hnsw", lexicon_index="ivf")
+    retriever = load_retriever(args)
+    sentence_count, gloss_count = retriever.sentence_index.ntotal, retriever.faiss_index.ntotal
+
+    # 改一句與一個詞義，筆數不變：已存的 hnsw / ivf 索引不能再沿用舊向量
+    edited_sentence = "老師很好，我們明天去學校。"
+    edited_gloss = "明天的老師"
+    first = lambda data: next(iter(data))
+    _rewrite_json(args.sentences_path, lambda data: data.update({first(data): edited_sentence}))
+    _rewrite_json(args.lexicon_path, lambda data: data[first(data)].__setitem__(0, edited_gloss))
+    retriever = load_retriever(args)
+
+    sentences = EmbeddingStore.load(store_dir(args.sentence_embedding_path))
+    glosses = EmbeddingStore.load(store_dir(args.lexicon_embedding_path))
+    assert (retriever.sentence_index.ntotal, retriever.faiss_index.ntotal) == (sentence_count, gloss_count)
+    assert sentences.fingerprint and glosses.fingerprint
+    # 每一列查自己都應距離 0：索引中的向量與 store 一致
+    np.testing.assert_allclose(_nearest_distances(retriever.sentence_index, sentences.matrix), 0, atol=1e-4)
+    np.testing.assert_allclose(_nearest_distances(retriever.faiss_index, glosses.matrix), 0, atol=1e-4)
+    row = sentences.offset(edited_sentence)
+    assert retriever.sentence_index.search(np.asarray(sentences.matrix[row:row + 1], dtype=np.float32), 1)[1][0, 0] == row
+    e, e2 = retriever.find_similar(edited_gloss)
+    assert retriever.lexicon_list[e][e2] == edited_gloss
+
+
+def test_int8_backend_writes_float_vectors_to_the_store(tmp_path, tiny_model, ch2amis):
+    from src.models.embedding import EmbeddingModel
+    keys = list(ch2amis)[:8]
+    path = str(tmp_path / "Test_sentences_embedding.npy")
+    data_utils = DatasetUtils(tiny_model, backend="int8")
+    try:
+        # 首次建立與增量更新都由 float 模型嵌入
+        data_utils._load_embeddings(path, keys[:5])
+        store = data_utils._load_embeddings(path, keys)
+        query_vectors = data_utils.embedding_model.encode(keys)
+    finally:
+        data_utils.embedding_model.configure(backend="torch")
+    float_vectors = EmbeddingModel(tiny_model).encode(keys)
+    assert store.model_name == tiny_model
+    np.testing.assert_allclose(store.matrix, float_vectors, atol=1e-5)
+    assert not np.allclose(query_vectors, float_vectors, atol=1e-5)
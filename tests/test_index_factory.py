@@ -0,0 +1,70 @@
+import os
+import numpy as np
+import pytest
+from src.models.index_factory import INDEX_TYPES, build_index, embeddings_fingerprint, index_file
+
+faiss = pytest.importorskip("faiss")
+
+
+def _matrix(count=400, dim=32, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+
+
+def _nearest(index, queries):
+    return index.search(np.ascontiguousarray(queries, dtype=np.float32), 1)[1][:, 0]
+
+
+@pytest.mark.parametrize("index_type", INDEX_TYPES)
+def test_every_index_type_finds_the_query_row(index_type):
+    matrix = _matrix()
+    found = _nearest(build_index(matrix, index_type, nlist=8, nprobe=8), matrix[:50])
+    # pq 有損，只要求大多數找得到自己
+    assert np.mean(found == np.arange(50)) >= (0.5 if index_type == "pq" else 0.95)
+
+
+def test_saved_index_is_reused_for_the_same_vectors(tmp_path):
+    matrix = _matrix()
+    path = index_file(str(tmp_path), "hnsw")
+    build_index(matrix, "hnsw", path, model_name="m")
+    mtime = os.path.getmtime(path)
+    index = build_index(matrix, "hnsw", path, model_name="m", fingerprint=embeddings_fingerprint(matrix))
+    assert os.path.getmtime(path) == mtime
+    assert index.ntotal == len(matrix)
+
+
+@pytest.mark.parametrize("index_type", ["hnsw", "ivf", "pq"])
+def test_saved_index_of_other_vectors_with_same_shape_is_rebuilt(tmp_path, index_type):
+    path = index_file(str(tmp_path), index_type)
+    build_index(_matrix(seed=0), index_type, path, nlist=8, nprobe=8, model_name="m")
+    other = _matrix(seed=1)
+    found = _nearest(build_index(other, index_type, path, nlist=8, nprobe=8, model_name="m"), other[:50])
+    assert np.mean(found == np.arange(50)) >= (0.5 if index_type == "pq" else 0.95)
+
+
+def test_saved_index_of_another_model_is_rebuilt(tmp_path):
+    matrix = _matrix()
+    path = index_file(str(tmp_path), "hnsw")
+    build_index(matrix, "hnsw", path, model_name="a")
+    mtime_ns = os.stat(path).st_mtime_ns
+    build_index(matrix, "hnsw", path, model_name="b")
+    assert os.stat(path).st_mtime_ns != mtime_ns
+
+
+def test_saved_index_without_metadata_is_rebuilt(tmp_path):
+    matrix = _matrix()
+    path = index_file(str(tmp_path), "hnsw")
+    faiss.write_index(build_index(_matrix(seed=1), "hnsw"), path)
+    found = _nearest(build_index(matrix, "hnsw", path, model_name="m"), matrix[:50])
+    assert np.mean(found == np.arange(50)) >= 0.95
+
+
+def test_ivf_keeps_trained_clusters_when_rows_change(tmp_path):
+    path = index_file(str(tmp_path), "ivf")
+    matrix = _matrix()
+    first = build_index(matrix, "ivf", path, nlist=8, model_name="m")
+    centroids = faiss.vector_to_array(faiss.downcast_index(faiss.extract_index_ivf(first).quantizer).codes)
+    grown = np.vstack([matrix, _matrix(count=20, seed=2)])
+    second = build_index(grown, "ivf", path, nlist=8, model_name="m")
+    assert second.ntotal == len(grown)
+    np.testing.assert_array_equal(
+        faiss.vector_to_array(faiss.downcast_index(faiss.extract_index_ivf(second).quantizer).codes), centroids)
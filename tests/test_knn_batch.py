@@ -0,0 +1,37 @@
+import pytest
+from conftest import EXTRA_QUERIES
+
+
+@pytest.fixture(scope="module")
+def queries(ch2amis):
+    return list(ch2amis) + EXTRA_QUERIES
+
+
+@pytest.mark.parametrize("k", [0, 1, 5])
+def test_batch_neighbours_match_single_queries(retriever, queries, k):
+    assert retriever.find_knn_examples_topN_sentence_batch(queries, k) == [
+        retriever.find_knn_examples_topN_sentence(query, k) for query in queries]
+
+
+def test_neighbours_exclude_the_query_itself(retriever, ch2amis):
+    for sentence in ch2amis:
+        neighbours = retriever.find_knn_examples_topN_sentence(sentence, 5)
+        assert len(neighbours) == 5
+        assert sentence not in [zh for zh, _ in neighbours]
+
+
+@pytest.mark.parametrize("k", [0, 5])
+@pytest.mark.parametrize("findlexicon", [True, False])
+def test_batch_examples_match_single_queries(retriever, queries, k, findlexicon):
+    assert retriever.find_knn_examples_batch(queries, k, findlexicon) == [
+        retriever.find_knn_examples(query, k, findlexicon) for query in queries]
+
+
+def test_batch_of_repeated_and_empty_input(retriever):
+    assert retriever.find_knn_examples_batch([], 5) == []
+    assert retriever.find_knn_examples_batch(["你好", "你好"], 5) == [retriever.find_knn_examples("你好", 5)] * 2
+
+
+def test_similar_batch_matches_single_lookups(retriever):
+    terms = ["台灣", "學校", "大學", "開會", "明天"]
+    assert retriever.find_similar_batch(terms) == {term: retriever.find_similar(term) for term in terms}
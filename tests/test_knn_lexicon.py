@@ -0,0 +1,66 @@
+import re
+import string
+import pytest
+from conftest import EXTRA_QUERIES
+
+
+def per_segment_check_not_found(retriever, sentence):
+    # 原本的 _check_not_found_sentence：每個 jieba 片段各自 find_similar
+    if not sentence:
+        return ""
+    return ''.join(
+        f"[*zh]: {text}\n[zh]: {'/'.join(retriever.lexicon_list[e[0]])}\n[amis]: {retriever.lexicon[e[0]][0]}\n\n"
+        for text in retriever.segmenter.cut(sentence) if text.strip() and (e := retriever.find_similar(text))
+    )
+
+
+def per_segment_trans(retriever, sentence):
+    # 原本的 trans：比對途中遇到詞表詞就先查之前找不到的片段
+    ans = ""
+    cant_find_sentence = ""
+    pos = 0
+    while pos < len(sentence):
+        index_list = retriever._find_longest_match(sentence, pos)
+        if index_list:
+            ans += per_segment_check_not_found(retriever, cant_find_sentence)
+            cant_find_sentence = ""
+            ans += ''.join(retriever._format_parallel_data(index) for index in index_list)
+            pos += len(retriever.lexicon_list[index_list[0][0]][index_list[0][1]])
+        else:
+            cant_find_sentence += sentence[pos]
+            pos += 1
+    ans += per_segment_check_not_found(retriever, cant_find_sentence)
+    return ans
+
+
+def per_segment_find_lexicon(retriever, sentence):
+    translator = str.maketrans("，。！", "   ", string.punctuation)
+    sentence_cleaned = sentence.translate(translator)
+    examples = per_segment_trans(retriever, re.sub(r'[a-zA-Z]+', '', sentence_cleaned))
+    for lexicon in re.findall(r'[a-zA-Z]+', sentence_cleaned):
+        examples += f"[zh]: {lexicon}\n[amis]: {lexicon}\n\n"
+    return examples
+
+
+@pytest.fixture(scope="module")
+def queries(ch2amis):
+    return list(ch2amis) + EXTRA_QUERIES
+
+
+def test_queries_reach_the_fallback_lookup(retriever, queries):
+    assert sum("[*zh]: " in retriever._find_lexicon(query) for query in queries) >= len(EXTRA_QUERIES)
+
+
+def test_trans_matches_per_segment_lookup(retriever, queries):
+    for query in queries:
+        assert retriever.trans(query) == per_segment_trans(retriever, query)
+
+
+def test_find_lexicon_matches_per_segment_lookup(retriever, queries):
+    for query in queries:
+        assert retriever._find_lexicon(query) == per_segment_find_lexicon(retriever, query)
+
+
+@pytest.mark.parametrize("sentence", ["", "中興大學位於台灣", "Panay喜歡紅色"])
+def test_check_not_found_sentence_matches_per_segment_lookup(retriever, sentence):
+    assert retriever._check_not_found_sentence(sentence) == per_segment_check_not_found(retriever, sentence)
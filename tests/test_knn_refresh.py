@@ -0,0 +1,78 @@
+import json
+import threading
+from conftest import EXTRA_QUERIES, load_retriever
+
+
+def _write_json(path, data):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+
+
+def test_queries_during_refresh_see_one_consistent_state(make_args):
+    args = make_args()
+    retriever = load_retriever(args)
+    with open(args.lexicon_path, "r", encoding="utf-8") as f:
+        full_lexicon = json.load(f)
+    with open(args.sentences_path, "r", encoding="utf-8") as f:
+        full_sentences = json.load(f)
+    # 交替刪掉一半詞條與句子：新舊詞表、mapping、索引的筆數都不同
+    half_lexicon = dict(list(full_lexicon.items())[::2])
+    half_sentences = dict(list(full_sentences.items())[::2])
+    queries = list(retriever.all_ch2amis) + EXTRA_QUERIES
+
+    errors, stop = [], threading.Event()
+
+    def query():
+        while not stop.is_set():
+            try:
+                for examples in retriever.find_knn_examples_batch(queries, 5):
+                    assert isinstance(examples, str)
+                retriever.find_knn_examples(queries[-1], 5)
+            except Exception as error:
+                errors.append(error)
+                return
+
+    threads = [threading.Thread(target=query) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    try:
+        for lexicon, sentences in [(half_lexicon, half_sentences), (full_lexicon, full_sentences)] * 2:
+            _write_json(args.lexicon_path, lexicon)
+            _write_json(args.sentences_path, sentences)
+            retriever.refresh()
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    assert errors == []
+    assert retriever.find_knn_examples_batch(queries, 5) == load_retriever(args).find_knn_examples_batch(queries, 5)
+
+
+def test_refresh_swaps_in_the_new_state_only_when_complete(make_args):
+    args = make_args()
+    retriever = load_retriever(args)
+    queries = list(retriever.all_ch2amis) + EXTRA_QUERIES
+    before = retriever.find_knn_examples_batch(queries, 5)
+    with open(args.lexicon_path, "r", encoding="utf-8") as f:
+        lexicon = json.load(f)
+    _write_json(args.lexicon_path, dict(list(lexicon.items())[::2]))
+
+    # 在建句子索引時暫停 refresh：新詞表已建好，但查詢仍應完全看到舊狀態
+    building, release = threading.Event(), threading.Event()
+    build_sentence_index = retriever._build_sentence_index
+
+    def paused_build(sentences_emb):
+        building.set()
+        release.wait(timeout=30)
+        return build_sentence_index(sentences_emb)
+
+    retriever._build_sentence_index = paused_build
+    refresh = threading.Thread(target=retriever.refresh)
+    refresh.start()
+    try:
+        assert building.wait(timeout=30)
+        assert retriever.find_knn_examples_batch(queries, 5) == before
+    finally:
+        release.set()
+        refresh.join()
+    assert retriever.find_knn_examples_batch(queries, 5) == load_retriever(args).find_knn_examples_batch(queries, 5) != before
@@ -0,0 +1,56 @@
+import os
+import time
+import shutil
+import threading
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import src.models.language_registry as language_registry
+from src.models.language_registry import LanguageRegistry, discover_languages
+from conftest import LEXICON_PATH, SENTENCES_PATH
+
+
+@pytest.fixture
+def two_languages(tmp_path):
+    for language in ("Alpha", "Beta"):
+        shutil.copy(SENTENCES_PATH, os.path.join(tmp_path, f"{language}_sentences.json"))
+        shutil.copy(LEXICON_PATH, os.path.join(tmp_path, f"{language}_lexicon.json"))
+    return argparse.Namespace(base_path=str(tmp_path), prompt_path=str(tmp_path), language="Alpha",
+                              rpc_prompt_path="rpc.txt", cot_prompt_path="cot.json")
+
+
+def test_discovers_languages(two_languages):
+    assert discover_languages(two_languages.base_path) == ["Alpha", "Beta"]
+
+
+def test_languages_loading_at_once_share_one_llm(two_languages, monkeypatch):
+    built = []
+    barrier = threading.Barrier(2)
+
+    def slow_build_llm(args):
+        built.append(object())
+        time.sleep(0.2)
+        return built[-1]
+
+    def factory(args, llm):
+        barrier.wait(timeout=5)
+        return args.language, llm
+
+    monkeypatch.setattr(language_registry, "build_llm", slow_build_llm)
+    registry = LanguageRegistry(two_languages, factory, max_loaded=0, idle_seconds=0)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        values = list(executor.map(registry.get, ["Alpha", "Beta"]))
+    assert len(built) == 1
+    assert [language for language, _ in values] == ["Alpha", "Beta"]
+    assert all(llm is registry.llm for _, llm in values)
+
+
+def test_least_recently_used_language_is_evicted(two_languages, monkeypatch):
+    monkeypatch.setattr(language_registry, "build_llm", lambda args: None)
+    registry = LanguageRegistry(two_languages, lambda args, llm: args.language, max_loaded=1, idle_seconds=0)
+    assert registry.get("Alpha") == "Alpha"
+    assert registry.get("Beta") == "Beta"
+    assert registry.loaded() == ["Beta"]
+    assert registry.peek("Alpha") is None
+    with pytest.raises(ValueError):
+        registry.get("Gamma")
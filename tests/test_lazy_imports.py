@@ -0,0 +1,11 @@
+import subprocess
+import sys
+from conftest import ROOT
+
+
+def test_thread_count_does_not_import_torch():
+    # torch 延到模型載入時才 import；設定執行緒數不能提早載入
+    code = ("import sys; from src.models.embedding import EmbeddingModel; "
+            "model = EmbeddingModel('unused', num_threads=2); model.configure(num_threads=3); "
+            "assert model.num_threads == 3; assert 'torch' not in sys.modules, 'torch imported'")
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True)
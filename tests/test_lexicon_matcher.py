@@ -0,0 +1,59 @@
+import pytest
+from src.models.lexicon_matcher import LexiconTrie
+
+
+def linear_longest_match(lexicon_list, sentence):
+    # 原本 KNNRetriever._find_longest_match 的逐一比對版本
+    temp_list = []
+    max_len = 0
+    for e, w in enumerate(lexicon_list):
+        for e2, w2 in enumerate(w):
+            if len(sentence) >= len(w2) and w2 == sentence[:len(w2)]:
+                temp_list.append([e, e2])
+                max_len = max(max_len, len(w2))
+    if temp_list and max_len == 0:
+        raise ValueError("Data Error: lexicon_list contains empty string elements.")
+    return [item for item in temp_list if len(lexicon_list[item[0]][item[1]]) == max_len]
+
+
+def test_trie_matches_linear_scan_at_every_position(ch2amis, lexicon):
+    _, lexicon_list = lexicon
+    trie = LexiconTrie(lexicon_list)
+    checked = 0
+    for sentence in ch2amis:
+        for start in range(len(sentence) + 1):
+            assert trie.longest_match(sentence, start) == linear_longest_match(lexicon_list, sentence[start:])
+            checked += 1
+    assert checked > 300
+
+
+def test_trie_returns_every_entry_sharing_the_longest_gloss(lexicon):
+    _, lexicon_list = lexicon
+    trie = LexiconTrie(lexicon_list)
+    # 「好」出現在多個詞條中，全部都要回傳且依詞表順序
+    matches = trie.longest_match("好")
+    assert len(matches) > 1
+    assert matches == linear_longest_match(lexicon_list, "好")
+    assert matches == sorted(matches)
+
+
+def test_trie_prefers_longer_gloss(lexicon):
+    _, lexicon_list = lexicon
+    trie = LexiconTrie(lexicon_list)
+    matches = trie.longest_match("老師的書")
+    assert matches == linear_longest_match(lexicon_list, "老師的書")
+    assert {lexicon_list[e][e2] for e, e2 in matches} == {"老師的"}
+
+
+@pytest.mark.parametrize("sentence", ["", "abc", "。"])
+def test_trie_without_match(lexicon, sentence):
+    _, lexicon_list = lexicon
+    assert LexiconTrie(lexicon_list).longest_match(sentence) == linear_longest_match(lexicon_list, sentence) == []
+
+
+def test_empty_gloss_raises_like_linear_scan():
+    lexicon_list = [["老師"], [""]]
+    with pytest.raises(ValueError):
+        linear_longest_match(lexicon_list, "你好")
+    with pytest.raises(ValueError):
+        LexiconTrie(lexicon_list).longest_match("你好")
@@ -0,0 +1,107 @@
+import time
+import threading
+import pytest
+from http.server import ThreadingHTTPServer
+from src.models.callLLM import GPT
+from src.models.llm_cache import ResponseCache, SQLiteResponseCache, build_response_cache
+from src.models.stub_llm import StubCompletionHandler, stub_answer
+
+PROMPT = "[zh]: 你好\n[amis]: Kapah haw\n\n"
+
+
+class CountingHandler(StubCompletionHandler):
+    requests = None
+
+    def do_POST(self):
+        self.requests.append(self.path)
+        super().do_POST()
+
+
+@pytest.fixture
+def stub_server():
+    handler = type("Counting", (CountingHandler,), {"requests": []})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield handler, f"http://127.0.0.1:{server.server_address[1]}/v1"
+    server.shutdown()
+
+
+def _gpt(base_url, cache):
+    pytest.importorskip("openai")
+    return GPT("test-key", "stub", cache, base_url=base_url)
+
+
+def test_readwrite_serves_hits_without_a_request(stub_server, tmp_path):
+    handler, base_url = stub_server
+    cache = SQLiteResponseCache(str(tmp_path / "llm.sqlite"))
+    gpt = _gpt(base_url, cache)
+    answer = gpt.get_response(PROMPT)
+    assert answer == stub_answer([{"role": "user", "content": PROMPT}])
+    assert gpt.get_response(PROMPT) == answer
+    assert len(handler.requests) == 1
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+    # 另一個行程（新的連線）也讀得到
+    assert _gpt(base_url, SQLiteResponseCache(str(tmp_path / "llm.sqlite"), "readonly")).get_response(PROMPT) == answer
+    assert len(handler.requests) == 1
+
+
+def test_readonly_never_writes(stub_server, tmp_path):
+    handler, base_url = stub_server
+    path = str(tmp_path / "llm.sqlite")
+    SQLiteResponseCache(path).close()
+    gpt = _gpt(base_url, SQLiteResponseCache(path, "readonly"))
+    gpt.get_response(PROMPT)
+    gpt.get_response(PROMPT)
+    assert len(handler.requests) == 2
+    assert SQLiteResponseCache(path)._size == 0
+
+
+def test_replay_raises_on_a_miss_without_a_request(stub_server, tmp_path):
+    handler, base_url = stub_server
+    path = str(tmp_path / "llm.sqlite")
+    answer = _gpt(base_url, SQLiteResponseCache(path)).get_response(PROMPT)
+    replay = GPT("", "stub", SQLiteResponseCache(path, "replay"), base_url=base_url)
+    assert replay.get_response(PROMPT) == answer
+    with pytest.raises(LookupError):
+        replay.get_response("另一句")
+    assert len(handler.requests) == 1
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = SQLiteResponseCache(str(tmp_path / "llm.sqlite"), max_entries=2)
+    for key in ("a", "b"):
+        cache.put(key, key)
+        time.sleep(0.01)
+    assert cache.get("a") == "a"
+    time.sleep(0.01)
+    cache.put("c", "c")
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == ("a", "c")
+    cache.put("c", "c2")
+    assert cache._size == 2
+
+
+def test_keys_differ_by_model_temperature_and_length():
+    messages = [{"role": "user", "content": PROMPT}]
+    key = ResponseCache.make_key("gpt-a", messages, 0, 512)
+    assert key == ResponseCache.make_key("gpt-a", [dict(messages[0])], 0, 512)
+    others = [ResponseCache.make_key("gpt-b", messages, 0, 512), ResponseCache.make_key("gpt-a", messages, 0.7, 512),
+              ResponseCache.make_key("gpt-a", messages, 0, 256), ResponseCache.make_key("gpt-a", [{"role": "user", "content": "x"}], 0, 512)]
+    assert key not in others and len(set(others)) == len(others)
+
+
+def test_model_and_temperature_are_cached_separately(stub_server, tmp_path):
+    handler, base_url = stub_server
+    gpt = _gpt(base_url, SQLiteResponseCache(str(tmp_path / "llm.sqlite")))
+    for model, temperature in [("stub", 0), ("stub", 0.7), ("stub-2", 0), ("stub", 0), ("stub-2", 0)]:
+        gpt.get_response(PROMPT, model=model, temperature=temperature)
+    assert len(handler.requests) == 3
+
+
+def test_build_response_cache(tmp_path):
+    assert build_response_cache("", "readwrite") is None
+    assert build_response_cache(str(tmp_path / "llm.sqlite"), "off") is None
+    assert build_response_cache(str(tmp_path / "llm.sqlite"), "replay").mode == "replay"
+    with pytest.raises(ValueError):
+        SQLiteResponseCache(str(tmp_path / "llm.sqlite"), "always")
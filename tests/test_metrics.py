@@ -0,0 +1,99 @@
+import random
+import pytest
+from src.utils.metrics import (BLEU_WEIGHTS, chrf_stats, chrf_words, corpus_bleu_scores, corpus_chrf, corpus_scores,
+                               sentence_bleu_scores, sentence_chrf)
+
+bleu_score = pytest.importorskip("nltk.translate.bleu_score")
+chrf_score = pytest.importorskip("nltk.translate.chrf_score")
+# nltk 在沒有高階 n-gram 相符時發出警告，分數仍為 0
+pytestmark = pytest.mark.filterwarnings("ignore::UserWarning")
+
+
+@pytest.fixture(scope="module")
+def pairs(ch2amis):
+    # 參考譯文為阿美語句子；假設譯文包含完全相同、部分相同、打亂、過短與空字串
+    amis = list(ch2amis.values())
+    rng = random.Random(0)
+    pairs = []
+    for reference in amis:
+        words = reference.split()
+        pairs.append((reference, reference))
+        pairs.append((reference, " ".join(words[:max(1, len(words) // 2)])))
+        pairs.append((reference, " ".join(rng.sample(words, len(words)))))
+        pairs.append((reference, rng.choice(amis)))
+    pairs += [(amis[0], ""), (amis[1], "xyz"), ("a b c d e", "a b c d e f g")]
+    return pairs
+
+
+def test_sentence_bleu_matches_nltk(pairs):
+    for reference, hypothesis in pairs:
+        scores = sentence_bleu_scores(reference, hypothesis)
+        for name, weights in BLEU_WEIGHTS.items():
+            expected = bleu_score.sentence_bleu([reference.split()], hypothesis.split(), weights=weights)
+            assert scores[name] == pytest.approx(expected, abs=1e-12), (reference, hypothesis, name)
+
+
+def test_corpus_bleu_matches_nltk(pairs):
+    references = [reference for reference, _ in pairs]
+    hypotheses = [hypothesis for _, hypothesis in pairs]
+    scores = corpus_bleu_scores(references, hypotheses)
+    for name, weights in BLEU_WEIGHTS.items():
+        expected = bleu_score.corpus_bleu([[r.split()] for r in references], [h.split() for h in hypotheses], weights=weights)
+        assert scores[name] == pytest.approx(expected, abs=1e-12)
+
+
+@pytest.mark.parametrize("beta", [1, 2, 3])
+def test_single_order_chrf_matches_nltk(pairs, beta):
+    # 只有一階時 nltk 與 sacreBLEU 的 chrF 定義相同
+    for reference, hypothesis in pairs:
+        if not reference.strip() or not hypothesis.strip():
+            continue
+        expected = chrf_score.sentence_chrf(reference, hypothesis, min_len=1, max_len=1, beta=beta)
+        assert sentence_chrf(reference, hypothesis, char_order=1, beta=beta) == pytest.approx(expected, abs=1e-12)
+
+
+def test_chrf_averages_precision_and_recall_over_orders():
+    # ref "abcd"、hyp "abce"：1-gram 3/4、2-gram 2/3、3-gram 1/2、4-gram 0/1
+    stats = chrf_stats("abcd", "abce", char_order=4)
+    assert stats.tolist() == [[4, 4, 3], [3, 3, 2], [2, 2, 1], [1, 1, 0]]
+    assert sentence_chrf("abcd", "abce", char_order=4) == pytest.approx((3 / 4 + 2 / 3 + 1 / 2 + 0) / 4)
+    # ref "abc"、hyp "ab"：precision (1 + 1) / 2、recall (2/3 + 1/2) / 2，再算一次 F
+    precision, recall = 1.0, (2 / 3 + 1 / 2) / 2
+    assert sentence_chrf("abc", "ab", char_order=2) == pytest.approx(5 * precision * recall / (4 * precision + recall))
+    assert sentence_chrf("a b", "ab") == sentence_chrf("a\tb\n", " a b") == 1.0
+
+
+def test_chrf_words_split_off_punctuation():
+    assert chrf_words("Maolah kako to tamdaw, o wawa ni Panay.") == [
+        "Maolah", "kako", "to", "tamdaw", ",", "o", "wawa", "ni", "Panay", "."]
+    assert chrf_words("(hi) \"ok ? a.b") == ["(hi", ")", "\"", "ok", "?", "a.b"]
+
+
+def test_chrf_plus_plus_with_punctuation_matches_sacrebleu_values():
+    # 期望值由 sacreBLEU 2.6.0 的 sentence_chrf 算出（不需安裝 sacrebleu）
+    reference = "Maolah kako to tamdaw, o wawa ni Panay."
+    hypothesis = "Maolah kako tamdaw. o wawa ni Panay"
+    assert sentence_chrf(reference, hypothesis, word_order=2) == pytest.approx(0.7325759172633681, abs=1e-12)
+    assert sentence_chrf(reference, hypothesis) == pytest.approx(0.7599562561432686, abs=1e-12)
+    scores = corpus_scores([reference, "Kapah haw kisu?"], [hypothesis, "kapah haw kisu ?"])
+    assert (scores["corpus_chrF"], scores["corpus_chrF++"]) == (0.7955, 0.7625)
+
+
+def test_corpus_chrf_sums_statistics_before_the_f_score(pairs):
+    references = [reference for reference, _ in pairs[:20]]
+    hypotheses = [hypothesis for _, hypothesis in pairs[:20]]
+    # 每句各自截斷的相符數加總後才算 F-score（sacreBLEU 的 corpus chrF）
+    hyp_total, ref_total, matches = sum(chrf_stats(r, h, char_order=1) for r, h in zip(references, hypotheses))[0]
+    precision, recall = matches / hyp_total, matches / ref_total
+    expected = 5 * precision * recall / (4 * precision + recall)
+    assert corpus_chrf(references, hypotheses, char_order=1) == pytest.approx(expected)
+    assert corpus_chrf(references[:1], hypotheses[:1]) == pytest.approx(sentence_chrf(references[0], hypotheses[0]))
+
+
+def test_chrf_matches_sacrebleu(pairs):
+    sacrebleu = pytest.importorskip("sacrebleu")
+    references = [reference for reference, _ in pairs]
+    hypotheses = [hypothesis for _, hypothesis in pairs]
+    for word_order, name in ((0, "corpus_chrF"), (2, "corpus_chrF++")):
+        expected = sacrebleu.corpus_chrf(hypotheses, [references], word_order=word_order).score / 100
+        assert corpus_scores(references, hypotheses)[name] == pytest.approx(expected, abs=1e-4)
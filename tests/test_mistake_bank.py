@@ -0,0 +1,75 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from conftest import load_retriever
+from src.models.mistake_bank import MistakeBank, bank_stamp
+from src.models.translation import Ch2AmisTranslator
+
+STAMP = {"gpt_model": "stub", "emb_model": "tiny", "knn_k": 5, "findlexicon": "True", "prompt_sha256": "0"}
+
+
+def test_entry_with_changed_answer_is_missing(tmp_path):
+    bank = MistakeBank(str(tmp_path / "bank.json"), STAMP)
+    bank.add("你好", "Kapah", "cot")
+    assert bank.get("你好", "Kapah") == "cot"
+    assert bank.get("你好", "Nga'ay") is None
+    assert bank.stale({"你好": "Nga'ay", "謝謝": "Aray"}) == ["你好", "謝謝"]
+
+
+def test_bank_of_other_settings_is_discarded(tmp_path):
+    path = str(tmp_path / "bank.json")
+    bank = MistakeBank(path, STAMP)
+    bank.add("你好", "Kapah", "cot")
+    bank.save()
+    assert MistakeBank(path, STAMP).get("你好", "Kapah") == "cot"
+    assert MistakeBank(path, {**STAMP, "knn_k": 3}).get("你好", "Kapah") is None
+
+
+def test_concurrent_reads_and_writes(tmp_path):
+    path = str(tmp_path / "bank.json")
+    bank = MistakeBank(path, STAMP)
+    datastore = {f"句子{i}": f"amis {i}" for i in range(400)}
+
+    def work(i):
+        chinese = f"句子{i}"
+        bank.add(chinese, datastore[chinese], f"cot {i}")
+        # 其他執行緒寫入的同時查詢並定期存檔
+        assert bank.get(chinese, datastore[chinese]) == f"cot {i}"
+        bank.stale(datastore)
+        if i % 50 == 0:
+            bank.save()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(work, range(400)))
+    bank.save()
+    with open(path, encoding="utf-8") as f:
+        assert len(json.load(f)["entries"]) == 400
+    assert bank.stale(datastore) == []
+
+
+def test_datastore_edit_discards_the_bank(make_args):
+    args = make_args(use_mistake_bank=True, stub_llm=True)
+    translator = Ch2AmisTranslator(args, load_retriever(args).sentences_emb)
+    stamp = translator.mistake_bank.stamp
+    chinese, correct = next(iter(translator.all_ch2amis.items()))
+    translator.mistake_bank.add(chinese, correct, "old cot")
+    translator.mistake_bank.save()
+
+    with open(args.sentences_path, "r", encoding="utf-8") as f:
+        sentences = json.load(f)
+    # 只改阿美語：embedding 不變，但 COT prompt 的範例變了
+    amis = next(iter(sentences))
+    sentences[amis + "ay "] = sentences.pop(amis)
+    with open(args.sentences_path, "w", encoding="utf-8") as f:
+        json.dump(sentences, f, ensure_ascii=False, indent=4)
+    assert bank_stamp(args, translator.sentences_emb) != stamp
+
+    # 加一句：sentence store 的 fingerprint 也變了
+    sentences["Nga'ay ho "] = "你好"
+    with open(args.sentences_path, "w", encoding="utf-8") as f:
+        json.dump(sentences, f, ensure_ascii=False, indent=4)
+    translator.reload()
+    assert translator.sentences_emb.fingerprint != stamp["sentence_store"]
+    assert translator.mistake_bank.stamp == bank_stamp(args, translator.sentences_emb)
+    assert translator.mistake_bank.get(chinese, correct) is None
+    translator.close()
+    assert MistakeBank(args.mistake_bank_path, stamp).get(chinese, correct) is None
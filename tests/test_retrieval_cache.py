@@ -0,0 +1,75 @@
+import json
+import pytest
+from conftest import EXTRA_QUERIES, load_retriever
+from src.models.retrieval_cache import RetrievalCache
+
+
+def test_hit_returns_the_stored_examples():
+    cache = RetrievalCache(10)
+    key = cache.key("你好", 5, True)
+    assert cache.get(key) is None
+    cache.put(key, "examples")
+    assert cache.get(key) == "examples"
+    assert cache.get(cache.key("你好", 5, False)) is None
+    assert cache.stats() == {"hits": 1, "misses": 2, "hit_rate": 0.3333, "entries": 1, "version": 0}
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = RetrievalCache(2)
+    for sentence in ("a", "b"):
+        cache.put(cache.key(sentence, 1, True), sentence)
+    cache.get(cache.key("a", 1, True))
+    cache.put(cache.key("c", 1, True), "c")
+    assert cache.get(cache.key("b", 1, True)) is None
+    assert cache.get(cache.key("a", 1, True)) == "a"
+
+
+def test_invalidate_drops_entries_and_ignores_stale_puts():
+    cache = RetrievalCache(10)
+    stale_key = cache.key("你好", 5, True)
+    cache.put(stale_key, "old")
+    cache.invalidate()
+    assert cache.stats()["entries"] == 0 and cache.stats()["version"] == 1
+    assert cache.get(cache.key("你好", 5, True)) is None
+    # 查詢開始於 invalidate 之前：結果作廢，不寫入
+    cache.put(stale_key, "old")
+    assert cache.stats()["entries"] == 0
+    assert cache.get(cache.key("你好", 5, True)) is None
+
+
+@pytest.fixture
+def cached_retriever(make_args):
+    args = make_args(retrieval_cache_size=100)
+    return args, load_retriever(args)
+
+
+def test_cached_examples_skip_retrieval(cached_retriever, monkeypatch):
+    _, retriever = cached_retriever
+    queries = list(retriever.all_ch2amis)[:5] + EXTRA_QUERIES
+    single = retriever.find_knn_examples(queries[0], 5)
+    batch = retriever.find_knn_examples_batch(queries, 5)
+
+    def no_embedding(*args, **kwargs):
+        raise AssertionError("cache hit must not embed")
+
+    monkeypatch.setattr(retriever.embedding_model, "get_single_embedding", no_embedding)
+    monkeypatch.setattr(retriever.embedding_model, "encode", no_embedding)
+    assert retriever.find_knn_examples(queries[0], 5) == single == batch[0]
+    assert retriever.find_knn_examples_batch(queries, 5) == batch
+    assert retriever.retrieval_cache.stats()["hits"] == 1 + 1 + len(queries)
+
+
+def test_refresh_drops_stale_examples(cached_retriever):
+    args, retriever = cached_retriever
+    query = EXTRA_QUERIES[0]
+    before = retriever.find_knn_examples(query, 5)
+    with open(args.lexicon_path, "r", encoding="utf-8") as f:
+        lexicon = json.load(f)
+    lexicon = {amis: [gloss for gloss in entry if gloss not in query] for amis, entry in lexicon.items()}
+    with open(args.lexicon_path, "w", encoding="utf-8") as f:
+        json.dump({amis: entry for amis, entry in lexicon.items() if entry}, f, ensure_ascii=False)
+    retriever.refresh()
+    assert retriever.retrieval_cache.stats()["entries"] == 0
+    after = retriever.find_knn_examples(query, 5)
+    assert after != before
+    assert after == load_retriever(args).find_knn_examples(query, 5)
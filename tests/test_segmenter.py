@@ -0,0 +1,36 @@
+import os
+import json
+import pytest
+from src.models.segmenter import Segmenter
+
+jieba = pytest.importorskip("jieba")
+SENTENCE = "中興大學是一所位於台灣的優質學校"
+
+
+@pytest.fixture(scope="module")
+def built(tmp_path_factory):
+    segmenter = Segmenter(str(tmp_path_factory.mktemp("jieba")), ["優質學校"])
+    segmenter.build()
+    with open(segmenter.path, encoding="utf-8") as f:
+        return segmenter.path, f.read(), list(segmenter.initialize().cut(SENTENCE))
+
+
+def test_prebuilt_dictionary_is_plain_json(built):
+    path, content, words = built
+    assert path.endswith(".json")
+    data = json.loads(content)
+    assert data["freq"]["優質學校"] > 0
+    segmenter = Segmenter(os.path.dirname(path), ["優質學校"])
+    assert segmenter._read(jieba) is not None
+    assert list(segmenter.cut(SENTENCE)) == words
+    assert "優質學校" in words
+
+
+@pytest.mark.parametrize("content", [b"\x80\x04\x95garbage", b'{"stamp": 1}', b'{"stamp": null, "freq": [], "total": 0}', b"[]"])
+def test_unreadable_dictionary_falls_back_to_jieba(built, tmp_path, content):
+    _, _, words = built
+    segmenter = Segmenter(str(tmp_path), ["優質學校"])
+    with open(segmenter.path, "wb") as f:
+        f.write(content)
+    assert segmenter._read(jieba) is None
+    assert list(segmenter.cut(SENTENCE)) == words
@@ -0,0 +1,70 @@
+import json
+import threading
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+import pytest
+from src.server import TranslationHandler, TranslationService
+
+
+@pytest.fixture(scope="module")
+def server(make_args):
+    service = TranslationService(make_args(stub_llm=True, language_idle_seconds=0), max_batch=8, max_wait_ms=5)
+    handler = type("Handler", (TranslationHandler,), {"service": service})
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield service, httpd.server_address[1]
+    httpd.shutdown()
+    service.close()
+
+
+def _post(connection, path, body):
+    data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+    connection.request("POST", path, data, {"Content-Type": "application/json"})
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def test_unknown_path_keeps_the_connection_usable(server):
+    _, port = server
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    status, _ = _post(connection, "/nope", {"sentence": "你好嗎，老師？" * 20})
+    assert status == 404
+    # 同一條 keep-alive 連線上的下一個請求不受前一個請求內容影響
+    status, result = _post(connection, "/translate", {"sentence": "你好嗎，老師？", "mode": "RPC"})
+    assert status == 200
+    assert result["language"] == "Test" and result["translation"]
+    status, _ = _post(connection, "/translate", {"mode": "RPC"})
+    assert status == 400
+    status, _ = _post(connection, "/translate", {"sentence": "我是學生。", "mode": "COT"})
+    assert status == 200
+    connection.close()
+
+
+def test_metrics_while_requests_are_counted(server):
+    service, port = server
+    sentences = ["你是學生嗎？", "我有一隻狗。", "這是什麼？", "他在這裡。"] * 4
+
+    def translate(sentence):
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        status, _ = _post(connection, "/translate", {"sentence": sentence, "mode": "RPC"})
+        connection.close()
+        return status
+
+    def scrape(_):
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        connection.request("GET", "/metrics")
+        response = connection.getresponse()
+        text = response.read().decode("utf-8")
+        connection.close()
+        return response.status, text
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        statuses = list(executor.map(translate, sentences))
+        scrapes = list(executor.map(scrape, range(8)))
+    assert set(statuses) == {200}
+    assert all(status == 200 for status, _ in scrapes)
+    text = service.metrics()
+    assert 'ch2amis_requests_total{language="Test",mode="RPC",status="ok"}' in text
+    assert "ch2amis_in_flight_requests 0" in text
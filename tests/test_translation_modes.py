@@ -0,0 +1,65 @@
+import pytest
+from conftest import EXTRA_QUERIES
+from src.models.translation import Ch2AmisTranslator
+
+# 不在語料中，KNN 不會把它當成其他句子的錯誤範例
+SENTENCE = EXTRA_QUERIES[0]
+
+
+class CountingLLM:
+    """Numbered answers; remembers every prompt it was sent."""
+
+    def __init__(self):
+        self.prompts = []
+
+    def get_response(self, prompt):
+        self.prompts.append(prompt)
+        return f"answer {len(self.prompts)}"
+
+
+class CountingRetriever:
+    """Wraps a KNNRetriever and records the sentence of every find_knn_examples call."""
+
+    def __init__(self, knn):
+        self.knn = knn
+        self.queries = []
+
+    def find_knn_examples(self, sentence, *args, **kwargs):
+        self.queries.append(sentence)
+        return self.knn.find_knn_examples(sentence, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.knn, name)
+
+
+def _last_content(prompt):
+    return prompt[-1]["content"] if isinstance(prompt, list) else prompt
+
+
+@pytest.fixture
+def translator(make_args, retriever):
+    def make():
+        args = make_args(LFM_num=1, use_mistake_bank=False)
+        translator = Ch2AmisTranslator(args, retriever.sentences_emb, llm=CountingLLM())
+        translator.knn = CountingRetriever(retriever)
+        # 不抽 in-context 範例，呼叫次數只取決於模式本身
+        translator.LFM_in_context_examples = []
+        return translator
+    return make
+
+
+def test_all_retrieves_once_and_reuses_cot_for_lfm(translator):
+    combined = translator()
+    results = combined.translate(SENTENCE, "ALL")
+    assert combined.knn.queries.count(SENTENCE) == 1
+    # 目標句只送出一次 COT prompt，LFM 的初始翻譯就是那個答案
+    own = [_last_content(prompt) for prompt in combined.llm.prompts if SENTENCE in _last_content(prompt)]
+    assert len(own) == 3
+    assert results["COT"] in own[-1]
+
+    separate = translator()
+    for mode in ("RPC", "COT", "LFM"):
+        separate.translate(SENTENCE, mode)
+    assert separate.knn.queries.count(SENTENCE) == 3
+    assert len(combined.llm.prompts) < len(separate.llm.prompts)
+    assert len(combined.knn.queries) < len(separate.knn.queries)